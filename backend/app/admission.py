@@ -0,0 +1,225 @@
+"""
+KeyAuth - Admission Control
+Bounded, prioritized concurrency for request handlers, so enrollment
+training and dashboard reads cannot crowd out logins.
+
+Every request of a work class (authenticate, enroll, read) takes a slot
+before its handler runs. A class has its own concurrency cap, and all
+classes share ADMISSION_TOTAL_SLOTS; when a slot frees up, waiting requests
+are admitted in priority order (authenticate first), FIFO within a class.
+Waiting happens on the event loop, so queued requests hold no worker
+thread. A request is shed with 503 and Retry-After when its class queue is
+full or it has waited past the class deadline.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+from fastapi import HTTPException, status
+from app.config import settings
+
+
+@dataclass
+class WorkClass:
+    """Limits for one class of requests; lower priority values are admitted first."""
+
+    name: str
+    priority: int
+    concurrency: int
+    max_wait_s: float
+    max_queue: int
+
+
+class _ClassState:
+    def __init__(self, work_class: WorkClass):
+        self.work_class = work_class
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+        self.waits_ms: Deque[float] = deque(maxlen=1024)  # Recent queue waits, for percentiles
+        self.service_ms = 0.0  # Exponentially weighted handler time, for Retry-After
+
+
+class _Waiter:
+    __slots__ = ("name", "future", "granted", "abandoned")
+
+    def __init__(self, name: str, future: asyncio.Future):
+        self.name = name
+        self.future = future
+        self.granted = False
+        self.abandoned = False
+
+
+class AdmissionController:
+    """Shared slot pool with per-class caps, a priority wait queue and metrics."""
+
+    def __init__(self, total_slots: int, classes: List[WorkClass], enabled: bool = True):
+        self.enabled = enabled
+        self.total_slots = total_slots
+        self._classes: Dict[str, _ClassState] = {c.name: _ClassState(c) for c in classes}
+        self._active = 0
+        self._lock = threading.Lock()
+        self._waiters: List = []  # Heap of (priority, seq, _Waiter)
+        self._seq = itertools.count()
+
+    def _grant(self, state: _ClassState):
+        self._active += 1
+        state.active += 1
+        state.admitted += 1
+
+    def _dispatch(self):
+        """Hand free slots to the highest-priority waiters whose class has room (lock held)."""
+        skipped = []
+        while self._waiters and self._active < self.total_slots:
+            entry = heapq.heappop(self._waiters)
+            waiter = entry[2]
+            if waiter.abandoned:
+                continue
+            state = self._classes[waiter.name]
+            if state.active >= state.work_class.concurrency:
+                skipped.append(entry)
+                continue
+            self._grant(state)
+            state.queued -= 1
+            waiter.granted = True
+            waiter.future.get_loop().call_soon_threadsafe(_resolve, waiter.future)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+    def _retry_after(self, state: _ClassState) -> int:
+        """Seconds until the current queue for this class is likely to have drained."""
+        per_slot = state.queued / max(state.work_class.concurrency, 1)
+        estimate = (per_slot + 1) * state.service_ms / 1000.0
+        return max(1, math.ceil(min(estimate, 60.0)))
+
+    def _shed(self, state: _ClassState, reason: str):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server busy ({state.work_class.name} {reason}). Please retry shortly.",
+            headers={"Retry-After": str(self._retry_after(state))},
+        )
+
+    async def acquire(self, name: str) -> float:
+        """Wait for a slot of class ``name``; returns the wait in ms. Raises 503 when shed."""
+        state = self._classes[name]
+        start = time.perf_counter()
+        with self._lock:
+            if state.queued >= state.work_class.max_queue:
+                state.shed_queue_full += 1
+                self._shed(state, "queue full")
+            waiter = _Waiter(name, asyncio.get_running_loop().create_future())
+            heapq.heappush(self._waiters, (state.work_class.priority, next(self._seq), waiter))
+            state.queued += 1
+            self._dispatch()
+            if waiter.granted:
+                state.waits_ms.append(0.0)
+                return 0.0
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=state.work_class.max_wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    waiter.abandoned = True  # _dispatch drops it
+                    state.queued -= 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        state.shed_deadline += 1
+            if isinstance(e, asyncio.CancelledError):
+                if granted:
+                    self.release(name)
+                raise
+            if not granted:
+                self._shed(state, "queue wait exceeded")
+            # Otherwise the slot was granted just as the deadline passed: keep it
+        wait_ms = (time.perf_counter() - start) * 1e3
+        state.waits_ms.append(wait_ms)
+        return wait_ms
+
+    def release(self, name: str, service_ms: Optional[float] = None):
+        state = self._classes[name]
+        with self._lock:
+            self._active -= 1
+            state.active -= 1
+            if service_ms is not None:
+                state.service_ms = service_ms if state.service_ms == 0 else 0.8 * state.service_ms + 0.2 * service_ms
+            self._dispatch()
+
+    @asynccontextmanager
+    async def hold(self, name: str):
+        """Hold a slot of class ``name`` for an ``async with`` block (e.g. one step of a WebSocket)."""
+        if not self.enabled:
+            yield
+            return
+        await self.acquire(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(name, (time.perf_counter() - start) * 1e3)
+
+    def slot(self, name: str):
+        """FastAPI dependency holding a slot of class ``name`` for the request's lifetime."""
+        async def _admission_slot():
+            async with self.hold(name):
+                yield
+        return _admission_slot
+
+    def metrics(self) -> Dict:
+        """Queue depth, in-flight requests, shed counts and wait percentiles per class."""
+        with self._lock:
+            classes = {}
+            for name, state in self._classes.items():
+                waits = sorted(state.waits_ms)
+                classes[name] = {
+                    "priority": state.work_class.priority,
+                    "concurrency": state.work_class.concurrency,
+                    "active": state.active,
+                    "queued": state.queued,
+                    "admitted": state.admitted,
+                    "shed_queue_full": state.shed_queue_full,
+                    "shed_deadline": state.shed_deadline,
+                    "wait_ms_p50": round(_percentile(waits, 0.5), 2),
+                    "wait_ms_p99": round(_percentile(waits, 0.99), 2),
+                    "service_ms_avg": round(state.service_ms, 2),
+                }
+            return {
+                "enabled": self.enabled,
+                "total_slots": self.total_slots,
+                "active": self._active,
+                "classes": classes,
+            }
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# Global instance
+admission = AdmissionController(
+    enabled=settings.ADMISSION_ENABLED,
+    total_slots=settings.ADMISSION_TOTAL_SLOTS,
+    classes=[
+        WorkClass("authenticate", 0, settings.ADMISSION_AUTH_CONCURRENCY,
+                  settings.ADMISSION_AUTH_MAX_WAIT_MS / 1000, settings.ADMISSION_QUEUE_LIMIT),
+        WorkClass("enroll", 1, settings.ADMISSION_ENROLL_CONCURRENCY,
+                  settings.ADMISSION_ENROLL_MAX_WAIT_MS / 1000, settings.ADMISSION_QUEUE_LIMIT),
+        WorkClass("read", 2, settings.ADMISSION_READ_CONCURRENCY,
+                  settings.ADMISSION_READ_MAX_WAIT_MS / 1000, settings.ADMISSION_QUEUE_LIMIT),
+    ],
+)
@@ -2,17 +2,20 @@
 KeyAuth - JWT Authentication Utilities
 Token creation, verification, and middleware
 """
+import hmac
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.database import get_db
 from app.models import User
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+admin_key_header = APIKeyHeader(name="X-Admin-Key", auto_error=False)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -82,3 +85,22 @@ def get_current_user(
             detail="User not found",
         )
     return user
+
+
+def require_admin(admin_key: Optional[str] = Depends(admin_key_header)):
+    """
+    Dependency: allow the request only with the ADMIN_API_KEY in X-Admin-Key.
+
+    Raises:
+        HTTPException: 403 if the admin API is disabled or the key is wrong
+    """
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin API is disabled (set ADMIN_API_KEY)",
+        )
+    if admin_key is None or not hmac.compare_digest(admin_key.encode(), settings.ADMIN_API_KEY.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin key",
+        )
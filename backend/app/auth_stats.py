@@ -0,0 +1,134 @@
+"""
+KeyAuth - Rolling Authentication Statistics
+Login rate, accept/reject counts, mean confidence and the scoring-method
+split over recent time, kept in memory so the dashboard never has to
+aggregate auth_logs.
+
+Every decided attempt adds to two rings of time buckets: one per second
+covering the last AUTH_STATS_SECONDS, and one per minute covering the last
+AUTH_STATS_MINUTES. A slot is reused when its bucket has gone out of the
+ring, so recording is O(1) and memory is fixed. The counters belong to the
+worker process; with several workers each reports its own share.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from app.config import settings
+from app.memory import deep_sizeof
+
+
+class _Ring:
+    """``slots`` buckets of ``width`` seconds; slot i holds bucket number ``bucket[i]``."""
+
+    def __init__(self, slots: int, width: int):
+        self.slots = slots
+        self.width = width
+        self._bucket = [-1] * slots
+        self._attempts = [0] * slots
+        self._accepted = [0] * slots
+        self._confidence = [0.0] * slots
+        self._methods: List[Dict[str, int]] = [{} for _ in range(slots)]
+
+    def add(self, now: float, accepted: bool, confidence: float, method: str):
+        bucket = int(now // self.width)
+        i = bucket % self.slots
+        if self._bucket[i] != bucket:  # Slot still holds a bucket from one ring length ago
+            self._bucket[i] = bucket
+            self._attempts[i] = self._accepted[i] = 0
+            self._confidence[i] = 0.0
+            self._methods[i] = {}
+        self._attempts[i] += 1
+        self._accepted[i] += accepted
+        self._confidence[i] += confidence
+        self._methods[i][method] = self._methods[i].get(method, 0) + 1
+
+    def series(self, now: float, count: int) -> List[tuple]:
+        """
+        (start, attempts, accepted, confidence sum, methods) of the last
+        ``count`` buckets up to and including the current one, oldest first.
+        """
+        last = int(now // self.width)
+        buckets = []
+        for bucket in range(last - min(count, self.slots) + 1, last + 1):
+            i = bucket % self.slots
+            if self._bucket[i] == bucket:
+                buckets.append((bucket * self.width, self._attempts[i], self._accepted[i],
+                                self._confidence[i], dict(self._methods[i])))
+            else:
+                buckets.append((bucket * self.width, 0, 0, 0.0, {}))
+        return buckets
+
+
+def _summary(start: float, attempts: int, accepted: int, confidence: float, methods: Dict[str, int]) -> Dict:
+    return {
+        "start": start,
+        "attempts": attempts,
+        "accepted": accepted,
+        "rejected": attempts - accepted,
+        "accept_rate": round(accepted / attempts, 4) if attempts else None,
+        "mean_confidence": round(confidence / attempts, 4) if attempts else None,
+        "methods": methods,
+    }
+
+
+class AuthStats:
+    """Per-second and per-minute rings of decided authentication attempts."""
+
+    RESOLUTIONS = ("second", "minute")
+
+    def __init__(self, seconds: int = 3600, minutes: int = 1440):
+        self._rings = {"second": _Ring(max(1, seconds), 1), "minute": _Ring(max(1, minutes), 60)}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def record(self, accepted: bool, confidence: float, method: str, now: Optional[float] = None):
+        """Count one decided attempt."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for ring in self._rings.values():
+                ring.add(now, accepted, confidence, method)
+
+    def report(self, resolution: str = "minute", last: Optional[int] = None, now: Optional[float] = None) -> Dict:
+        """
+        The last ``last`` buckets at ``resolution`` (default: the whole ring)
+        and their totals; the current bucket is still filling.
+
+        Raises:
+            ValueError: unknown resolution
+        """
+        if resolution not in self._rings:
+            raise ValueError(f"resolution must be one of {', '.join(self.RESOLUTIONS)}")
+        ring = self._rings[resolution]
+        now = time.time() if now is None else now
+        with self._lock:
+            buckets = ring.series(now, last or ring.slots)
+        methods: Dict[str, int] = {}
+        for bucket in buckets:
+            for method, count in bucket[4].items():
+                methods[method] = methods.get(method, 0) + count
+        since = max(buckets[0][0], self.started_at)
+        totals = _summary(
+            since, sum(b[1] for b in buckets), sum(b[2] for b in buckets), sum(b[3] for b in buckets), methods,
+        )
+        totals["per_minute"] = round(totals["attempts"] * 60 / max(now - since, ring.width), 2)
+        return {
+            "pid": os.getpid(),
+            "resolution": resolution,
+            "bucket_seconds": ring.width,
+            "totals": totals,
+            "buckets": [_summary(*bucket) for bucket in buckets],
+        }
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            rings = list(self._rings.values())
+            return {
+                "entries": sum(ring.slots for ring in rings),
+                "bytes": sum(deep_sizeof(vars(ring)) for ring in rings),
+                "cap": sum(ring.slots for ring in rings),
+                "evictions": 0,
+            }
+
+
+auth_stats = AuthStats(settings.AUTH_STATS_SECONDS, settings.AUTH_STATS_MINUTES)
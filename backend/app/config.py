@@ -16,15 +16,125 @@ class Settings(BaseSettings):
 
     # Database — set via .env or Vercel env vars (falls back to SQLite for quick local dev)
     DATABASE_URL: str = "sqlite:///./keystroke_auth.db"
+    # Hash-shard users across this many databases: {shard} in DATABASE_URL is
+    # the shard number, or SQLite shards 1.. are <name>.shardN.db next to it
+    DATABASE_SHARDS: int = 1
+
+    # SQLite production mode — WAL journal, tuned pragmas, one writer thread
+    # with group commit and a pool of read-only connections for queries
+    SQLITE_PRODUCTION_MODE: bool = False
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MB
+    SQLITE_READ_POOL_SIZE: int = 8
+    SQLITE_WRITE_BATCH_MAX: int = 64
 
     # JWT
     SECRET_KEY: str = "keyauth-dev-secret-key"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    # Key for the /api/admin endpoints (sent as X-Admin-Key); empty = admin API disabled
+    ADMIN_API_KEY: str = ""
 
     # ML Model
     ENROLLMENT_SAMPLES_REQUIRED: int = 5
     AUTH_CONFIDENCE_THRESHOLD: float = 0.85
+    # Scorer fitted at enrollment unless the profile names one:
+    # isolation_forest, statistical, scaled_manhattan, mahalanobis
+    AUTH_SCORER: str = "isolation_forest"
+    # Size each Isolation Forest to the scoring latency budget: the smallest
+    # forest whose held-out AUC is within IF_SIZING_TOLERANCE of the 100-tree model.
+    # Costs seconds of forest fits (and timed scorings) per trained profile, inside
+    # the enrolling request, each bulk-enroll user and the re-extraction job
+    IF_SIZING_ENABLED: bool = False
+    IF_LATENCY_BUDGET_MS: float = 5.0
+    IF_SIZING_TOLERANCE: float = 0.02
+
+    # Hashed per-digraph latency features (optional, blended into the score);
+    # profiles enrolled under another DIGRAPH_HASH_BUCKETS skip the blend until re-enrolled
+    DIGRAPH_FEATURES_ENABLED: bool = False
+    DIGRAPH_HASH_BUCKETS: int = 512
+    DIGRAPH_WEIGHT: float = 0.3
+
+    # 1:N identification — index refresh interval and re-rank pool size
+    PROFILE_INDEX_TTL_SECONDS: int = 300
+    IDENTIFY_CANDIDATES: int = 20
+
+    # Memory-mapped model snapshot (python -m app.jobs.export_snapshot); empty = disabled
+    MODEL_SNAPSHOT_PATH: str = ""
+
+    # Continuous session scoring (sliding window of SESSION_PANES panes)
+    SESSION_RESCORE_EVERY: int = 25
+    SESSION_PANE_SIZE: int = 50
+    SESSION_PANES: int = 4
+    SESSION_TRUST_SMOOTHING: float = 0.3
+    # Close a session stream with no key event for this long (a user may pause typing)
+    SESSION_IDLE_TIMEOUT_SECONDS: float = 300.0
+
+    # WebSocket login (/ws/authenticate, and the /ws/session start message): close a
+    # stream that sends nothing for this long
+    STREAM_IDLE_TIMEOUT_SECONDS: float = 30.0
+
+    # Admission control — concurrent requests per work class, sharing
+    # ADMISSION_TOTAL_SLOTS (authenticate is admitted first); requests are shed
+    # with 503 + Retry-After when a class queue is full or waits past its deadline
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_TOTAL_SLOTS: int = 16
+    ADMISSION_AUTH_CONCURRENCY: int = 16
+    ADMISSION_ENROLL_CONCURRENCY: int = 2
+    ADMISSION_READ_CONCURRENCY: int = 6
+    ADMISSION_QUEUE_LIMIT: int = 64
+    ADMISSION_AUTH_MAX_WAIT_MS: int = 2000
+    ADMISSION_ENROLL_MAX_WAIT_MS: int = 10000
+    ADMISSION_READ_MAX_WAIT_MS: int = 5000
+
+    # Retention — python -m app.jobs.compact_auth_logs rolls auth logs older than
+    # AUTH_LOG_RETENTION_DAYS into per-user daily totals (0 = keep raw logs forever)
+    AUTH_LOG_RETENTION_DAYS: int = 90
+    AUTH_LOG_COMPACTION_BATCH: int = 500
+    # Drop enrollment samples' raw key events once their device's model is trained
+    TRIM_ENROLLMENT_KEYSTROKES: bool = False
+
+    # Bulk enrollment (POST /api/admin/bulk-enroll): users per JSON request,
+    # users handled per batch, and training threads (0 = one per CPU)
+    BULK_ENROLL_MAX_USERS: int = 1000
+    BULK_ENROLL_BATCH: int = 100
+    BULK_ENROLL_WORKERS: int = 0
+
+    # ETags / 304 on profile, auth-history and enrollment-status, and an
+    # in-process LRU of serialized responses per (user, URL)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_SIZE: int = 1024
+
+    # Shadow scoring — comma-separated scorers evaluated on live logins by
+    # background workers without affecting decisions (empty = disabled);
+    # attempts arriving while SHADOW_QUEUE_SIZE are waiting are dropped
+    SHADOW_CANDIDATES: str = ""
+    SHADOW_QUEUE_SIZE: int = 1024
+    SHADOW_WORKERS: int = 1
+    SHADOW_STORE_DIR: str = "./shadow_scores"
+    SHADOW_FLUSH_EVERY: int = 1000
+    SHADOW_FLUSH_SECONDS: int = 60
+    SHADOW_MODEL_CACHE_SIZE: int = 256
+
+    # Memory accounting (GET /api/admin/memory) — caps on in-process
+    # structures (0 = unbounded; past a cap the oldest entry is evicted and
+    # counted), a periodic log line every MEMORY_LOG_INTERVAL_SECONDS (0 = off),
+    # and frames kept per allocation while tracemalloc snapshots are taken
+    ANTI_REPLAY_MAX_ENTRIES: int = 100_000
+    RATE_LIMITER_MAX_USERS: int = 100_000
+    MEMORY_LOG_INTERVAL_SECONDS: int = 0
+    MEMORY_TRACEMALLOC_FRAMES: int = 1
+
+    # Rolling auth statistics (GET /api/admin/auth-stats) — in-memory
+    # per-second buckets for the last AUTH_STATS_SECONDS and per-minute
+    # buckets for the last AUTH_STATS_MINUTES
+    AUTH_STATS_SECONDS: int = 3600
+    AUTH_STATS_MINUTES: int = 1440
+
+    # Per-request SQL accounting (/metrics/queries; X-DB-Queries headers in DEBUG);
+    # requests running more than QUERY_BUDGET statements are logged (0 = no budget)
+    QUERY_STATS_ENABLED: bool = True
+    QUERY_BUDGET: int = 20
 
     # CORS — allow all on Vercel (same domain), restrict locally
     CORS_ORIGINS: str = (
@@ -2,17 +2,27 @@
 KeyAuth - Database connection module
 SQLAlchemy engine, session, and base — supports PostgreSQL (Supabase) and SQLite
 """
-from sqlalchemy import create_engine
+import threading
+from typing import Optional
+from sqlalchemy import UniqueConstraint, create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import AddConstraint
 from app.config import settings
+from app.memory import track_session
+from app.query_stats import instrument_engine
+from app.sharding import ShardSet, shard_url
+from app.sqlite_writer import SQLiteWriter
 
 # Build engine kwargs based on database type
 db_url = settings.DATABASE_URL
 connect_args = {}
 engine_kwargs = {"echo": False}
 
-if db_url.startswith("sqlite"):
+IS_SQLITE = db_url.startswith("sqlite")
+SQLITE_PRODUCTION = IS_SQLITE and settings.SQLITE_PRODUCTION_MODE
+
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 else:
     # Force pg8000 driver for ALL PostgreSQL URLs (pure Python — no pg_config needed)
@@ -37,17 +47,123 @@ else:
     })
 
 
-engine = create_engine(
-    db_url,
-    connect_args=connect_args,
-    **engine_kwargs,
-)
+def configure_sqlite_engine(engine, read_only: bool = False):
+    """
+    Apply production pragmas to every new SQLite connection of ``engine``.
+
+    Writer connections also take over transaction control from pysqlite and
+    open with ``BEGIN IMMEDIATE`` so SAVEPOINTs behave and the write lock is
+    taken up front instead of on the first statement.
+    """
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def create_engines(url: str):
+    """Writer and read engine for one database (the same engine unless in SQLite production mode)."""
+    if SQLITE_PRODUCTION:
+        # One connection owned by the writer thread, a pool of query-only readers
+        writer_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=1,
+            max_overflow=0,
+            **engine_kwargs,
+        )
+        reader_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=settings.SQLITE_READ_POOL_SIZE,
+            max_overflow=0,
+            **engine_kwargs,
+        )
+        configure_sqlite_engine(writer_engine)
+        configure_sqlite_engine(reader_engine, read_only=True)
+    else:
+        writer_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            **engine_kwargs,
+        )
+        reader_engine = writer_engine
+    instrument_engine(writer_engine)
+    instrument_engine(reader_engine)
+    return writer_engine, reader_engine
+
+
+# Hash-sharded storage (app/sharding.py): one engine pair per shard database
+SHARD_COUNT = max(1, settings.DATABASE_SHARDS)
+SHARDED = SHARD_COUNT > 1
+_shard_engines = [create_engines(shard_url(db_url, i)) for i in range(SHARD_COUNT)]
+engines = [pair[0] for pair in _shard_engines]
+read_engines = [pair[1] for pair in _shard_engines]
+engine, read_engine = _shard_engines[0]
+
+if SHARDED:
+    shards = ShardSet(engines, read_engines)
+    SessionLocal = shards.session_factory
+else:
+    shards = None
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
 _db_initialized = False
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(shard: int = 0):
+    """Return the process-wide SQLite writer of a shard (production mode only)."""
+    if not SQLITE_PRODUCTION:
+        return None
+    with _writers_lock:
+        if shard not in _writers:
+            _writers[shard] = SQLiteWriter(
+                sessionmaker(autoflush=False, expire_on_commit=False, bind=engines[shard]),
+                max_batch=settings.SQLITE_WRITE_BATCH_MAX,
+            )
+        return _writers[shard]
+
+
+def run_write(db, work, username: Optional[str] = None):
+    """
+    Run ``work(session)`` as a committed write transaction.
+
+    In SQLite production mode the work is handed to the single writer thread
+    and batched with concurrent writes; otherwise it runs on the request
+    session ``db`` and is committed immediately. ``work`` should look rows up
+    by id rather than reuse ORM objects from ``db``, and return plain values.
+    With sharding, ``username`` names the user whose shard is written to.
+    """
+    shard = 0
+    if SHARDED and SQLITE_PRODUCTION:
+        if username is None:
+            raise ValueError("run_write needs the username to pick a shard")
+        shard = shards.shard_for(username)
+    writer = get_writer(shard)
+    if writer is not None:
+        return writer.execute(work)
+    try:
+        result = work(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
 
 
 def get_db():
@@ -57,14 +173,144 @@ def get_db():
     if not _db_initialized:
         init_db()
     db = SessionLocal()
+    track_session(db)
     try:
         yield db
     finally:
         db.close()
 
 
+def scan_shards(db, work):
+    """
+    Run ``work(session)`` once per shard, in parallel, and return the results
+    in shard order. Unsharded, this is ``[work(db)]``.
+    """
+    if not SHARDED:
+        return [work(db)]
+    return shards.scan(work)
+
+
 def init_db():
-    """Create all tables (idempotent)."""
+    """Create all tables on every shard (idempotent)."""
     global _db_initialized
-    Base.metadata.create_all(bind=engine)
+    for shard_engine in engines:
+        Base.metadata.create_all(bind=shard_engine)
+        _add_missing_columns(shard_engine)
+        _rebuild_changed_tables(shard_engine)
+        _add_missing_indexes(shard_engine)
+        _backfill_profile_devices(shard_engine)
     _db_initialized = True
+
+
+def _add_missing_columns(engine):
+    """
+    Add nullable columns introduced after a table was first created.
+
+    create_all() never alters existing tables, so databases created by an
+    older version would otherwise fail on the new columns.
+    """
+    # Inspect first: the production writer pool has a single connection
+    inspector = inspect(engine)
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            statements.append(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+    if statements:
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+
+
+def _add_missing_indexes(engine):
+    """Create indexes added to the models after their table was first created."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _unique_sets(table):
+    """Column-name sets of the model's unique constraints (column-level ones included)."""
+    sets = {frozenset(c.columns.keys()) for c in table.constraints if isinstance(c, UniqueConstraint)}
+    sets |= {frozenset([column.name]) for column in table.columns if column.unique}
+    return sets
+
+
+def _rebuild_changed_tables(engine):
+    """
+    Bring constraints of existing tables in line with the models: drop NOT
+    NULL from columns that have since become nullable, and replace unique
+    constraints that were dropped or widened (e.g. keystroke_profiles.user_id
+    once profiles became per device).
+
+    PostgreSQL alters the table in place; SQLite cannot, so the table is
+    rebuilt from the current model definition and its rows copied over.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        stored = {column["name"]: column for column in inspector.get_columns(table.name)}
+        relaxed = [
+            column.name for column in table.columns
+            if column.nullable and not column.primary_key
+            and column.name in stored and not stored[column.name]["nullable"]
+        ]
+        stored_uniques = {
+            frozenset(c["column_names"]): c["name"] for c in inspector.get_unique_constraints(table.name)
+        }
+        model_uniques = _unique_sets(table)
+        dropped = [name for columns, name in stored_uniques.items() if columns not in model_uniques]
+        if not relaxed and not dropped:
+            continue
+        indexes = [index["name"] for index in inspector.get_indexes(table.name)]
+        with engine.begin() as conn:
+            if not IS_SQLITE:
+                for name in relaxed:
+                    conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {name} DROP NOT NULL"))
+                for name in dropped:
+                    conn.execute(text(f"ALTER TABLE {table.name} DROP CONSTRAINT {name}"))
+                for constraint in table.constraints:
+                    if isinstance(constraint, UniqueConstraint) and frozenset(constraint.columns.keys()) not in stored_uniques:
+                        conn.execute(AddConstraint(constraint))
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+                continue
+            old_name = f"_{table.name}_old"
+            for name in indexes:
+                conn.execute(text(f"DROP INDEX {name}"))
+            # Keep other tables' foreign keys pointing at the name, not the renamed table
+            conn.execute(text("PRAGMA legacy_alter_table = ON"))
+            conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {old_name}"))
+            conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+            table.create(conn)
+            columns = ", ".join(column.name for column in table.columns if column.name in stored)
+            conn.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old_name}"))
+            conn.execute(text(f"DROP TABLE {old_name}"))
+
+
+def _backfill_profile_devices(engine):
+    """
+    Assign profiles stored before per-device profiles to their user's device
+    class. They keep feature_schema NULL: their vectors use the full layout.
+    """
+    from app.ml.feature_schema import device_class
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT p.id, u.device_type FROM keystroke_profiles p "
+            "JOIN users u ON u.id = p.user_id WHERE p.device_type IS NULL"
+        )).all()
+    if not rows:
+        return
+    with engine.begin() as conn:
+        for profile_id, device_type in rows:
+            conn.execute(
+                text("UPDATE keystroke_profiles SET device_type = :device WHERE id = :id"),
+                {"device": device_class(device_type), "id": profile_id},
+            )
@@ -0,0 +1 @@
+"""KeyAuth Offline Jobs"""
@@ -0,0 +1,323 @@
+"""
+KeyAuth - Bulk Export / Import
+Streams users, keystroke profiles, enrollment samples and (optionally) auth
+logs between databases through a chunked columnar archive.
+
+An archive is a directory with a ``manifest.json`` and one compressed NPZ
+file per chunk of up to ``--chunk`` rows of one table. Each column is stored
+as a NumPy array: numbers, booleans and timestamps as fixed-width arrays,
+short strings as a unicode array, and text, binary and JSON columns as one
+byte buffer plus row offsets; nullable columns get a ``.null`` mask. Export
+reads every shard through a streaming (server-side) cursor in primary-key
+order, so memory stays at one chunk; import inserts each chunk with one
+executemany in its own transaction, routing rows to their shard.
+
+Both directions are resumable. Export records each finished chunk in the
+manifest (written atomically) with the last key it holds and continues
+after it; import records finished chunks in ``import-state.json`` and
+replaces any rows of a chunk it is re-running.
+
+Usage (from the backend directory):
+    python -m app.jobs.archive export ./archive [--auth-logs] [--chunk 5000]
+    python -m app.jobs.archive import ./archive
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, JSON, LargeBinary, String, Text, Table, select
+from sqlalchemy.engine import Engine
+from app.config import settings
+from app.database import Base, SHARDED, engines, init_db, read_engines, shards
+from app.sharding import USER_KEY, USERS_TABLE
+import app.models  # noqa: F401  (registers the tables on Base.metadata)
+
+FORMAT = "keyauth-archive/1"
+CORE_TABLES = ("users", "keystroke_profiles", "enrollment_samples")
+LOG_TABLES = ("auth_logs", "auth_log_daily")
+MANIFEST = "manifest.json"
+IMPORT_STATE = "import-state.json"
+_EPOCH = datetime(1970, 1, 1)
+
+
+# ── Column encoding ─────────────────────────────────────────────
+
+def column_kind(column) -> str:
+    """How a column is stored in a chunk."""
+    kind = column.type
+    if isinstance(kind, LargeBinary):
+        return "bytes"
+    if isinstance(kind, JSON):
+        return "json"
+    if isinstance(kind, Text):
+        return "text"
+    if isinstance(kind, String):
+        return "str"
+    if isinstance(kind, Boolean):
+        return "bool"
+    if isinstance(kind, Integer):
+        return "int"
+    if isinstance(kind, Float):
+        return "float"
+    if isinstance(kind, DateTime):
+        return "datetime"
+    if isinstance(kind, Date):
+        return "date"
+    raise ValueError(f"No archive encoding for column {column} ({kind})")
+
+
+def _to_bytes(kind: str, value) -> bytes:
+    if kind == "bytes":
+        return bytes(value)
+    if kind == "json":
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
+    return value.encode("utf-8")
+
+
+def _microseconds(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)  # Stored timestamps are naive UTC
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def encode_column(name: str, kind: str, values: List) -> Dict[str, np.ndarray]:
+    null = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    arrays = {f"{name}.null": null}
+    if kind in ("bytes", "json", "text"):
+        parts = [b"" if v is None else _to_bytes(kind, v) for v in values]
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in parts], out=offsets[1:])
+        arrays[f"{name}.data"] = np.frombuffer(b"".join(parts), dtype=np.uint8)
+        arrays[f"{name}.offsets"] = offsets
+    elif kind == "str":
+        arrays[name] = np.array(["" if v is None else v for v in values], dtype=str)
+    elif kind == "datetime":
+        arrays[name] = np.array([0 if v is None else _microseconds(v) for v in values], dtype=np.int64)
+    elif kind == "date":
+        arrays[name] = np.array([0 if v is None else (v - _EPOCH.date()).days for v in values], dtype=np.int32)
+    else:
+        dtype = {"int": np.int64, "float": np.float64, "bool": bool}[kind]
+        arrays[name] = np.array([0 if v is None else v for v in values], dtype=dtype)
+    return arrays
+
+
+def decode_column(npz, name: str, kind: str) -> List:
+    null = npz[f"{name}.null"]
+    if kind in ("bytes", "json", "text"):
+        data, offsets = npz[f"{name}.data"].tobytes(), npz[f"{name}.offsets"]
+        raw = [data[offsets[i]:offsets[i + 1]] for i in range(len(null))]
+        if kind == "json":
+            values = [json.loads(b) if b else None for b in raw]
+        elif kind == "text":
+            values = [b.decode("utf-8") for b in raw]
+        else:
+            values = raw
+    elif kind == "datetime":
+        values = [_EPOCH + timedelta(microseconds=int(v)) for v in npz[name]]
+    elif kind == "date":
+        values = [_EPOCH.date() + timedelta(days=int(v)) for v in npz[name]]
+    else:
+        values = npz[name].tolist()
+    return [None if is_null else value for value, is_null in zip(values, null)]
+
+
+# ── Manifest ────────────────────────────────────────────────────
+
+def _write_json(path: str, data: Dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1, default=str)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ── Export ──────────────────────────────────────────────────────
+
+def _stream_chunks(engine: Engine, table: Table, chunk: int, after: Optional[str]) -> Iterator[List]:
+    """Rows of ``table`` in primary-key order after ``after``, ``chunk`` at a time, via a streaming cursor."""
+    key = table.primary_key.columns.values()[0]
+    query = select(table).order_by(key)
+    if after is not None:
+        query = query.where(key > after)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk).execute(query)
+        for rows in result.partitions(chunk):
+            yield rows
+
+
+def export_archive(path: str, tables=CORE_TABLES, chunk: int = 5000, log=print) -> Dict:
+    """Write (or finish writing) an archive of ``tables`` from every shard at ``path``."""
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST)
+    manifest = _read_json(manifest_path) or {
+        "format": FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "app_version": settings.APP_VERSION,
+        "tables": {},
+    }
+    if manifest.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a {FORMAT} archive")
+
+    totals = {}
+    for name in tables:
+        table = Base.metadata.tables[name]
+        columns = {column.name: column_kind(column) for column in table.columns}
+        entry = manifest["tables"].setdefault(name, {"columns": columns, "chunks": [], "done_shards": []})
+        if entry["columns"] != columns:
+            raise ValueError(f"Columns of {name} changed since this archive was started; export to a new directory")
+
+        start, rows_written = time.perf_counter(), 0
+        for shard, engine in enumerate(read_engines):
+            if shard in entry["done_shards"]:
+                continue
+            done = [c for c in entry["chunks"] if c["shard"] == shard]
+            after = done[-1]["last_key"] if done else None
+            for rows in _stream_chunks(engine, table, chunk, after):
+                arrays = {}
+                for column, kind in columns.items():
+                    arrays.update(encode_column(column, kind, [row._mapping[column] for row in rows]))
+                file_name = f"{name}-{shard:03d}-{len(done):06d}.npz"
+                file_path = os.path.join(path, file_name)
+                with open(file_path + ".tmp", "wb") as f:
+                    np.savez_compressed(f, **arrays)
+                os.replace(file_path + ".tmp", file_path)
+                record = {
+                    "file": file_name,
+                    "shard": shard,
+                    "rows": len(rows),
+                    "last_key": rows[-1]._mapping[table.primary_key.columns.values()[0].name],
+                    "sha256": _sha256(file_path),
+                }
+                entry["chunks"].append(record)
+                done.append(record)
+                _write_json(manifest_path, manifest)  # The chunk is only kept once it is in the manifest
+                rows_written += len(rows)
+            entry["done_shards"].append(shard)
+            _write_json(manifest_path, manifest)
+
+        elapsed = time.perf_counter() - start
+        totals[name] = rows_written
+        log(f"{name:<20} {rows_written:>9,} rows in {elapsed:6.1f}s ({rows_written / max(elapsed, 1e-9):,.0f} rows/s)")
+    return totals
+
+
+# ── Import ──────────────────────────────────────────────────────
+
+def _user_shard_map() -> Dict[str, int]:
+    """user id → shard of the users already in the target (sharded targets only)."""
+    users = Base.metadata.tables[USERS_TABLE]
+    mapping = {}
+    for shard, engine in enumerate(engines):
+        with engine.connect() as conn:
+            for user_id, username in conn.execute(select(users.c.id, users.c.username)):
+                mapping[user_id] = shards.shard_for(username)
+    return mapping
+
+
+def _insert_chunk(engine: Engine, table: Table, rows: List[Dict]):
+    """Insert one chunk with executemany, replacing rows a previous attempt left behind."""
+    key = table.primary_key.columns.values()[0]
+    with engine.begin() as conn:
+        conn.execute(table.delete().where(key.in_([row[key.name] for row in rows])))
+        conn.execute(table.insert(), rows)
+
+
+def import_archive(path: str, log=print) -> Dict:
+    """Load (or finish loading) the archive at ``path`` into the configured database."""
+    manifest = _read_json(os.path.join(path, MANIFEST))
+    if manifest is None or manifest.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a {FORMAT} archive")
+    state_path = os.path.join(path, IMPORT_STATE)
+    state = _read_json(state_path) or {"database": settings.DATABASE_URL, "done": []}
+    if state["database"] != settings.DATABASE_URL:
+        raise ValueError(f"{state_path} belongs to an import into another database; delete it to start over")
+    done = set(state["done"])
+
+    user_shards = _user_shard_map() if SHARDED else {}
+    order = [t.name for t in Base.metadata.sorted_tables if t.name in manifest["tables"]]  # Parents first
+    totals = {}
+    for name in order:
+        table = Base.metadata.tables[name]
+        entry = manifest["tables"][name]
+        columns = {column: kind for column, kind in entry["columns"].items() if column in table.c}
+        start, rows_read = time.perf_counter(), 0
+        for record in entry["chunks"]:
+            if record["file"] in done:
+                continue
+            file_path = os.path.join(path, record["file"])
+            if _sha256(file_path) != record["sha256"]:
+                raise ValueError(f"{record['file']} does not match its manifest checksum")
+            with np.load(file_path, allow_pickle=False) as npz:
+                values = {column: decode_column(npz, column, kind) for column, kind in columns.items()}
+            rows = [dict(zip(values, row)) for row in zip(*values.values())]
+
+            if not SHARDED:
+                _insert_chunk(engines[0], table, rows)
+            else:
+                by_shard: Dict[int, List[Dict]] = {}
+                for row in rows:
+                    if name == USERS_TABLE:
+                        shard = shards.shard_for(row["username"])
+                        user_shards[row["id"]] = shard
+                    elif row[USER_KEY] in user_shards:
+                        shard = user_shards[row[USER_KEY]]
+                    else:
+                        raise ValueError(f"{name} row {row['id']} belongs to user {row[USER_KEY]}, who is not imported")
+                    by_shard.setdefault(shard, []).append(row)
+                for shard, shard_rows in by_shard.items():
+                    _insert_chunk(engines[shard], table, shard_rows)
+
+            done.add(record["file"])
+            state["done"] = sorted(done)
+            _write_json(state_path, state)
+            rows_read += len(rows)
+
+        elapsed = time.perf_counter() - start
+        totals[name] = rows_read
+        log(f"{name:<20} {rows_read:>9,} rows in {elapsed:6.1f}s ({rows_read / max(elapsed, 1e-9):,.0f} rows/s)")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream users and their keystroke data to or from an archive.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write the database to an archive directory")
+    export.add_argument("path")
+    export.add_argument("--chunk", type=int, default=5000, help="rows per chunk file")
+    export.add_argument("--auth-logs", action="store_true", help="include auth logs and their daily rollups")
+    load = sub.add_parser("import", help="load an archive directory into the database")
+    load.add_argument("path")
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+    if args.command == "export":
+        tables = CORE_TABLES + (LOG_TABLES if args.auth_logs else ())
+        totals = export_archive(args.path, tables, args.chunk)
+    else:
+        totals = import_archive(args.path)
+    elapsed = time.perf_counter() - start
+    rows = sum(totals.values())
+    print(f"{args.command}ed {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+KeyAuth - Auth Log Compaction
+Rolls auth logs past retention into per-user daily totals and trims
+enrollment samples' raw key events.
+
+Logs older than AUTH_LOG_RETENTION_DAYS are folded, oldest first, into
+auth_log_daily rows (attempts, accepts and summed confidence per user, UTC
+day and device type) and deleted. Each batch of AUTH_LOG_COMPACTION_BATCH
+logs is one short transaction that updates the daily rows and deletes the
+logs it folded, so the job can be stopped at any point and never holds the
+write lock for long. With TRIM_ENROLLMENT_KEYSTROKES, raw key events of
+samples whose device already has a trained model are cleared the same way.
+The history and profile endpoints read the daily rows together with the
+raw logs that remain.
+
+Usage (from the backend directory):
+    python -m app.jobs.compact_auth_logs [--every MINUTES]
+"""
+import argparse
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import engines, init_db
+from app.ml.feature_schema import device_class
+from app.models import AuthLog, AuthLogDaily, EnrollmentSample, KeystrokeProfile
+from app.response_cache import bump_auth_log_version
+
+
+def compact_batch(db: Session, cutoff: datetime, batch: int) -> int:
+    """Fold up to ``batch`` of the oldest logs before ``cutoff`` into daily rows; returns logs folded."""
+    logs = (
+        db.query(AuthLog.id, AuthLog.user_id, AuthLog.timestamp, AuthLog.device_type,
+                 AuthLog.result, AuthLog.confidence_score)
+        .filter(AuthLog.timestamp < cutoff)
+        .order_by(AuthLog.timestamp)
+        .limit(batch)
+        .all()
+    )
+    if not logs:
+        return 0
+
+    totals = defaultdict(lambda: [0, 0, 0.0])  # (user_id, day, device) → attempts, accepted, confidence sum
+    for log in logs:
+        key = (log.user_id, log.timestamp.date(), log.device_type or "web")
+        totals[key][0] += 1
+        totals[key][1] += log.result == "accepted"
+        totals[key][2] += log.confidence_score
+
+    existing = {
+        (row.user_id, row.day, row.device_type): row
+        for row in db.query(AuthLogDaily).filter(
+            AuthLogDaily.user_id.in_({key[0] for key in totals}),
+            AuthLogDaily.day.in_({key[1] for key in totals}),
+        )
+    }
+    for (user_id, day, device), (attempts, accepted, confidence_sum) in totals.items():
+        row = existing.get((user_id, day, device))
+        if row is None:
+            db.add(AuthLogDaily(
+                user_id=user_id, day=day, device_type=device,
+                attempts=attempts, accepted=accepted, confidence_sum=confidence_sum,
+            ))
+        else:
+            row.attempts += attempts
+            row.accepted += accepted
+            row.confidence_sum += confidence_sum
+
+    db.query(AuthLog).filter(AuthLog.id.in_([log.id for log in logs])).delete(synchronize_session=False)
+    bump_auth_log_version(db, {log.user_id for log in logs})  # Their auth history changed shape
+    db.commit()
+    return len(logs)
+
+
+def trim_batch(db: Session, batch: int) -> int:
+    """Clear raw key events of up to ``batch`` samples whose device model is trained; returns samples trimmed."""
+    trained = {
+        (user_id, device)
+        for user_id, device in db.query(KeystrokeProfile.user_id, KeystrokeProfile.device_type)
+        .filter(KeystrokeProfile.model_data.isnot(None))
+    }
+    if not trained:
+        return 0
+    samples = (
+        db.query(EnrollmentSample.id, EnrollmentSample.user_id, EnrollmentSample.device_type)
+        .filter(EnrollmentSample.raw_keystrokes.isnot(None))
+        .all()
+    )
+    ids = [s.id for s in samples if (s.user_id, device_class(s.device_type)) in trained][:batch]
+    if ids:
+        db.query(EnrollmentSample).filter(EnrollmentSample.id.in_(ids)).update(
+            {EnrollmentSample.raw_keystrokes: None}, synchronize_session=False,
+        )
+    db.commit()
+    return len(ids)
+
+
+def compact(
+    db: Session,
+    retention_days: Optional[int] = None,
+    batch: Optional[int] = None,
+    trim: Optional[bool] = None,
+    pause_s: float = 0.05,
+) -> Dict[str, int]:
+    """Run compaction (and trimming) to completion on one database, pausing between batches."""
+    retention_days = settings.AUTH_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    batch = batch or settings.AUTH_LOG_COMPACTION_BATCH
+    trim = settings.TRIM_ENROLLMENT_KEYSTROKES if trim is None else trim
+
+    totals = {"logs_compacted": 0, "samples_trimmed": 0}
+    if retention_days > 0:
+        # Stored timestamps are naive UTC
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).replace(tzinfo=None)
+        while True:
+            folded = compact_batch(db, cutoff, batch)
+            totals["logs_compacted"] += folded
+            if folded < batch:
+                break
+            time.sleep(pause_s)  # Let request writes in between batches
+    if trim:
+        while True:
+            trimmed = trim_batch(db, batch)
+            totals["samples_trimmed"] += trimmed
+            if trimmed < batch:
+                break
+            time.sleep(pause_s)
+    return totals
+
+
+def run_once(args) -> Dict[str, int]:
+    totals = {"logs_compacted": 0, "samples_trimmed": 0}
+    for engine in engines:  # Every shard (just one unless DATABASE_SHARDS > 1)
+        db = Session(bind=engine)  # The writer engine; SessionLocal may be read-only
+        try:
+            result = compact(db, args.retention_days, args.batch, args.trim or None, args.pause_ms / 1000)
+        finally:
+            db.close()
+        for key, value in result.items():
+            totals[key] += value
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll old auth logs into daily totals and trim raw enrollment keystrokes.")
+    parser.add_argument("--retention-days", type=int, default=None, help="default: AUTH_LOG_RETENTION_DAYS")
+    parser.add_argument("--batch", type=int, default=None, help="rows per transaction (default: AUTH_LOG_COMPACTION_BATCH)")
+    parser.add_argument("--trim", action="store_true", help="trim raw keystrokes even if TRIM_ENROLLMENT_KEYSTROKES is off")
+    parser.add_argument("--pause-ms", type=float, default=50, help="pause between batches")
+    parser.add_argument("--every", type=float, default=None, help="keep running, compacting every MINUTES")
+    args = parser.parse_args()
+
+    init_db()  # Creates auth_log_daily and the auth_logs indexes on older databases
+    while True:
+        start = time.perf_counter()
+        totals = run_once(args)
+        print(f"compacted {totals['logs_compacted']} auth logs, trimmed {totals['samples_trimmed']} samples "
+              f"in {time.perf_counter() - start:.1f}s")
+        if args.every is None:
+            break
+        time.sleep(args.every * 60)
+
+
+if __name__ == "__main__":
+    main()
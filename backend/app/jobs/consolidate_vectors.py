@@ -0,0 +1,139 @@
+"""
+KeyAuth - Feature Vector Consolidation
+One-off migration to the packed float32 feature matrix.
+
+Older rows keep the same training vectors three times: the profile's
+feature_vectors JSON, each EnrollmentSample.features JSON, and a copy
+pickled inside model_data. For every profile this job writes the packed
+matrix, re-serializes the model without its embedded copy and clears both
+JSON columns, then reports the bytes saved. Profiles are processed in
+batches, and ones already consolidated are skipped, so it can be re-run.
+
+Usage (from the backend directory):
+    python -m app.jobs.consolidate_vectors [--vacuum]
+"""
+import argparse
+import json
+import os
+from typing import Dict
+from sqlalchemy.orm import Session
+from app.database import engines, IS_SQLITE, init_db
+from app.models import KeystrokeProfile, EnrollmentSample
+from app.ml.feature_matrix import pack_rows, unpack_matrix
+from app.ml.model import KeystrokeAuthModel
+
+
+def _json_bytes(value) -> int:
+    return len(json.dumps(value, separators=(",", ":"))) if value is not None else 0
+
+
+def consolidate_profile(db: Session, profile: KeystrokeProfile) -> Dict[str, int]:
+    """Consolidate one profile in the current transaction; returns bytes before/after."""
+    samples = (
+        db.query(EnrollmentSample)
+        .filter(EnrollmentSample.user_id == profile.user_id)
+        .order_by(EnrollmentSample.created_at)
+        .all()
+    )
+    legacy_model = profile.model_data
+    before = (
+        _json_bytes(profile.feature_vectors)
+        + sum(_json_bytes(sample.features) for sample in samples)
+        + len(profile.feature_matrix or b"")
+        + len(legacy_model or "")
+    )
+
+    matrix = profile.feature_matrix
+    if not matrix:
+        vectors = profile.feature_vectors or [s.features for s in samples if s.features is not None]
+        matrix = pack_rows(vectors)
+
+    model_data = legacy_model
+    if legacy_model and matrix:
+        model_data = KeystrokeAuthModel.deserialize(legacy_model, unpack_matrix(matrix)).serialize()
+
+    profile.feature_matrix = matrix
+    profile.feature_vectors = None
+    profile.model_data = model_data
+    for sample in samples:
+        sample.features = None
+
+    after = len(matrix or b"") + len(model_data or "")
+    return {"before": before, "after": after}
+
+
+def consolidate_all(db: Session, batch: int = 200) -> Dict[str, int]:
+    """Consolidate every profile still holding JSON vectors, committing per batch."""
+    pending = (
+        db.query(KeystrokeProfile.id)
+        .outerjoin(EnrollmentSample, EnrollmentSample.user_id == KeystrokeProfile.user_id)
+        .filter(
+            (KeystrokeProfile.feature_vectors.isnot(None))
+            | (KeystrokeProfile.feature_matrix.is_(None))
+            | (EnrollmentSample.features.isnot(None))
+        )
+        .distinct()
+        .all()
+    )
+    ids = [profile_id for (profile_id,) in pending]
+    totals = {"profiles": 0, "before": 0, "after": 0}
+    for start in range(0, len(ids), batch):
+        profiles = db.query(KeystrokeProfile).filter(KeystrokeProfile.id.in_(ids[start:start + batch])).all()
+        for profile in profiles:
+            result = consolidate_profile(db, profile)
+            totals["profiles"] += 1
+            totals["before"] += result["before"]
+            totals["after"] += result["after"]
+        db.commit()
+        db.expunge_all()
+    return totals
+
+
+def _sqlite_path(engine):
+    return engine.url.database if IS_SQLITE and engine.url.database not in (None, "", ":memory:") else None
+
+
+def _sqlite_execute(engine, *statements: str):
+    """Run statements on a raw connection, outside SQLAlchemy's BEGIN (VACUUM cannot run in a transaction)."""
+    raw = engine.raw_connection()
+    try:
+        for statement in statements:
+            raw.driver_connection.execute(statement)
+    finally:
+        raw.close()
+
+
+def _sqlite_file_size(engine, path: str) -> int:
+    _sqlite_execute(engine, "PRAGMA wal_checkpoint(TRUNCATE)")  # Count WAL-mode pages in the main file
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move training vectors into the packed feature matrix.")
+    parser.add_argument("--batch", type=int, default=200, help="profiles per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM SQLite afterwards and report the file size")
+    args = parser.parse_args()
+
+    init_db()  # Adds feature_matrix / relaxes enrollment_samples.features on older databases
+    for engine in engines:  # Every shard (just one unless DATABASE_SHARDS > 1)
+        path = _sqlite_path(engine)
+        file_before = _sqlite_file_size(engine, path) if args.vacuum and path else None
+
+        db = Session(bind=engine)  # The writer engine; SessionLocal may be read-only
+        try:
+            totals = consolidate_all(db, args.batch)
+        finally:
+            db.close()
+
+        saved = totals["before"] - totals["after"]
+        pct = saved / totals["before"] if totals["before"] else 0.0
+        print(f"profiles={totals['profiles']} vector+model bytes {totals['before']:,} → {totals['after']:,} "
+              f"(saved {saved:,}, {pct:.0%})")
+
+        if args.vacuum and path:
+            _sqlite_execute(engine, "VACUUM")
+            print(f"database file {file_before:,} → {_sqlite_file_size(engine, path):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
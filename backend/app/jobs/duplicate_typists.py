@@ -0,0 +1,293 @@
+"""
+KeyAuth - Duplicate Typist Detection Job
+Flags account pairs whose enrollment typing is nearly identical, which
+suggests one person operating several accounts.
+
+Each user's enrollment feature matrices (one per device profile) are
+streamed from the database, reduced to the timing features every feature
+schema shares, and averaged into one row of a memory-mapped float32 matrix. Columns are
+z-scored with statistics fixed on the first full run, then all pairs of rows
+are compared in blocks across a process pool. Each worker only holds two
+blocks and their distance matrix. Pairs whose RMS z-distance is at or below
+the threshold are appended to flags.csv.
+
+Incremental runs only re-summarize users whose profile changed since the
+last run and compare those rows against the whole matrix.
+
+Usage (from the backend directory):
+    python -m app.jobs.duplicate_typists --workdir ./dup_job
+    python -m app.jobs.duplicate_typists --workdir ./dup_job --incremental
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import User, KeystrokeProfile
+from app.ml.feature_matrix import profile_vectors
+from app.ml.feature_schema import WEB_V1, get_schema
+
+COMPARED_SCHEMA = WEB_V1  # Timing features, present in every device's schema
+MATRIX_FILE = "vectors.f32"
+STATE_FILE = "state.json"
+FLAGS_FILE = "flags.csv"
+
+
+# ── Streaming Aggregation ───────────────────────────────────────
+
+def _stream_user_means(db: Session, since: Optional[datetime] = None, chunk: int = 1000):
+    """
+    Yield (user_id, mean_vector) per user with training vectors, in user
+    order, averaged over all of the user's device profiles in COMPARED_SCHEMA.
+
+    With ``since``, only users with a profile updated after it are included.
+    """
+    query = db.query(
+        KeystrokeProfile.user_id,
+        KeystrokeProfile.feature_schema,
+        KeystrokeProfile.feature_matrix,
+        KeystrokeProfile.feature_vectors,
+    )
+    if since is not None:
+        changed = db.query(KeystrokeProfile.user_id).filter(KeystrokeProfile.updated_at > since)
+        query = query.filter(KeystrokeProfile.user_id.in_(changed.scalar_subquery()))
+    rows = query.order_by(KeystrokeProfile.user_id).yield_per(chunk)
+    for user_id, user_rows in itertools.groupby(rows, key=lambda row: row.user_id):
+        matrices = []
+        for row in user_rows:
+            vectors = profile_vectors(row)
+            if vectors is not None:
+                matrices.append(COMPARED_SCHEMA.project(vectors, get_schema(row.feature_schema)))
+        if matrices:
+            yield user_id, np.concatenate(matrices).mean(axis=0, dtype=np.float64)
+
+
+# ── Block Comparison (runs in worker processes) ─────────────────
+
+def _compare_blocks(
+    path: str,
+    n_rows: int,
+    dim: int,
+    rows_a: np.ndarray,
+    rows_b: np.ndarray,
+    threshold: float,
+    skip: Optional[np.ndarray] = None,
+) -> List[Tuple[int, int, float]]:
+    """
+    Compare two row sets of the memory-mapped matrix.
+
+    Without ``skip`` only pairs with row_a < row_b are reported, so each
+    unordered pair is emitted once. With ``skip`` (the changed rows of an
+    incremental run) every b-row in it is excluded instead, since those
+    pairs are covered by the changed-vs-changed tasks.
+    """
+    matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(n_rows, dim))
+    A = np.asarray(matrix[rows_a], dtype=np.float64)
+    B = np.asarray(matrix[rows_b], dtype=np.float64)
+    sq = (A * A).sum(axis=1)[:, None] + (B * B).sum(axis=1)[None, :] - 2.0 * A @ B.T
+    dist = np.sqrt(np.maximum(sq, 0.0) / dim)
+
+    mask = (dist <= threshold) & (rows_a[:, None] != rows_b[None, :])
+    if skip is not None:
+        mask &= ~np.isin(rows_b, skip)[None, :]
+    else:
+        mask &= rows_a[:, None] < rows_b[None, :]
+    ia, ib = np.nonzero(mask)
+    return [(int(rows_a[i]), int(rows_b[j]), float(dist[i, j])) for i, j in zip(ia, ib)]
+
+
+# ── Job ─────────────────────────────────────────────────────────
+
+class DuplicateTypistJob:
+    """State and steps of the similarity job for one working directory."""
+
+    def __init__(self, workdir: str, threshold: float = 0.3, block_rows: int = 2048, workers: Optional[int] = None):
+        self.workdir = workdir
+        self.threshold = threshold
+        self.block_rows = block_rows
+        self.workers = workers
+        self.matrix_path = os.path.join(workdir, MATRIX_FILE)
+        self.state_path = os.path.join(workdir, STATE_FILE)
+        self.flags_path = os.path.join(workdir, FLAGS_FILE)
+        os.makedirs(workdir, exist_ok=True)
+
+    def _load_state(self) -> Dict:
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _save_state(self, state: Dict):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _open_matrix(self, n_rows: int, dim: int, mode: str = "r+") -> np.memmap:
+        return np.memmap(self.matrix_path, dtype=np.float32, mode=mode, shape=(n_rows, dim))
+
+    def run_full(self, db: Session) -> Dict:
+        """Rebuild the matrix from every user and compare all pairs."""
+        started = datetime.now(timezone.utc)
+        n_users = sum(n for (n,) in db.query(func.count(func.distinct(KeystrokeProfile.user_id))).all())  # One row per shard
+        if n_users == 0:
+            return {"users": 0, "compared_rows": 0, "flagged": 0}
+
+        user_ids: List[str] = []
+        matrix = None
+        dim = None
+        for user_id, mean in _stream_user_means(db):
+            if matrix is None:
+                dim = len(mean)
+                matrix = self._open_matrix(n_users, dim, mode="w+")
+            if len(mean) != dim:
+                continue
+            matrix[len(user_ids)] = mean
+            user_ids.append(user_id)
+        n_rows = len(user_ids)
+
+        # Column statistics in chunks, then z-score in place
+        total = np.zeros(dim)
+        total_sq = np.zeros(dim)
+        for start in range(0, n_rows, self.block_rows):
+            chunk = np.asarray(matrix[start:start + self.block_rows], dtype=np.float64)
+            total += chunk.sum(axis=0)
+            total_sq += (chunk * chunk).sum(axis=0)
+        mean = total / n_rows
+        std = np.sqrt(np.maximum(total_sq / n_rows - mean * mean, 0.0))
+        std[std < 1e-9] = 1.0
+        for start in range(0, n_rows, self.block_rows):
+            matrix[start:start + self.block_rows] = (matrix[start:start + self.block_rows] - mean) / std
+        matrix.flush()
+        del matrix
+
+        state = {
+            "dim": dim,
+            "capacity": n_users,
+            "n_rows": n_rows,
+            "mean": mean.tolist(),
+            "std": std.tolist(),
+            "user_ids": user_ids,
+            "last_run_at": started.isoformat(),
+        }
+        self._save_state(state)
+        if os.path.exists(self.flags_path):
+            os.remove(self.flags_path)
+
+        blocks = [np.arange(s, min(s + self.block_rows, n_rows)) for s in range(0, n_rows, self.block_rows)]
+        tasks = [(a, b, None) for i, a in enumerate(blocks) for b in blocks[i:]]
+        flagged = self._run_tasks(db, state, tasks)
+        return {"users": n_rows, "compared_rows": n_rows, "flagged": flagged}
+
+    def run_incremental(self, db: Session) -> Dict:
+        """Re-summarize users with new enrollments and compare only their rows."""
+        if not os.path.exists(self.state_path):
+            return self.run_full(db)
+        state = self._load_state()
+        if state["dim"] != COMPARED_SCHEMA.dim:
+            return self.run_full(db)  # Matrix built with another feature layout
+        started = datetime.now(timezone.utc)
+        since = datetime.fromisoformat(state["last_run_at"]).replace(tzinfo=None)
+        dim = state["dim"]
+        mean = np.asarray(state["mean"])
+        std = np.asarray(state["std"])
+        rows = {user_id: i for i, user_id in enumerate(state["user_ids"])}
+
+        updates = [(u, v) for u, v in _stream_user_means(db, since=since) if len(v) == dim]
+        new_users = [u for u, _ in updates if u not in rows]
+        if state["n_rows"] + len(new_users) > state["capacity"]:
+            self._resize(state, max(2 * state["capacity"], state["n_rows"] + len(new_users)))
+
+        matrix = self._open_matrix(state["capacity"], dim)
+        changed = []
+        for user_id, vector in updates:
+            if user_id not in rows:
+                rows[user_id] = state["n_rows"]
+                state["user_ids"].append(user_id)
+                state["n_rows"] += 1
+            matrix[rows[user_id]] = (vector - mean) / std
+            changed.append(rows[user_id])
+        matrix.flush()
+        del matrix
+
+        state["last_run_at"] = started.isoformat()
+        self._save_state(state)
+        if not changed:
+            return {"users": state["n_rows"], "compared_rows": 0, "flagged": 0}
+
+        changed_rows = np.asarray(sorted(changed))
+        n_rows = state["n_rows"]
+        a_blocks = [changed_rows[s:s + self.block_rows] for s in range(0, len(changed_rows), self.block_rows)]
+        b_blocks = [np.arange(s, min(s + self.block_rows, n_rows)) for s in range(0, n_rows, self.block_rows)]
+        # Changed vs unchanged rows, then changed vs changed rows (each pair once)
+        tasks = [(a, b, changed_rows) for a in a_blocks for b in b_blocks]
+        tasks += [(a, b, None) for i, a in enumerate(a_blocks) for b in a_blocks[i:]]
+        flagged = self._run_tasks(db, state, tasks)
+        return {"users": n_rows, "compared_rows": len(changed_rows), "flagged": flagged}
+
+    def _resize(self, state: Dict, capacity: int):
+        old = self._open_matrix(state["capacity"], state["dim"], mode="r")
+        data = np.array(old[:state["n_rows"]])
+        del old
+        new = self._open_matrix(capacity, state["dim"], mode="w+")
+        new[:state["n_rows"]] = data
+        new.flush()
+        del new
+        state["capacity"] = capacity
+
+    def _run_tasks(self, db: Session, state: Dict, tasks) -> int:
+        """Fan (rows_a, rows_b, skip) tasks out to the process pool and append flagged pairs."""
+        pairs: List[Tuple[int, int, float]] = []
+        args = (self.matrix_path, state["capacity"], state["dim"])
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(_compare_blocks, *args, a, b, self.threshold, skip) for a, b, skip in tasks]
+            for future in futures:
+                pairs.extend(future.result())
+
+        user_ids = state["user_ids"]
+        unique = {(min(a, b), max(a, b)): d for a, b, d in pairs}
+        ids = {user_ids[i] for pair in unique for i in pair}
+        usernames = dict(db.query(User.id, User.username).filter(User.id.in_(ids)).all()) if ids else {}
+
+        write_header = not os.path.exists(self.flags_path)
+        with open(self.flags_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(["user_a", "user_b", "username_a", "username_b", "distance", "flagged_at"])
+            now = datetime.now(timezone.utc).isoformat()
+            for (a, b), distance in sorted(unique.items(), key=lambda item: item[1]):
+                ua, ub = user_ids[a], user_ids[b]
+                writer.writerow([ua, ub, usernames.get(ua, ""), usernames.get(ub, ""), round(distance, 4), now])
+        return len(unique)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag accounts with near-identical enrollment typing.")
+    parser.add_argument("--workdir", default="./duplicate_typists", help="directory for the matrix, state and flags.csv")
+    parser.add_argument("--threshold", type=float, default=0.3, help="max RMS z-distance to flag a pair")
+    parser.add_argument("--block-rows", type=int, default=2048, help="rows per comparison block")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--incremental", action="store_true", help="only compare users with new enrollments")
+    args = parser.parse_args()
+
+    job = DuplicateTypistJob(args.workdir, args.threshold, args.block_rows, args.workers)
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        result = job.run_incremental(db) if args.incremental else job.run_full(db)
+    finally:
+        db.close()
+    print(
+        f"users={result['users']} compared={result['compared_rows']} flagged={result['flagged']} "
+        f"in {time.perf_counter() - start:.1f}s → {job.flags_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
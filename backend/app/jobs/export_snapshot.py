@@ -0,0 +1,63 @@
+"""
+KeyAuth - Model Snapshot Export
+Writes every trained profile's scoring data into one memory-mappable file
+(see app/ml/snapshot.py). Point MODEL_SNAPSHOT_PATH at the result so new
+workers score from it instead of loading each model from the database.
+
+Usage (from the backend directory):
+    python -m app.jobs.export_snapshot --output ./models.kms
+"""
+import argparse
+import time
+from typing import Dict
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import User, KeystrokeProfile
+from app.ml.feature_matrix import profile_vectors
+from app.ml.model import KeystrokeAuthModel
+from app.ml.snapshot import SnapshotWriter
+
+
+def export_snapshot(db: Session, path: str, chunk: int = 500) -> Dict:
+    """Stream trained profiles of enrolled users into a new snapshot at ``path``."""
+    writer = SnapshotWriter(path)
+    rows = (
+        db.query(
+            KeystrokeProfile.id,
+            KeystrokeProfile.updated_at,
+            KeystrokeProfile.model_data,
+            KeystrokeProfile.digraph_vectors,
+            KeystrokeProfile.feature_matrix,
+            KeystrokeProfile.feature_vectors,
+        )
+        .join(User, User.id == KeystrokeProfile.user_id)
+        .filter(User.is_enrolled.is_(True), KeystrokeProfile.model_data.isnot(None))
+        .yield_per(chunk)
+    )
+    for row in rows:
+        model = KeystrokeAuthModel.deserialize(row.model_data, profile_vectors(row))
+        writer.add(row.id, row.updated_at, model, row.digraph_vectors)
+    profiles = len(writer)
+    size = writer.close()
+    return {"profiles": profiles, "bytes": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export trained profiles' models to a memory-mapped snapshot.")
+    parser.add_argument("--output", default="./models.kms", help="snapshot file to write (replaced atomically)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        result = export_snapshot(db, args.output)
+    finally:
+        db.close()
+    print(
+        f"profiles={result['profiles']} size={result['bytes'] / 1e6:.2f} MB "
+        f"in {time.perf_counter() - start:.1f}s → {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
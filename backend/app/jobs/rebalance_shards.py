@@ -0,0 +1,103 @@
+"""
+KeyAuth - Shard Rebalancing
+Moves users to their home shard after DATABASE_SHARDS changes.
+
+Every shard of the old layout is scanned in parallel for users whose
+username now hashes to a different shard. Each such user's row and all rows
+referencing it (keystroke profiles, enrollment samples, auth logs) are
+copied to the new shard with their ids unchanged, committed there, and only
+then deleted from the old one. A run interrupted between the two steps
+leaves the user on both shards; running the job again replaces the copy and
+finishes the move. Stop the service while it runs.
+
+Usage (from the backend directory, with the new DATABASE_SHARDS set):
+    python -m app.jobs.rebalance_shards --from-shards 2 [--dry-run]
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from app.database import Base, SHARD_COUNT, create_engines, db_url, engines, init_db
+from app.sharding import USER_KEY, USERS_TABLE, shard_for, shard_url
+import app.models  # noqa: F401  (registers the tables on Base.metadata)
+
+
+def _tables():
+    users = Base.metadata.tables[USERS_TABLE]
+    children = [table for table in Base.metadata.sorted_tables if USER_KEY in table.c]
+    return users, children
+
+
+def misplaced_users(engine: Engine, shard: int, shards: int) -> List[Tuple[str, str, int]]:
+    """(user id, username, home shard) of every user on ``shard`` that belongs elsewhere."""
+    users, _ = _tables()
+    with engine.connect() as conn:
+        rows = conn.execute(select(users.c.id, users.c.username)).all()
+    moves = []
+    for user_id, username in rows:
+        home = shard_for(username, shards)
+        if home != shard:
+            moves.append((user_id, username, home))
+    return moves
+
+
+def move_user(source: Engine, target: Engine, user_id: str) -> int:
+    """Copy one user's rows to ``target``, then delete them from ``source``; returns rows moved."""
+    users, children = _tables()
+    with source.connect() as conn:
+        copied = [(users, conn.execute(select(users).where(users.c.id == user_id)).mappings().all())]
+        for table in children:
+            rows = conn.execute(select(table).where(table.c[USER_KEY] == user_id)).mappings().all()
+            copied.append((table, rows))
+
+    with target.begin() as conn:
+        for table in reversed(children):  # Replace what an interrupted run left behind
+            conn.execute(table.delete().where(table.c[USER_KEY] == user_id))
+        conn.execute(users.delete().where(users.c.id == user_id))
+        for table, rows in copied:
+            if rows:
+                conn.execute(table.insert(), [dict(row) for row in rows])
+
+    with source.begin() as conn:
+        for table in reversed(children):
+            conn.execute(table.delete().where(table.c[USER_KEY] == user_id))
+        conn.execute(users.delete().where(users.c.id == user_id))
+    return sum(len(rows) for _, rows in copied)
+
+
+def rebalance(from_shards: int, dry_run: bool = False) -> Dict:
+    """Move every misplaced user of a ``from_shards`` layout to its shard in the current layout."""
+    layout = max(from_shards, SHARD_COUNT)
+    # Shards beyond the current count are being drained: open them directly
+    all_engines = engines + [create_engines(shard_url(db_url, i))[0] for i in range(SHARD_COUNT, layout)]
+    with ThreadPoolExecutor(max_workers=layout) as pool:
+        plans = list(pool.map(lambda i: misplaced_users(all_engines[i], i, SHARD_COUNT), range(layout)))
+
+    moved, rows = Counter(), 0
+    for source, moves in enumerate(plans):
+        for user_id, username, target in moves:
+            if not dry_run:
+                rows += move_user(all_engines[source], all_engines[target], user_id)
+            moved[(source, target)] += 1
+    return {"users": sum(moved.values()), "rows": rows, "moves": dict(moved)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move users to their home shard after DATABASE_SHARDS changes.")
+    parser.add_argument("--from-shards", type=int, default=SHARD_COUNT,
+                        help="shard count the data was written with (default: DATABASE_SHARDS)")
+    parser.add_argument("--dry-run", action="store_true", help="only report which users would move")
+    args = parser.parse_args()
+
+    init_db()  # Creates the tables on new shards
+    result = rebalance(args.from_shards, args.dry_run)
+    action = "would move" if args.dry_run else "moved"
+    print(f"{action} {result['users']} users ({result['rows']} rows), {args.from_shards} → {SHARD_COUNT} shards")
+    for (source, target), count in sorted(result["moves"].items()):
+        print(f"  shard {source} → {target}: {count}")
+
+
+if __name__ == "__main__":
+    main()
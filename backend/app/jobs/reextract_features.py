@@ -0,0 +1,258 @@
+"""
+KeyAuth - Feature Re-extraction Backfill
+Brings stored profiles to the current FEATURE_VERSION after the feature
+extractor changes.
+
+Profiles whose rows were extracted with another version (rows stored before
+versions count as version 1) are read in batches of --batch, together with
+the raw keystrokes of their enrollment samples. --workers processes
+re-extract each profile's samples with the batch extractor and retrain the
+model of enrolled profiles. A batch is written in one short transaction, and
+only to profiles not changed since they were read; a profile enrolled in
+between is left for the next run. Every finished profile records the new
+version, so the job can be stopped at any point and re-run to continue.
+--max-rate and --pause-ms keep it from crowding out live traffic.
+
+Profiles whose samples' raw keystrokes were trimmed
+(TRIM_ENROLLMENT_KEYSTROKES) cannot be re-extracted: they are reported and
+keep their old rows and model until the user re-enrolls. Profiles whose
+rows already match the current version only have the version recorded.
+
+Usage (from the backend directory):
+    python -m app.jobs.reextract_features [--workers 2] [--batch 50] [--max-rate 20] [--dry-run]
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import engines, init_db
+from app.ml.digraph_features import unpack_sparse_vectors
+from app.ml.feature_extractor import FEATURE_VERSION
+from app.ml.feature_matrix import extract_profile_matrix, unpack_matrix
+from app.ml.feature_schema import device_class, get_schema
+from app.ml.keystrokes import KeystrokeArrays
+from app.ml.model import KeystrokeAuthModel
+from app.models import EnrollmentSample, KeystrokeProfile
+from app.routes.registration import sizing_impostors
+
+
+class Task(NamedTuple):
+    """One profile to rebuild, as sent to a worker process."""
+    profile_id: str
+    schema_name: Optional[str]
+    scorer: Optional[str]
+    train: bool
+    samples: List[List[Dict]]  # Raw keystroke records, oldest first
+    impostors: Optional[np.ndarray]
+
+
+class Rebuilt(NamedTuple):
+    profile_id: str
+    feature_matrix: Optional[bytes] = None
+    digraph_vectors: Optional[bytes] = None
+    model_data: Optional[str] = None
+    model_cost: Optional[Dict] = None
+    error: Optional[str] = None
+
+
+def rebuild(task: Task) -> Rebuilt:
+    """Re-extract a profile's samples and retrain its model (runs in a worker process)."""
+    try:
+        schema = get_schema(task.schema_name)
+        feature_matrix, digraph_vectors = extract_profile_matrix(
+            [KeystrokeArrays.from_records(records) for records in task.samples], schema,
+        )
+        if not task.train:
+            return Rebuilt(task.profile_id, feature_matrix, digraph_vectors)
+        auth_model = KeystrokeAuthModel()
+        auth_model.training_vectors = unpack_matrix(feature_matrix)
+        auth_model.digraph_vectors = unpack_sparse_vectors(digraph_vectors)
+        auth_model.train(task.scorer, task.impostors)
+        return Rebuilt(task.profile_id, feature_matrix, digraph_vectors, auth_model.serialize(), auth_model.model_cost)
+    except (ValueError, KeyError) as e:
+        return Rebuilt(task.profile_id, error=str(e))
+
+
+class _InlineExecutor:
+    """map() in this process, for --workers 0."""
+
+    def map(self, fn, iterable):
+        return map(fn, iterable)
+
+    def shutdown(self):
+        pass
+
+
+def _stale_profiles(db: Session, after: Optional[str], batch: int) -> List[KeystrokeProfile]:
+    query = db.query(KeystrokeProfile).filter(
+        or_(KeystrokeProfile.feature_version.is_(None), KeystrokeProfile.feature_version != FEATURE_VERSION)
+    )
+    if after is not None:
+        query = query.filter(KeystrokeProfile.id > after)  # Profiles skipped earlier in this run stay behind
+    return query.order_by(KeystrokeProfile.id).limit(batch).all()
+
+
+def _unchanged(profile: KeystrokeProfile):
+    """Filter matching the profile only while its updated_at is the one that was read."""
+    if profile.updated_at is None:
+        return KeystrokeProfile.updated_at.is_(None)
+    return KeystrokeProfile.updated_at == profile.updated_at
+
+
+def reextract_batch(db: Session, profiles: List[KeystrokeProfile], executor, totals: Dict[str, int]):
+    """Rebuild one batch of stale profiles and write them in one transaction."""
+    samples = defaultdict(list)  # (user_id, device class) → samples, oldest first
+    for sample in (
+        db.query(EnrollmentSample.id, EnrollmentSample.user_id, EnrollmentSample.device_type, EnrollmentSample.raw_keystrokes)
+        .filter(EnrollmentSample.user_id.in_({p.user_id for p in profiles}))
+        .order_by(EnrollmentSample.created_at)
+    ):
+        samples[(sample.user_id, device_class(sample.device_type))].append(sample)
+
+    stamp, tasks, sample_ids, impostors = [], [], {}, {}
+    for profile in profiles:
+        own = samples[(profile.user_id, profile.device_type)]
+        if (profile.feature_version or 1) == FEATURE_VERSION:
+            stamp.append(profile)  # Rows are already in this version; only record it
+            sample_ids[profile.id] = [s.id for s in own]
+            continue
+        if len(own) != profile.sample_count or any(s.raw_keystrokes is None for s in own):
+            totals["skipped_trimmed"] += 1
+            continue
+        train = profile.sample_count >= settings.ENROLLMENT_SAMPLES_REQUIRED
+        if train and profile.device_type not in impostors:
+            impostors[profile.device_type] = sizing_impostors(db, profile.device_type, get_schema(profile.feature_schema), None)
+        tasks.append(Task(
+            profile.id, profile.feature_schema, profile.scorer, train,
+            [s.raw_keystrokes for s in own], impostors.get(profile.device_type) if train else None,
+        ))
+        sample_ids[profile.id] = [s.id for s in own]
+    results = list(executor.map(rebuild, tasks))
+
+    by_id = {p.id: p for p in profiles}
+    now = datetime.now(timezone.utc)
+    for profile in stamp:
+        db.query(KeystrokeProfile).filter(KeystrokeProfile.id == profile.id, _unchanged(profile)).update(
+            {KeystrokeProfile.feature_version: FEATURE_VERSION}, synchronize_session=False,
+        )
+        totals["stamped"] += 1
+    for result in results:
+        if result.error is not None:
+            totals["failed"] += 1
+            sample_ids.pop(result.profile_id)
+            print(f"  profile {result.profile_id}: {result.error}")
+            continue
+        profile = by_id[result.profile_id]
+        values = {
+            KeystrokeProfile.feature_matrix: result.feature_matrix,
+            KeystrokeProfile.feature_vectors: None,
+            KeystrokeProfile.digraph_vectors: result.digraph_vectors,
+            KeystrokeProfile.feature_version: FEATURE_VERSION,
+            KeystrokeProfile.updated_at: now,  # New ETag and model snapshot entry
+        }
+        if result.model_data is not None:
+            values[KeystrokeProfile.model_data] = result.model_data
+            values[KeystrokeProfile.model_cost] = result.model_cost
+        updated = db.query(KeystrokeProfile).filter(KeystrokeProfile.id == profile.id, _unchanged(profile)).update(
+            values, synchronize_session=False,
+        )
+        if not updated:
+            totals["changed_during_run"] += 1
+            sample_ids.pop(profile.id)
+            continue
+        totals["reextracted"] += 1
+        totals["samples"] += len(sample_ids[profile.id])
+    ids = [sample_id for profile_ids in sample_ids.values() for sample_id in profile_ids]
+    if ids:
+        db.query(EnrollmentSample).filter(EnrollmentSample.id.in_(ids)).update(
+            {EnrollmentSample.feature_version: FEATURE_VERSION}, synchronize_session=False,
+        )
+    db.commit()
+
+
+def reextract(
+    db: Session,
+    executor,
+    batch: int = 50,
+    max_rate: Optional[float] = None,
+    pause_s: float = 0.05,
+) -> Dict[str, int]:
+    """Bring every stale profile of one database to FEATURE_VERSION."""
+    totals = defaultdict(int)
+    start, after = time.perf_counter(), None
+    while True:
+        profiles = _stale_profiles(db, after, batch)
+        if not profiles:
+            break
+        after = profiles[-1].id
+        reextract_batch(db, profiles, executor, totals)
+        db.expunge_all()
+        totals["profiles"] += len(profiles)
+        if max_rate:
+            # Stay at or under max_rate profiles per second overall
+            time.sleep(max(0.0, totals["profiles"] / max_rate - (time.perf_counter() - start)))
+        time.sleep(pause_s)  # Let request writes in between batches
+    return totals
+
+
+def count_stale(db: Session) -> Dict[int, int]:
+    """Profiles per stored feature version (None counted as 1) that differ from FEATURE_VERSION."""
+    counts = defaultdict(int)
+    rows = db.query(KeystrokeProfile.feature_version, func.count()).group_by(KeystrokeProfile.feature_version)
+    for version, count in rows:
+        if version != FEATURE_VERSION:
+            counts[version or 1] += count
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-extract stored enrollment samples at the current feature version and retrain their profiles.")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="extraction/training processes (0 = in this process)")
+    parser.add_argument("--batch", type=int, default=50, help="profiles per transaction")
+    parser.add_argument("--max-rate", type=float, default=None, help="at most this many profiles per second")
+    parser.add_argument("--pause-ms", type=float, default=50, help="pause between batches")
+    parser.add_argument("--dry-run", action="store_true", help="only count profiles to update")
+    args = parser.parse_args()
+
+    init_db()  # Adds the feature_version columns on older databases
+    totals, start = defaultdict(int), time.perf_counter()
+    executor = (
+        ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn"))
+        if args.workers > 0 else _InlineExecutor()
+    )
+    try:
+        for shard, engine in enumerate(engines):  # Every shard (just one unless DATABASE_SHARDS > 1)
+            db = Session(bind=engine)  # The writer engine; SessionLocal may be read-only
+            try:
+                if args.dry_run:
+                    for version, count in sorted(count_stale(db).items()):
+                        print(f"shard {shard}: {count} profiles at feature version {version}")
+                    continue
+                for key, value in reextract(db, executor, args.batch, args.max_rate, args.pause_ms / 1000).items():
+                    totals[key] += value
+            finally:
+                db.close()
+    finally:
+        executor.shutdown()
+    if args.dry_run:
+        print(f"current feature version: {FEATURE_VERSION}")
+        return
+
+    elapsed = time.perf_counter() - start
+    print(f"feature version {FEATURE_VERSION}: re-extracted {totals['reextracted']} profiles "
+          f"({totals['samples']} samples, {totals['reextracted'] / elapsed:.1f} profiles/s), "
+          f"recorded the version on {totals['stamped']}, skipped {totals['skipped_trimmed']} with trimmed samples, "
+          f"{totals['changed_during_run']} changed during the run, {totals['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+KeyAuth - Shadow Scoring Report
+Compares candidate scorers with the deciding model over the attempts
+recorded by shadow scoring (see app/ml/shadow.py).
+
+For each candidate: attempts it scored, mean score next to the primary's,
+Pearson correlation with the primary score, acceptance rate at the
+threshold each attempt was decided with (or ``--threshold``), and how often
+its decision agrees with the one that was made.
+
+Usage (from the backend directory):
+    python -m app.jobs.shadow_report [--store ./shadow_scores] [--threshold 0.8] [--json]
+"""
+import argparse
+import json
+from typing import Dict, List, Optional
+import numpy as np
+from app.config import settings
+from app.ml.shadow import CANDIDATE_PREFIX, load_shadow_scores
+
+
+def summarize(columns: Dict[str, np.ndarray], threshold: Optional[float] = None) -> List[Dict]:
+    """One summary per candidate column."""
+    primary, accepted = columns["primary"], columns["accepted"]
+    thresholds = columns["threshold"] if threshold is None else np.full(len(primary), threshold, dtype=np.float32)
+    summaries = []
+    for key in columns:
+        if not key.startswith(CANDIDATE_PREFIX):
+            continue
+        scores = columns[key]
+        scored = ~np.isnan(scores)
+        n = int(scored.sum())
+        candidate_accepted = scores[scored] >= thresholds[scored]
+        summary = {
+            "candidate": key[len(CANDIDATE_PREFIX):],
+            "attempts": n,
+            "primary_mean": None,
+            "candidate_mean": None,
+            "correlation": None,
+            "primary_accept_rate": None,
+            "candidate_accept_rate": None,
+            "agreement": None,
+        }
+        if n:
+            summary.update(
+                primary_mean=round(float(primary[scored].mean()), 4),
+                candidate_mean=round(float(scores[scored].mean()), 4),
+                primary_accept_rate=round(float(accepted[scored].mean()), 4),
+                candidate_accept_rate=round(float(candidate_accepted.mean()), 4),
+                agreement=round(float((candidate_accepted == accepted[scored]).mean()), 4),
+            )
+        if n > 1 and primary[scored].std() > 0 and scores[scored].std() > 0:
+            summary["correlation"] = round(float(np.corrcoef(primary[scored], scores[scored])[0, 1]), 4)
+        summaries.append(summary)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare shadow-scored candidate scorers with the deciding model.")
+    parser.add_argument("--store", default=settings.SHADOW_STORE_DIR, help="default: SHADOW_STORE_DIR")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="decide candidates at this threshold instead of each attempt's own")
+    parser.add_argument("--json", action="store_true", help="print the summaries as JSON")
+    args = parser.parse_args()
+
+    columns = load_shadow_scores(args.store)
+    if not columns:
+        print(f"No shadow scores in {args.store}")
+        return
+    summaries = summarize(columns, args.threshold)
+    if args.json:
+        print(json.dumps({"attempts": len(columns["primary"]), "candidates": summaries}, indent=2))
+        return
+
+    print(f"{len(columns['primary'])} attempts from {args.store}")
+    print(f"{'candidate':<18} {'attempts':>8} {'primary':>8} {'score':>8} {'corr':>6} "
+          f"{'accept':>7} {'(prim.)':>7} {'agree':>7}")
+    for s in summaries:
+        if not s["attempts"]:
+            print(f"{s['candidate']:<18} {0:>8}")
+            continue
+        corr = f"{s['correlation']:.3f}" if s["correlation"] is not None else "-"
+        print(f"{s['candidate']:<18} {s['attempts']:>8} {s['primary_mean']:>8.3f} {s['candidate_mean']:>8.3f} "
+              f"{corr:>6} {s['candidate_accept_rate']:>7.1%} {s['primary_accept_rate']:>7.1%} {s['agreement']:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
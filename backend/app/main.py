@@ -2,11 +2,22 @@
 KeyAuth - FastAPI Application Entry Point
 Cross-Platform Keystroke Dynamics Passwordless Authentication System
 """
-from fastapi import FastAPI
+import json
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from app.admission import admission
 from app.config import settings
 from app.database import init_db
-from app.routes import registration, authentication, user
+from app.memory import memory_logger
+from app.ml.keystrokes import BINARY_CONTENT_TYPE
+from app.ml.shadow import shadow_scorer
+from app.ml.snapshot import model_snapshot
+from app.query_stats import QueryStatsMiddleware, query_metrics
+from app.response_cache import response_cache
+from app.routes import registration, authentication, identification, user, streaming, admin
 
 # ── Create App ──────────────────────────────────────────────────
 
@@ -31,21 +42,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ── Query Accounting ────────────────────────────────────────────
+
+app.add_middleware(QueryStatsMiddleware, debug_headers=settings.DEBUG)
+
+# ── Validation Errors ───────────────────────────────────────────
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """Report validation errors; packed binary bodies and non-finite inputs are not echoed back."""
+    errors = exc.errors()
+    if request.headers.get("content-type", "").startswith(BINARY_CONTENT_TYPE):
+        errors = _without_input(errors)
+    detail = jsonable_encoder(errors)
+    try:
+        json.dumps(detail, allow_nan=False)
+    except ValueError:  # A rejected NaN/Infinity cannot be rendered as JSON
+        detail = jsonable_encoder(_without_input(errors))
+    return JSONResponse(status_code=422, content={"detail": detail})
+
+
+def _without_input(errors):
+    return [{k: v for k, v in error.items() if k != "input"} for error in errors]
+
 # ── Include Routers ─────────────────────────────────────────────
 
 app.include_router(registration.router)
 app.include_router(authentication.router)
+app.include_router(identification.router)
 app.include_router(user.router)
+app.include_router(streaming.router)
+app.include_router(admin.router)
 
 # ── Startup Event ───────────────────────────────────────────────
 
 @app.on_event("startup")
 def on_startup():
-    """Initialize database tables on application startup."""
+    """Initialize database tables (and map the model snapshot) on application startup."""
     init_db()
+    if settings.MODEL_SNAPSHOT_PATH:
+        try:
+            model_snapshot.open(settings.MODEL_SNAPSHOT_PATH)
+            print(f"🗂️  Model snapshot: {len(model_snapshot)} profiles from {settings.MODEL_SNAPSHOT_PATH}")
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Model snapshot not loaded ({e}); models will be read from the database")
     print(f"🚀 {settings.APP_NAME} v{settings.APP_VERSION} started!")
     print(f"📊 Enrollment requires {settings.ENROLLMENT_SAMPLES_REQUIRED} samples")
     print(f"🎯 Auth confidence threshold: {settings.AUTH_CONFIDENCE_THRESHOLD}")
+    if shadow_scorer.enabled:
+        print(f"👥 Shadow scoring: {', '.join(shadow_scorer.candidates)} → {settings.SHADOW_STORE_DIR}")
+    if settings.MEMORY_LOG_INTERVAL_SECONDS > 0:
+        print(f"🧠 Memory log every {settings.MEMORY_LOG_INTERVAL_SECONDS}s")
+        memory_logger.start(settings.MEMORY_LOG_INTERVAL_SECONDS)
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    """Write out buffered shadow scores."""
+    shadow_scorer.close()
 
 # ── Root Endpoint ───────────────────────────────────────────────
 
@@ -63,7 +117,41 @@ def root():
             "enroll": "POST /api/enroll",
             "enrollment_status": "GET /api/enrollment-status/{username}",
             "authenticate": "POST /api/authenticate",
+            "identify": "POST /api/identify",
+            "authenticate_stream": "WS /ws/authenticate",
+            "session_scoring": "WS /ws/session",
             "profile": "GET /api/user/profile",
             "auth_history": "GET /api/user/auth-history",
+            "bulk_enroll": "POST /api/admin/bulk-enroll",
+            "memory": "GET /api/admin/memory",
+            "auth_stats": "GET /api/admin/auth-stats",
+            "admission_metrics": "GET /metrics/admission",
+            "query_metrics": "GET /metrics/queries",
+            "response_cache_metrics": "GET /metrics/response-cache",
+            "shadow_metrics": "GET /metrics/shadow",
         },
     }
+
+
+@app.get("/metrics/admission", tags=["Health"])
+def admission_metrics():
+    """Per-work-class slots in use, queue depth, shed counts and queue wait percentiles."""
+    return admission.metrics()
+
+
+@app.get("/metrics/queries", tags=["Health"])
+def query_metrics_endpoint():
+    """Per-route SQL statement counts, DB time and query-budget overruns."""
+    return query_metrics.metrics()
+
+
+@app.get("/metrics/response-cache", tags=["Health"])
+def response_cache_metrics():
+    """Cached responses, hits, misses and 304 answers to If-None-Match."""
+    return response_cache.metrics()
+
+
+@app.get("/metrics/shadow", tags=["Health"])
+def shadow_metrics():
+    """Shadow scoring queue depth, dropped and scored attempts, and scores written."""
+    return shadow_scorer.metrics()
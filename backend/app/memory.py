@@ -0,0 +1,240 @@
+"""
+KeyAuth - Memory Accounting
+Entry counts and estimated sizes of the in-process caches and structures,
+tracemalloc snapshot diffs, and a periodic log line.
+
+Each structure reports ``{"entries", "bytes", "cap", "evictions"}`` from its
+memory_usage() method (cap None = unbounded). Sizes are estimates:
+sys.getsizeof of a container and its contents, with NumPy arrays counted by
+nbytes; for large containers a sample of entries is measured and scaled to
+the entry count. Tracing allocations with tracemalloc slows every
+allocation down, so it only runs between the first snapshot taken through
+the admin API and SnapshotTracer.stop() (DELETE /api/admin/memory/snapshots).
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+import numpy as np
+
+SAMPLE = 256  # Entries measured per container before scaling to its size
+
+
+def _sizeof(obj, seen: set, depth: int) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    size = sys.getsizeof(obj)
+    if depth <= 0 or isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k, seen, depth - 1) + _sizeof(v, seen, depth - 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(item, seen, depth - 1) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _sizeof(vars(obj), seen, depth - 1)
+    return size
+
+
+def deep_sizeof(obj, depth: int = 6) -> int:
+    """Bytes of ``obj`` and what it references, down to ``depth`` levels."""
+    return _sizeof(obj, set(), depth)
+
+
+def estimate_bytes(container, sample: int = SAMPLE) -> int:
+    """Estimated bytes of a dict or sequence, measuring at most ``sample`` entries."""
+    n = len(container)
+    if n <= sample:
+        return deep_sizeof(container)
+    items = container.items() if isinstance(container, dict) else container
+    measured = sum(deep_sizeof(item) for item in itertools.islice(items, sample))
+    return sys.getsizeof(container) + measured * n // sample
+
+
+def estimate_items(items: Iterable, count: int, item_bytes=deep_sizeof, sample: int = SAMPLE) -> int:
+    """Estimated bytes of ``count`` items, measuring the first ``sample`` with ``item_bytes``."""
+    sizes = [item_bytes(item) for item in itertools.islice(items, sample)]
+    return sum(sizes) * count // len(sizes) if sizes else 0
+
+
+# ── SQLAlchemy sessions ─────────────────────────────────────────
+
+_sessions: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def track_session(session):
+    """Count ``session`` (and its identity map) until it is garbage collected."""
+    _sessions.add(session)
+
+
+def session_usage() -> Dict:
+    sessions = list(_sessions)
+    states = [state for session in sessions for state in list(session.identity_map.all_states())]
+    return {
+        "entries": len(states),
+        "bytes": estimate_items((state.dict for state in states), len(states)),
+        "cap": None,
+        "evictions": 0,
+        "sessions": len(sessions),
+    }
+
+
+# ── Process ─────────────────────────────────────────────────────
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def structures() -> Dict[str, Dict]:
+    """memory_usage() of every tracked structure, by name."""
+    from app.auth_stats import auth_stats
+    from app.ml.profile_index import profile_indexes
+    from app.ml.shadow import shadow_scorer
+    from app.ml.snapshot import model_snapshot
+    from app.response_cache import response_cache
+    from app.security import anti_replay, rate_limiter
+
+    reports = {
+        "anti_replay": anti_replay.memory_usage(),
+        "rate_limiter": rate_limiter.memory_usage(),
+        "response_cache": response_cache.memory_usage(),
+        "shadow_models": shadow_scorer.memory_usage(),
+        "model_snapshot": model_snapshot.memory_usage(),
+        "auth_stats": auth_stats.memory_usage(),
+        "sqlalchemy_identity_maps": session_usage(),
+    }
+    for device, index in profile_indexes().items():
+        reports[f"profile_index.{device}"] = index.memory_usage()
+    return reports
+
+
+def memory_report() -> Dict:
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "structures": structures(),
+        "tracemalloc": tracer.status(),
+    }
+
+
+def log_line(report: Optional[Dict] = None) -> str:
+    """One line summarizing ``report`` (default: a fresh memory_report())."""
+    report = report or memory_report()
+    parts = [f"rss {report['rss_bytes'] / 2**20:.1f} MB" if report["rss_bytes"] else "rss ?"]
+    for name, usage in report["structures"].items():
+        part = f"{name} {usage['entries']} ({usage['bytes'] / 2**20:.2f} MB)"
+        if usage["evictions"]:
+            part += f" evicted {usage['evictions']}"
+        parts.append(part)
+    return f"🧠 memory [{report['pid']}]: " + " | ".join(parts)
+
+
+class _Logger:
+    """Daemon thread printing log_line() every ``interval`` seconds."""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, interval: float):
+        if interval <= 0 or self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                print(log_line(), flush=True)
+
+        self._thread = threading.Thread(target=run, name="memory-log", daemon=True)
+        self._thread.start()
+
+
+memory_logger = _Logger()
+
+
+# ── tracemalloc ─────────────────────────────────────────────────
+
+class SnapshotTracer:
+    """Numbered tracemalloc snapshots (the last ``keep``) and the differences between them."""
+
+    def __init__(self, keep: int = 8):
+        self.keep = keep
+        self._snapshots: "OrderedDict[int, tuple]" = OrderedDict()  # id → (taken_at, snapshot)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def status(self) -> Dict:
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "snapshots": [
+                {"id": snapshot_id, "taken_at": taken_at} for snapshot_id, (taken_at, _) in self._snapshots.items()
+            ],
+        }
+
+    def take(self, frames: int = 1) -> Dict:
+        """Take a snapshot, starting tracing (with ``frames`` frames per trace) if it is off."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with self._lock:
+            snapshot_id, self._next_id = self._next_id, self._next_id + 1
+            self._snapshots[snapshot_id] = (time.time(), snapshot)
+            while len(self._snapshots) > self.keep:
+                self._snapshots.popitem(last=False)
+        return {"id": snapshot_id, "traced_bytes": tracemalloc.get_traced_memory()[0]}
+
+    def diff(self, base_id: int, target_id: Optional[int] = None, top: int = 20, group_by: str = "lineno") -> Dict:
+        """
+        Allocation sites that grew the most from snapshot ``base_id`` to
+        ``target_id`` (default: the latest).
+
+        Raises:
+            KeyError: unknown snapshot id
+        """
+        with self._lock:
+            target_id = target_id or next(reversed(self._snapshots), None)
+            base, target = self._snapshots[base_id], self._snapshots[target_id]
+        stats = target[1].compare_to(base[1], group_by)
+        return {
+            "base": base_id,
+            "target": target_id,
+            "seconds": round(target[0] - base[0], 1),
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [
+                {
+                    "where": str(stat.traceback[0]) if stat.traceback else "?",
+                    "size_bytes": stat.size,
+                    "size_diff_bytes": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:top]
+            ],
+        }
+
+    def stop(self):
+        """Stop tracing and drop every snapshot."""
+        with self._lock:
+            self._snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+tracer = SnapshotTracer()
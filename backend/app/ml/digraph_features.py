@@ -0,0 +1,124 @@
+"""
+KeyAuth - Hashed Per-Digraph Timing Features
+Optional per-key-pair latency features in a fixed-width sparse vector.
+
+The global feature vector ignores which keys were typed. Here every
+consecutive key pair (digraph) is hashed into one of DIGRAPH_HASH_BUCKETS
+buckets and the bucket stores the mean press-to-press latency of the pairs
+that landed in it. Only touched buckets are kept, so a vector costs
+8 bytes per distinct bucket and the dimensionality stays bounded no matter
+how large the key vocabulary gets.
+
+Packed storage format (little-endian, records simply concatenated so a new
+sample is appended without rewriting the old ones):
+  uint32 0x80000000 | n_buckets, uint32 nnz,
+  nnz × uint32 bucket index, nnz × float32 mean latency (ms)
+
+Bucket indices only mean something for the bucket count they were hashed
+with, so vectors of different counts (DIGRAPH_HASH_BUCKETS changed since
+enrollment) are never compared. Records written before the count was stored
+start directly with nnz (high bit clear) and are taken to match.
+"""
+import struct
+import zlib
+from typing import List, NamedTuple, Optional
+import numpy as np
+from app.ml.keystrokes import KeystrokeArrays
+from app.config import settings
+
+_NNZ = struct.Struct("<I")
+_HAS_BUCKETS = 0x80000000  # High bit of a record's first word; nnz never sets it
+
+
+class SparseVector(NamedTuple):
+    """Sorted bucket indices with their mean latencies."""
+    indices: np.ndarray  # uint32, strictly increasing
+    values: np.ndarray   # float32
+    n_buckets: Optional[int] = None  # Bucket count the digraphs were hashed into (None: unrecorded)
+
+
+def _bucket(first: str, second: str, n_buckets: int) -> int:
+    # crc32 rather than hash(): stable across processes and restarts
+    return zlib.crc32(f"{first}\x00{second}".encode("utf-8")) % n_buckets
+
+
+def extract_digraph_features(arrays: KeystrokeArrays, n_buckets: int) -> SparseVector:
+    """Mean press-to-press latency per hashed digraph bucket."""
+    keys = arrays.keys
+    if len(keys) < 2:
+        return SparseVector(np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float32), n_buckets)
+
+    buckets = np.fromiter(
+        (_bucket(keys[i - 1], keys[i], n_buckets) for i in range(1, len(keys))),
+        dtype=np.int64,
+        count=len(keys) - 1,
+    )
+    latencies = np.diff(arrays.press_times)
+    sums = np.bincount(buckets, weights=latencies, minlength=n_buckets)
+    counts = np.bincount(buckets, minlength=n_buckets)
+    touched = np.flatnonzero(counts)
+    return SparseVector(
+        touched.astype(np.uint32),
+        (sums[touched] / counts[touched]).astype(np.float32),
+        n_buckets,
+    )
+
+
+def optional_digraph_features(arrays: KeystrokeArrays) -> Optional[SparseVector]:
+    """Digraph features for a sample, or None when DIGRAPH_FEATURES_ENABLED is off."""
+    if not settings.DIGRAPH_FEATURES_ENABLED:
+        return None
+    return extract_digraph_features(arrays, settings.DIGRAPH_HASH_BUCKETS)
+
+
+def sparse_similarity(a: SparseVector, b: SparseVector) -> Optional[float]:
+    """
+    Similarity (0-1) over the buckets both vectors share.
+
+    Each shared bucket contributes 1 - |x - y| / (|x| + |y|). Returns None
+    when the vectors share no buckets, i.e. there is no digraph evidence, or
+    were hashed into different bucket counts, so their buckets don't correspond.
+    """
+    if a.n_buckets is not None and b.n_buckets is not None and a.n_buckets != b.n_buckets:
+        return None
+    _, ia, ib = np.intersect1d(a.indices, b.indices, assume_unique=True, return_indices=True)
+    if len(ia) == 0:
+        return None
+    x = a.values[ia].astype(np.float64)
+    y = b.values[ib].astype(np.float64)
+    denom = np.abs(x) + np.abs(y)
+    rel = np.divide(np.abs(x - y), denom, out=np.zeros_like(x), where=denom > 0)
+    return float(1.0 - rel.mean())
+
+
+def pack_sparse(vector: SparseVector) -> bytes:
+    """Serialize one sparse vector as a storage record."""
+    header = _NNZ.pack(_HAS_BUCKETS | vector.n_buckets) if vector.n_buckets is not None else b""
+    return (
+        header
+        + _NNZ.pack(len(vector.indices))
+        + vector.indices.astype("<u4").tobytes()
+        + vector.values.astype("<f4").tobytes()
+    )
+
+
+def unpack_sparse_vectors(data: Optional[bytes]) -> List[SparseVector]:
+    """Parse a concatenation of packed records."""
+    vectors: List[SparseVector] = []
+    if not data:
+        return vectors
+    offset = 0
+    while offset < len(data):
+        (nnz,) = _NNZ.unpack_from(data, offset)
+        offset += _NNZ.size
+        n_buckets = None
+        if nnz & _HAS_BUCKETS:
+            n_buckets = nnz & ~_HAS_BUCKETS
+            (nnz,) = _NNZ.unpack_from(data, offset)
+            offset += _NNZ.size
+        indices = np.frombuffer(data, dtype="<u4", count=nnz, offset=offset)
+        offset += 4 * nnz
+        values = np.frombuffer(data, dtype="<f4", count=nnz, offset=offset)
+        offset += 4 * nnz
+        vectors.append(SparseVector(indices, values, n_buckets))
+    return vectors
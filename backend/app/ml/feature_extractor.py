@@ -9,18 +9,28 @@ Features extracted:
   - Typing speed (characters per second)
   - Statistical features (mean, std, min, max, median)
   - Mobile extras: pressure stats, touch size stats
+
+FEATURE_VERSION identifies the layout and definitions of the 36 features.
+It is stored with every profile and enrollment sample; bump it whenever
+extract_features changes, then run ``python -m app.jobs.reextract_features``
+to re-extract stored samples and retrain their profiles.
 """
-from typing import List, Dict
+from typing import List, Dict, Sequence, Tuple, Union
+import numpy as np
 from app.schemas import KeystrokeEvent
+from app.ml.keystrokes import KeystrokeArrays
 from app.ml.utils import compute_statistics
 
+FEATURE_VERSION = 1
+
 
-def extract_features(keystrokes: List[KeystrokeEvent]) -> Dict:
+def extract_features(keystrokes: Union[List[KeystrokeEvent], KeystrokeArrays]) -> Dict:
     """
     Extract a comprehensive feature vector from raw keystroke events.
     
     Args:
-        keystrokes: List of KeystrokeEvent objects with press/release times
+        keystrokes: List of KeystrokeEvent objects with press/release times,
+            or the equivalent columnar KeystrokeArrays
     
     Returns:
         Dict containing:
@@ -30,53 +40,102 @@ def extract_features(keystrokes: List[KeystrokeEvent]) -> Dict:
           - 'flight_times': list of flight times
           - 'typing_speed': chars per second
     """
+    if not isinstance(keystrokes, KeystrokeArrays):
+        keystrokes = KeystrokeArrays.from_events(keystrokes)
     if len(keystrokes) < 2:
         raise ValueError("Need at least 2 keystrokes to extract features")
 
+    press = keystrokes.press_times
+    release = keystrokes.release_times
+
     # ── Dwell Times ─────────────────────────────────────────────
     # How long each key is held down (release - press)
-    dwell_times = []
-    for ks in keystrokes:
-        dwell = ks.release_time - ks.press_time
-        if dwell > 0:
-            dwell_times.append(dwell)
+    dwell = release - press
+    dwell_times = dwell[dwell > 0]
 
     # ── Flight Times ────────────────────────────────────────────
     # Time between releasing one key and pressing the next
-    flight_times = []
-    for i in range(1, len(keystrokes)):
-        flight = keystrokes[i].press_time - keystrokes[i - 1].release_time
-        flight_times.append(flight)
+    flight_times = press[1:] - release[:-1]
 
     # ── Digraph Latencies ───────────────────────────────────────
     # Time between pressing one key and pressing the next (press-to-press)
-    digraph_latencies = []
-    for i in range(1, len(keystrokes)):
-        latency = keystrokes[i].press_time - keystrokes[i - 1].press_time
-        digraph_latencies.append(latency)
+    digraph_latencies = press[1:] - press[:-1]
 
     # ── Typing Speed ────────────────────────────────────────────
-    if len(keystrokes) >= 2:
-        total_time_ms = keystrokes[-1].release_time - keystrokes[0].press_time
-        total_time_sec = max(total_time_ms / 1000.0, 0.001)
-        typing_speed = len(keystrokes) / total_time_sec
-    else:
-        typing_speed = 0.0
+    total_time_ms = float(release[-1] - press[0])
+    total_time_sec = max(total_time_ms / 1000.0, 0.001)
+    typing_speed = len(keystrokes) / total_time_sec
+
+    return build_features(
+        dwell_times,
+        flight_times,
+        digraph_latencies,
+        typing_speed,
+        _present(keystrokes.pressure),
+        _present(keystrokes.touch_size),
+    )
+
+
+def build_features(
+    dwell_times: np.ndarray,
+    flight_times: np.ndarray,
+    digraph_latencies: np.ndarray,
+    typing_speed: float,
+    pressures: np.ndarray,
+    touch_sizes: np.ndarray,
+) -> Dict:
+    """
+    Assemble the feature dict from already-derived timing series.
 
+    Shared by extract_features and the streaming accumulator so both produce
+    identical vectors. Returns the same dict as extract_features.
+    """
     # ── Statistical Features ────────────────────────────────────
     dwell_stats = compute_statistics(dwell_times)
     flight_stats = compute_statistics(flight_times)
     digraph_stats = compute_statistics(digraph_latencies)
 
     # ── Mobile Features (pressure & touch size) ─────────────────
-    pressures = [ks.pressure for ks in keystrokes if ks.pressure is not None]
-    touch_sizes = [ks.touch_size for ks in keystrokes if ks.touch_size is not None]
-    pressure_stats = compute_statistics(pressures) if pressures else compute_statistics([])
-    touch_stats = compute_statistics(touch_sizes) if touch_sizes else compute_statistics([])
+    pressure_stats = compute_statistics(pressures)
+    touch_stats = compute_statistics(touch_sizes)
+
+    feature_vector = feature_vector_from_stats(
+        dwell_stats, flight_stats, digraph_stats, typing_speed, pressure_stats, touch_stats,
+    )
+
+    details = {
+        "dwell_time_mean": round(dwell_stats["mean"], 2),
+        "dwell_time_std": round(dwell_stats["std"], 2),
+        "flight_time_mean": round(flight_stats["mean"], 2),
+        "flight_time_std": round(flight_stats["std"], 2),
+        "digraph_latency_mean": round(digraph_stats["mean"], 2),
+        "typing_speed": round(typing_speed, 2),
+        "pressure_mean": round(pressure_stats["mean"], 4),
+        "touch_size_mean": round(touch_stats["mean"], 4),
+        "feature_count": len(feature_vector),
+    }
+
+    return {
+        "vector": feature_vector,
+        "details": details,
+        "dwell_times": dwell_times.tolist(),
+        "flight_times": flight_times.tolist(),
+        "typing_speed": typing_speed,
+    }
 
+
+def feature_vector_from_stats(
+    dwell_stats: Dict[str, float],
+    flight_stats: Dict[str, float],
+    digraph_stats: Dict[str, float],
+    typing_speed: float,
+    pressure_stats: Dict[str, float],
+    touch_stats: Dict[str, float],
+) -> List[float]:
+    """Lay out per-series statistics in the fixed 36-feature order."""
     # ── Build Feature Vector ────────────────────────────────────
     # Consistent ordering for ML model input
-    feature_vector = [
+    return [
         # Dwell time stats (7 features)
         dwell_stats["mean"],
         dwell_stats["std"],
@@ -122,22 +181,96 @@ def extract_features(keystrokes: List[KeystrokeEvent]) -> Dict:
     ]
     # Total: 36 features
 
-    details = {
-        "dwell_time_mean": round(dwell_stats["mean"], 2),
-        "dwell_time_std": round(dwell_stats["std"], 2),
-        "flight_time_mean": round(flight_stats["mean"], 2),
-        "flight_time_std": round(flight_stats["std"], 2),
-        "digraph_latency_mean": round(digraph_stats["mean"], 2),
-        "typing_speed": round(typing_speed, 2),
-        "pressure_mean": round(pressure_stats["mean"], 4),
-        "touch_size_mean": round(touch_stats["mean"], 4),
-        "feature_count": len(feature_vector),
-    }
 
-    return {
-        "vector": feature_vector,
-        "details": details,
-        "dwell_times": dwell_times,
-        "flight_times": flight_times,
-        "typing_speed": typing_speed,
-    }
+def _present(column) -> np.ndarray:
+    """Drop missing (NaN) entries from an optional mobile column."""
+    if column is None:
+        return np.empty(0)
+    return column[~np.isnan(column)]
+
+
+# ── Batch Extraction ────────────────────────────────────────────
+
+def extract_feature_matrix(samples: Sequence[KeystrokeArrays]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    extract_features' vectors for many samples at once.
+
+    Each timing series of every sample is padded with NaN into one matrix,
+    so every statistic is computed for the whole batch by a handful of NumPy
+    calls instead of one extract_features call per sample.
+
+    Returns:
+        (matrix, valid): the (n, 36) feature matrix, and a mask of the
+        samples with at least 2 keystrokes (the others' rows are zero)
+    """
+    n = len(samples)
+    lengths = np.array([len(s) for s in samples], dtype=np.int64)
+    valid = lengths >= 2
+    width = int(lengths.max()) if n else 0
+    press = _padded([s.press_times for s in samples], width)
+    release = _padded([s.release_times for s in samples], width)
+
+    dwell = release - press
+    dwell[~(dwell > 0)] = np.nan
+    flight = press[:, 1:] - release[:, :-1]
+    digraph = press[:, 1:] - press[:, :-1]
+
+    last = release[np.arange(n), np.maximum(lengths - 1, 0)] if width else np.zeros(n)
+    first = press[:, 0] if width else np.zeros(n)
+    total_sec = np.maximum((last - first) / 1000.0, 0.001)
+    typing_speed = lengths / total_sec
+
+    matrix = np.hstack([
+        _batch_statistics(dwell),
+        _batch_statistics(flight),
+        _batch_statistics(digraph),
+        typing_speed[:, None],
+        _batch_statistics(_padded([s.pressure for s in samples], width)),
+        _batch_statistics(_padded([s.touch_size for s in samples], width)),
+    ])
+    matrix[~valid] = 0.0
+    return matrix, valid
+
+
+def _padded(columns: Sequence, width: int) -> np.ndarray:
+    """Rows of ``columns`` (None = all missing) in an (n, width) matrix padded with NaN."""
+    out = np.full((len(columns), width), np.nan)
+    for i, column in enumerate(columns):
+        if column is not None:
+            out[i, :len(column)] = column
+    return out
+
+
+def _batch_statistics(values: np.ndarray) -> np.ndarray:
+    """compute_statistics of every row, ignoring NaN, as an (n, 7) matrix; all-NaN rows are zero."""
+    n = len(values)
+    if values.shape[1] == 0:
+        return np.zeros((n, 7))
+    ordered = np.sort(values, axis=1)  # NaN sorts last
+    counts = (~np.isnan(ordered)).sum(axis=1)
+    present = counts > 0
+    safe = np.maximum(counts, 1)
+    rows = np.arange(n)
+
+    mean = np.nansum(ordered, axis=1) / safe
+    std = np.sqrt(np.nansum((ordered - mean[:, None]) ** 2, axis=1) / safe)
+
+    def quantile(q: float) -> np.ndarray:
+        # NumPy's default (linear) interpolation between the closest ranks
+        position = q * (safe - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        low, high = ordered[rows, lower], ordered[rows, upper]
+        return low + (position - lower) * (high - low)
+
+    stats = np.column_stack([
+        mean,
+        std,
+        ordered[rows, 0],
+        ordered[rows, safe - 1],
+        quantile(0.5),
+        quantile(0.25),
+        quantile(0.75),
+    ])
+    stats[~present] = 0.0
+    return stats
@@ -0,0 +1,91 @@
+"""
+KeyAuth - Packed Feature Matrix
+A profile's enrollment feature vectors as one float32 matrix blob, the only
+stored copy of the training data.
+
+Format (little-endian):
+  4s magic "KFM1" | u32 n_features | n_rows × n_features float32
+
+The header is 8 bytes so rows stay 8-byte aligned, and a new enrollment
+sample is appended by concatenating one packed row — nothing already
+stored is re-encoded.
+"""
+import struct
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from app.ml.digraph_features import optional_digraph_features, pack_sparse
+from app.ml.feature_extractor import extract_feature_matrix
+from app.ml.keystrokes import KeystrokeArrays
+
+MAGIC = b"KFM1"
+_HEADER = struct.Struct("<4sI")
+
+
+def pack_rows(rows: Sequence[Sequence[float]]) -> Optional[bytes]:
+    """Pack a list of equal-length vectors; None when there are none."""
+    if rows is None or len(rows) == 0:
+        return None
+    matrix = np.asarray(rows, dtype="<f4")
+    return _HEADER.pack(MAGIC, matrix.shape[1]) + matrix.tobytes()
+
+
+def append_row(blob: Optional[bytes], row: Sequence[float]) -> bytes:
+    """Return ``blob`` with one more row; starts a new matrix when blob is empty."""
+    if not blob:
+        return pack_rows([row])
+    _, n_features = _HEADER.unpack_from(blob, 0)
+    if len(row) != n_features:
+        raise ValueError(f"Feature vector has {len(row)} values; this profile stores {n_features}")
+    return blob + np.asarray(row, dtype="<f4").tobytes()
+
+
+def unpack_matrix(blob) -> np.ndarray:
+    """Read-only float32 (n_rows, n_features) view over a packed blob (or any buffer)."""
+    magic, n_features = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a packed feature matrix")
+    return np.frombuffer(blob, dtype="<f4", offset=_HEADER.size).reshape(-1, n_features)
+
+
+def row_count(blob: Optional[bytes]) -> int:
+    if not blob:
+        return 0
+    _, n_features = _HEADER.unpack_from(blob, 0)
+    return (len(blob) - _HEADER.size) // (4 * n_features)
+
+
+def profile_matrix(profile) -> Optional[bytes]:
+    """
+    The profile's packed matrix, packing the legacy ``feature_vectors`` JSON
+    on the fly for rows not yet consolidated (see app.jobs.consolidate_vectors).
+    """
+    if profile.feature_matrix:
+        return profile.feature_matrix
+    return pack_rows(profile.feature_vectors)
+
+
+def profile_vectors(profile) -> Optional[np.ndarray]:
+    """The profile's training vectors as a float32 matrix, or None when it has none."""
+    blob = profile_matrix(profile)
+    return unpack_matrix(blob) if blob else None
+
+
+def profile_feature_version(profile) -> int:
+    """FEATURE_VERSION the profile's rows were extracted with (rows stored before versions are version 1)."""
+    return profile.feature_version or 1
+
+
+def extract_profile_matrix(samples: List[KeystrokeArrays], schema) -> Tuple[bytes, Optional[bytes]]:
+    """
+    Packed feature matrix (projected to ``schema``) and digraph vectors of
+    ``samples``, as a profile stores them, using the batch extractor.
+
+    Raises:
+        ValueError: a sample has too few keystrokes
+    """
+    matrix, valid = extract_feature_matrix(samples)
+    if not valid.all():
+        raise ValueError(f"Sample {int(np.argmin(valid)) + 1}: Need at least 2 keystrokes to extract features")
+    digraphs = [optional_digraph_features(arrays) for arrays in samples]
+    packed = b"".join(pack_sparse(d) for d in digraphs if d is not None)
+    return pack_rows(schema.project(matrix)), packed or None
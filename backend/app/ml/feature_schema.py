@@ -0,0 +1,103 @@
+"""
+KeyAuth - Device Feature Schemas
+Which of the 36 extracted features a profile's model is trained on.
+
+extract_features always lays out the full 36-feature vector, but on a
+keyboard the pressure and touch-size statistics (positions 22-35) are always
+zero. Each device class therefore has a versioned schema naming the
+positions it keeps: web profiles store and score only the 22 timing
+features, mobile profiles keep all 36. A profile records its schema name so
+vectors are always projected the same way they were when it was enrolled;
+profiles stored before schemas existed have none and use the full layout.
+
+New device classes (or a new version of one) are added with
+register_schema().
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+FULL_DIM = 36
+TIMING_FEATURES = tuple(range(22))  # Dwell, flight, digraph stats and typing speed
+
+
+@dataclass(frozen=True)
+class FeatureSchema:
+    """A named, ordered subset of the full feature layout."""
+
+    name: str  # "<device>/v<version>", stored on the profile
+    indices: Tuple[int, ...]  # Positions in the full 36-feature vector
+
+    @property
+    def dim(self) -> int:
+        return len(self.indices)
+
+    def covers(self, other: "FeatureSchema") -> bool:
+        """True when every feature of ``other`` can be taken from this schema's vectors."""
+        return set(other.indices) <= set(self.indices)
+
+    def project(self, vectors, source: Optional["FeatureSchema"] = None) -> np.ndarray:
+        """
+        Reduce a vector (or a matrix of row vectors) laid out in ``source``
+        (default: the full layout) to this schema.
+
+        Raises:
+            ValueError: ``source`` lacks a feature this schema needs
+        """
+        source = source or FULL
+        if source == self:
+            return np.asarray(vectors)
+        return np.asarray(vectors)[..., _positions(source, self)]
+
+
+@lru_cache(maxsize=None)
+def _positions(source: FeatureSchema, target: FeatureSchema) -> np.ndarray:
+    if not source.covers(target):
+        raise ValueError(f"Feature schema {source.name} cannot be projected to {target.name}")
+    where = {feature: i for i, feature in enumerate(source.indices)}
+    return np.asarray([where[feature] for feature in target.indices], dtype=np.intp)
+
+
+FULL = FeatureSchema("full/v1", tuple(range(FULL_DIM)))  # Profiles stored before schemas
+WEB_V1 = FeatureSchema("web/v1", TIMING_FEATURES)
+MOBILE_V1 = FeatureSchema("mobile/v1", tuple(range(FULL_DIM)))
+
+SCHEMAS: Dict[str, FeatureSchema] = {}
+DEVICE_SCHEMAS: Dict[str, FeatureSchema] = {}  # Device class → schema new profiles use
+DEFAULT_DEVICE = "mobile"  # Unrecognized device types keep every feature
+
+
+def register_schema(schema: FeatureSchema, device_type: Optional[str] = None) -> FeatureSchema:
+    """Register a schema; with ``device_type`` it becomes that device's current schema."""
+    if any(not 0 <= i < FULL_DIM for i in schema.indices):
+        raise ValueError(f"Feature schema {schema.name} indexes outside the {FULL_DIM}-feature layout")
+    SCHEMAS[schema.name] = schema
+    if device_type is not None:
+        DEVICE_SCHEMAS[device_type] = schema
+    return schema
+
+
+register_schema(FULL)
+register_schema(WEB_V1, "web")
+register_schema(MOBILE_V1, "mobile")
+
+
+def device_class(device_type: Optional[str]) -> str:
+    """The device class a request's device_type is routed to ("both" etc. fall back to mobile)."""
+    return device_type if device_type in DEVICE_SCHEMAS else DEFAULT_DEVICE
+
+
+def schema_for_device(device_type: Optional[str]) -> FeatureSchema:
+    """The schema new profiles for this device type are enrolled with."""
+    return DEVICE_SCHEMAS[device_class(device_type)]
+
+
+def get_schema(name: Optional[str]) -> FeatureSchema:
+    """Look up a stored schema name (None = the full legacy layout)."""
+    if name is None:
+        return FULL
+    try:
+        return SCHEMAS[name]
+    except KeyError:
+        raise ValueError(f"Unknown feature schema '{name}'") from None
@@ -0,0 +1,228 @@
+"""
+KeyAuth - Columnar Keystroke Arrays
+NumPy-backed keystroke container and the packed binary wire format.
+
+Keystrokes can reach the API in three encodings:
+  - JSON list of event objects   {"keystrokes": [{"key", "press_time", ...}, ...]}
+  - JSON parallel arrays          {"columns": {"keys": [...], "press_times": [...], ...}}
+  - Packed binary columns         Content-Type: application/x-keyauth-columns
+
+All of them decode into a KeystrokeArrays instance, which is what the feature
+extractor works on.
+
+Packed binary layout (little-endian):
+  offset  size          field
+  0       4             magic b"KSC1"
+  4       4   uint32    n — number of keystrokes
+  8       4   uint32    flags — bit 0: pressure column, bit 1: touch_size column
+  12      4   uint32    meta_len — UTF-8 JSON metadata (username, device_type, ...)
+  16      4   uint32    keys_len — UTF-8 key names separated by NUL bytes
+  20      meta_len      metadata
+  ...     keys_len      keys
+  ...     0-7           zero padding up to an 8-byte boundary
+  ...     8n  float64   press_times
+  ...     8n  float64   release_times
+  ...     8n  float64   pressure      (if flag bit 0)
+  ...     8n  float64   touch_size    (if flag bit 1)
+"""
+import json
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+BINARY_CONTENT_TYPE = "application/x-keyauth-columns"
+
+_MAGIC = b"KSC1"
+_HEADER = struct.Struct("<4sIIII")
+_FLAG_PRESSURE = 0x1
+_FLAG_TOUCH_SIZE = 0x2
+_F8 = np.dtype("<f8")
+
+
+@dataclass
+class KeystrokeArrays:
+    """
+    Parallel-array view of a typing sample.
+
+    ``pressure`` and ``touch_size`` are NaN where a keystroke carried no value,
+    or None when the whole column is absent.
+    """
+    keys: List[str]
+    press_times: np.ndarray
+    release_times: np.ndarray
+    pressure: Optional[np.ndarray] = None
+    touch_size: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.press_times)
+
+    @classmethod
+    def from_columns(
+        cls,
+        keys: Iterable[str],
+        press_times,
+        release_times,
+        pressure=None,
+        touch_size=None,
+    ) -> "KeystrokeArrays":
+        """Build from parallel sequences, validating that their lengths agree."""
+        instance = cls(
+            keys=list(keys),
+            press_times=_as_column(press_times),
+            release_times=_as_column(release_times),
+            pressure=_as_column(pressure) if pressure is not None else None,
+            touch_size=_as_column(touch_size) if touch_size is not None else None,
+        )
+        n = len(instance.keys)
+        for name in ("press_times", "release_times", "pressure", "touch_size"):
+            column = getattr(instance, name)
+            if column is not None and len(column) != n:
+                raise ValueError(f"Column '{name}' has {len(column)} values, expected {n}")
+        return instance
+
+    @classmethod
+    def from_events(cls, keystrokes) -> "KeystrokeArrays":
+        """Build from a list of KeystrokeEvent objects (the JSON object form)."""
+        return cls(
+            keys=[ks.key for ks in keystrokes],
+            press_times=_as_column([ks.press_time for ks in keystrokes]),
+            release_times=_as_column([ks.release_time for ks in keystrokes]),
+            pressure=_as_column([ks.pressure for ks in keystrokes]),
+            touch_size=_as_column([ks.touch_size for ks in keystrokes]),
+        )
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "KeystrokeArrays":
+        """Build from the JSON object form (the inverse of to_records)."""
+        return cls(
+            keys=[r["key"] for r in records],
+            press_times=_as_column([r["press_time"] for r in records]),
+            release_times=_as_column([r["release_time"] for r in records]),
+            pressure=_as_column([r.get("pressure") for r in records]),
+            touch_size=_as_column([r.get("touch_size") for r in records]),
+        )
+
+    def to_records(self) -> List[Dict]:
+        """Return the JSON object form, as stored in EnrollmentSample.raw_keystrokes."""
+        n = len(self.keys)
+        pressure = _optional_list(self.pressure, n)
+        touch_size = _optional_list(self.touch_size, n)
+        return [
+            {
+                "key": key,
+                "press_time": press,
+                "release_time": release,
+                "pressure": p,
+                "touch_size": t,
+            }
+            for key, press, release, p, t in zip(
+                self.keys,
+                self.press_times.tolist(),
+                self.release_times.tolist(),
+                pressure,
+                touch_size,
+            )
+        ]
+
+
+def _as_column(values) -> np.ndarray:
+    """Coerce a sequence of numbers (None → NaN) to a 1-D float64 array."""
+    return np.asarray(values, dtype=np.float64)
+
+
+def _optional_list(column: Optional[np.ndarray], n: int) -> List[Optional[float]]:
+    if column is None:
+        return [None] * n
+    return [None if np.isnan(v) else v for v in column.tolist()]
+
+
+def encode_packed(arrays: KeystrokeArrays, meta: Optional[Dict] = None) -> bytes:
+    """Serialize keystroke arrays plus request metadata to the packed format."""
+    n = len(arrays)
+    flags = 0
+    columns = [arrays.press_times, arrays.release_times]
+    if arrays.pressure is not None:
+        flags |= _FLAG_PRESSURE
+        columns.append(arrays.pressure)
+    if arrays.touch_size is not None:
+        flags |= _FLAG_TOUCH_SIZE
+        columns.append(arrays.touch_size)
+
+    meta_bytes = json.dumps(meta or {}).encode("utf-8")
+    keys_bytes = "\x00".join(arrays.keys).encode("utf-8")
+    head = _HEADER.pack(_MAGIC, n, flags, len(meta_bytes), len(keys_bytes)) + meta_bytes + keys_bytes
+    head += b"\x00" * (-len(head) % 8)
+    return head + b"".join(np.ascontiguousarray(c, dtype=_F8).tobytes() for c in columns)
+
+
+def decode_packed(payload: bytes) -> Tuple[Dict, KeystrokeArrays]:
+    """
+    Parse a packed binary payload into (metadata, KeystrokeArrays).
+
+    The float columns are zero-copy views over ``payload``.
+
+    Raises:
+        ValueError: If the payload is truncated or malformed, or a value is not finite
+    """
+    if len(payload) < _HEADER.size:
+        raise ValueError("Packed keystroke payload is truncated")
+    magic, n, flags, meta_len, keys_len = _HEADER.unpack_from(payload, 0)
+    if magic != _MAGIC:
+        raise ValueError("Not a packed keystroke payload (bad magic)")
+
+    offset = _HEADER.size
+    try:
+        meta = json.loads(payload[offset:offset + meta_len].decode("utf-8")) if meta_len else {}
+        offset += meta_len
+        keys_raw = payload[offset:offset + keys_len].decode("utf-8")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Malformed packed keystroke header: {e}")
+    offset += keys_len
+    offset += -offset % 8
+
+    n_columns = 2 + bool(flags & _FLAG_PRESSURE) + bool(flags & _FLAG_TOUCH_SIZE)
+    if len(payload) != offset + n_columns * n * _F8.itemsize:
+        raise ValueError("Packed keystroke payload size does not match its header")
+    if not isinstance(meta, dict):
+        raise ValueError("Packed keystroke metadata must be a JSON object")
+
+    data = np.frombuffer(payload, dtype=_F8, count=n_columns * n, offset=offset).reshape(n_columns, n)
+    keys = keys_raw.split("\x00") if n else []
+    if len(keys) != n:
+        raise ValueError(f"Packed payload has {len(keys)} keys, expected {n}")
+
+    column = 2
+    pressure = touch_size = None
+    if flags & _FLAG_PRESSURE:
+        pressure = data[column]
+        column += 1
+    if flags & _FLAG_TOUCH_SIZE:
+        touch_size = data[column]
+
+    arrays = KeystrokeArrays(
+        keys=keys,
+        press_times=data[0],
+        release_times=data[1],
+        pressure=pressure,
+        touch_size=touch_size,
+    )
+    check_finite(arrays)
+    return meta, arrays
+
+
+def check_finite(arrays: KeystrokeArrays):
+    """
+    Reject timestamps that are NaN or infinite, and infinite pressure or
+    touch size (NaN there means the keystroke carried no value).
+
+    Raises:
+        ValueError: naming the first offending column
+    """
+    for name in ("press_times", "release_times"):
+        if not np.isfinite(getattr(arrays, name)).all():
+            raise ValueError(f"Column '{name}' must contain only finite numbers")
+    for name in ("pressure", "touch_size"):
+        column = getattr(arrays, name)
+        if column is not None and np.isinf(column).any():
+            raise ValueError(f"Column '{name}' must not contain infinite values")
@@ -6,16 +6,18 @@ Strategy:
   1. When fewer than ENROLLMENT_SAMPLES_REQUIRED samples:
      → Uses statistical distance matching (Manhattan + cosine similarity)
   2. When enough samples are collected:
-     → Trains a Random Forest classifier or One-Class SVM
+     → Fits the profile's scorer (AUTH_SCORER by default, see scorers.py);
+       with IF_SIZING_ENABLED an Isolation Forest is sized to the latency
+       budget (see model_sizing.py)
   3. Returns confidence score 0.0 to 1.0
 """
 import base64
 import pickle
 import numpy as np
-from typing import List, Optional, Tuple
-from sklearn.ensemble import IsolationForest, RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
-from app.ml.utils import manhattan_distance, cosine_similarity, normalize_features
+from typing import Dict, List, Optional, Tuple, Union
+from app.ml.digraph_features import SparseVector, pack_sparse, sparse_similarity, unpack_sparse_vectors
+from app.ml.model_sizing import serving_runtime, size_isolation_forest
+from app.ml.scorers import IsolationForestScorer, Scorer, StatisticalScorer, create_scorer, get_scorer_class
 from app.config import settings
 
 
@@ -25,22 +27,29 @@ class KeystrokeAuthModel:
     
     Supports two modes:
       - Statistical mode (few samples): uses distance-based matching
-      - ML mode (enough samples): uses Isolation Forest for anomaly detection
+      - Trained mode (enough samples): uses the selected pluggable scorer
     """
 
     def __init__(self):
-        self.scaler = StandardScaler()
-        self.model = None
-        self.training_vectors: List[List[float]] = []
+        self.scorer: Optional[Scorer] = None
+        self.training_vectors: Union[List[List[float]], np.ndarray] = []
+        self.digraph_vectors: List[SparseVector] = []
         self.is_trained = False
+        self.model_cost: Optional[Dict] = None  # Set by train(); stored on the profile for auditing
 
-    def add_training_sample(self, feature_vector: List[float]):
-        """Add a feature vector from an enrollment sample."""
+    def add_training_sample(self, feature_vector: List[float], digraph: Optional[SparseVector] = None):
+        """Add a feature vector (and optional hashed digraph vector) from an enrollment sample."""
         self.training_vectors.append(feature_vector)
+        if digraph is not None:
+            self.digraph_vectors.append(digraph)
 
-    def train(self) -> bool:
+    def train(self, scorer_name: Optional[str] = None, impostors: Optional[np.ndarray] = None) -> bool:
         """
         Train the model on collected enrollment samples.
+
+        Args:
+            scorer_name: Registered scorer to fit (defaults to AUTH_SCORER)
+            impostors: Other users' vectors, used to size an Isolation Forest
         
         Returns True if training succeeded, False otherwise.
         """
@@ -48,120 +57,111 @@ class KeystrokeAuthModel:
         if n_samples < 2:
             return False
 
-        X = np.array(self.training_vectors, dtype=np.float64)
-
-        # Fit scaler
-        self.scaler.fit(X)
-        X_scaled = self.scaler.transform(X)
-
         if n_samples >= settings.ENROLLMENT_SAMPLES_REQUIRED:
-            # Use Isolation Forest for anomaly detection
-            # Contamination set low since all training data is "genuine"
-            self.model = IsolationForest(
-                n_estimators=100,
-                contamination=0.1,
-                random_state=42,
-            )
-            self.model.fit(X_scaled)
+            X = np.array(self.training_vectors, dtype=np.float64)
+            name = scorer_name or settings.AUTH_SCORER
+            runtime = serving_runtime()
+            if name == IsolationForestScorer.name and settings.IF_SIZING_ENABLED:
+                self.scorer, sizing = size_isolation_forest(X, impostors, runtime=runtime)
+                self.model_cost = {"scorer": name, **sizing.as_dict()}
+            else:
+                self.scorer = create_scorer(name).fit(X)
+                # Configuration only: timing the scorer here would add ~70 ms to every enrollment
+                # (python -m benchmarks.bench_model_sizing measures scoring time offline)
+                self.model_cost = {"scorer": name, "runtime": runtime}
+                if isinstance(self.scorer, IsolationForestScorer):
+                    self.model_cost["n_estimators"] = len(self.scorer.forest.estimators_)
+                    self.model_cost["max_samples"] = int(self.scorer.forest.max_samples_)
+            self.model_cost["model_bytes"] = len(self.scorer.serialize())
             self.is_trained = True
         else:
-            # Not enough samples for ML — use statistical mode
+            # Not enough samples to fit a scorer — use statistical mode
+            self.scorer = None
             self.is_trained = False
 
         return True
 
-    def authenticate(self, feature_vector: List[float]) -> Tuple[float, str]:
+    def authenticate(self, feature_vector: List[float], digraph: Optional[SparseVector] = None) -> Tuple[float, str]:
         """
         Authenticate a typing sample against the user's profile.
         
         Args:
             feature_vector: Feature vector from the authentication attempt
+            digraph: Optional hashed per-digraph vector for the same attempt
         
         Returns:
             (confidence_score, method): score 0-1, and which method was used
         """
-        if not self.training_vectors:
+        if len(self.training_vectors) == 0:
             return 0.0, "no_profile"
 
-        if self.is_trained and self.model is not None:
-            return self._ml_authenticate(feature_vector), "isolation_forest"
+        if self.is_trained and self.scorer is not None:
+            scorer = self.scorer
         else:
-            return self._statistical_authenticate(feature_vector), "statistical"
-
-    def _ml_authenticate(self, feature_vector: List[float]) -> float:
-        """
-        ML-based authentication using Isolation Forest.
-        
-        The anomaly score is converted to a 0-1 confidence score.
-        """
-        X = np.array([feature_vector], dtype=np.float64)
-        X_scaled = self.scaler.transform(X)
+            scorer = StatisticalScorer().fit(self.training_vectors)
+        confidence, method = scorer.score(feature_vector), scorer.name
 
-        # score_samples returns anomaly score (higher = more normal)
-        raw_score = self.model.score_samples(X_scaled)[0]
+        if digraph is not None and self.digraph_vectors:
+            digraph_confidence = self._digraph_authenticate(digraph)
+            if digraph_confidence is not None:
+                weight = settings.DIGRAPH_WEIGHT
+                confidence = (1 - weight) * confidence + weight * digraph_confidence
+                method += "+digraph"
 
-        # Convert to 0-1 range using sigmoid-like mapping
-        # Isolation Forest scores typically range from -0.5 to 0.5
-        # Map so that ~0 raw score → 0.85 confidence (threshold zone)
-        confidence = 1.0 / (1.0 + np.exp(-10 * (raw_score + 0.1)))
-        return float(np.clip(confidence, 0.0, 1.0))
+        return confidence, method
 
-    def _statistical_authenticate(self, feature_vector: List[float]) -> float:
-        """
-        Statistical distance-based authentication.
-        
-        Computes average distance to all training vectors and converts
-        to a confidence score. Uses a blend of Manhattan distance and
-        cosine similarity.
+    def _digraph_authenticate(self, digraph: SparseVector) -> Optional[float]:
         """
-        if not self.training_vectors:
-            return 0.0
-
-        # Normalize all vectors
-        test_norm = normalize_features(feature_vector)
-
-        distances = []
-        similarities = []
-        for train_vec in self.training_vectors:
-            train_norm = normalize_features(train_vec)
-            dist = manhattan_distance(test_norm, train_norm)
-            sim = cosine_similarity(test_norm, train_norm)
-            distances.append(dist)
-            similarities.append(sim)
+        Sparse statistical scorer over hashed per-digraph latencies.
 
-        avg_distance = np.mean(distances)
-        avg_similarity = np.mean(similarities)
-
-        # Convert distance to confidence (lower distance = higher confidence)
-        # Typical normalized Manhattan distances range from 0 to ~len(vector)
-        n_features = len(feature_vector)
-        distance_confidence = max(0.0, 1.0 - (avg_distance / (n_features * 1.5)))
-
-        # Blend distance confidence with cosine similarity
-        # 60% distance, 40% cosine similarity
-        confidence = 0.6 * distance_confidence + 0.4 * max(0.0, avg_similarity)
-
-        return float(np.clip(confidence, 0.0, 1.0))
+        Averages the shared-bucket similarity against every enrollment
+        vector; None when no enrollment sample shares a digraph bucket.
+        """
+        similarities = [
+            sim for sim in (sparse_similarity(digraph, train) for train in self.digraph_vectors)
+            if sim is not None
+        ]
+        if not similarities:
+            return None
+        return float(np.clip(np.mean(similarities), 0.0, 1.0))
 
     def serialize(self) -> str:
-        """Serialize the model to a base64-encoded string for storage."""
+        """
+        Serialize the model to a base64-encoded string for storage.
+
+        Training vectors are not included: they live in the profile's packed
+        feature matrix and are passed back in to deserialize().
+        """
+        trained = self.is_trained and self.scorer is not None
         data = {
-            "training_vectors": self.training_vectors,
+            "digraph_vectors": b"".join(pack_sparse(v) for v in self.digraph_vectors),
             "is_trained": self.is_trained,
-            "scaler": self.scaler if self.is_trained else None,
-            "model": self.model if self.is_trained else None,
+            "scorer": self.scorer.name if trained else None,
+            "scorer_data": self.scorer.serialize() if trained else None,
         }
         return base64.b64encode(pickle.dumps(data)).decode("utf-8")
 
     @classmethod
-    def deserialize(cls, data_str: str) -> "KeystrokeAuthModel":
-        """Deserialize a model from a base64-encoded string."""
+    def deserialize(cls, data_str: str, training_vectors: Optional[np.ndarray] = None) -> "KeystrokeAuthModel":
+        """
+        Deserialize a model from a base64-encoded string.
+
+        Args:
+            data_str: Output of serialize()
+            training_vectors: The profile's feature matrix (older models
+                embedded their own copy, used when this is None)
+        """
         data = pickle.loads(base64.b64decode(data_str.encode("utf-8")))
         instance = cls()
-        instance.training_vectors = data.get("training_vectors", [])
+        if training_vectors is not None:
+            instance.training_vectors = training_vectors
+        else:
+            instance.training_vectors = data.get("training_vectors", [])
+        instance.digraph_vectors = unpack_sparse_vectors(data.get("digraph_vectors"))
         instance.is_trained = data.get("is_trained", False)
-        if data.get("scaler") is not None:
-            instance.scaler = data["scaler"]
-        if data.get("model") is not None:
-            instance.model = data["model"]
+        if data.get("scorer") is not None:
+            instance.scorer = get_scorer_class(data["scorer"]).load(data["scorer_data"])
+        elif data.get("model") is not None:
+            # Stored before scorers were pluggable: a fitted scaler + forest
+            instance.scorer = IsolationForestScorer(data["scaler"], data["model"])
         return instance
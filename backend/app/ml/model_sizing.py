@@ -0,0 +1,181 @@
+"""
+KeyAuth - Isolation Forest Sizing
+Chooses, per user, the smallest Isolation Forest that is fast enough to
+score and separates genuine from impostor attempts about as well as the
+full 100-tree model.
+
+Separation is the AUC of held-out genuine scores against impostor scores.
+Genuine attempts are each left-out enrollment vector plus jittered copies
+of it (noise at the user's own per-feature spread), so that a handful of
+enrollment samples still gives a fine-grained AUC; impostors are other
+enrolled users' vectors, or perturbed copies of this user's when there are
+too few. Candidates are
+tried from the cheapest up; the first whose AUC is within ``tolerance`` of
+the full model's and whose measured single-vector scoring time fits the
+budget is fitted on all enrollment vectors and used. Scoring time is
+measured on the runtime that will serve the model: sklearn, or the
+flattened forest when a model snapshot is configured.
+"""
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from app.ml.scorers import IsolationForestScorer, Scorer
+from app.config import settings
+
+CANDIDATE_ESTIMATORS = (10, 20, 40, 70, 100)
+CANDIDATE_MAX_SAMPLES = (0.6, 1.0)  # Fraction of the enrollment vectors each tree sees
+FULL_MODEL = (100, "auto")
+MIN_IMPOSTORS = 32
+GENUINE_JITTER = 8  # Jittered copies per held-out vector
+_TIMING_REPEATS = 30
+
+
+@dataclass
+class SizingResult:
+    """The chosen forest and the measurements behind the choice."""
+
+    n_estimators: int
+    max_samples: int
+    score_us: float
+    separation: float
+    full_separation: float
+    full_score_us: float
+    within_tolerance: bool
+    within_budget: bool
+    runtime: str
+    candidates_tried: int
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+def separation(genuine: np.ndarray, impostor: np.ndarray) -> float:
+    """AUC: probability a genuine score exceeds an impostor score (ties count half)."""
+    genuine = np.asarray(genuine)[:, None]
+    impostor = np.asarray(impostor)[None, :]
+    return float((genuine > impostor).mean() + 0.5 * (genuine == impostor).mean())
+
+
+def synthetic_impostors(X: np.ndarray, n: int, seed: int = 0) -> np.ndarray:
+    """Stand-in impostors: this user's vectors with every feature rescaled by ±~25%."""
+    rng = np.random.default_rng(seed)
+    rows = X[rng.integers(0, len(X), n)]
+    return rows * rng.lognormal(0.0, 0.25, rows.shape)
+
+
+def _held_out_genuine(x: np.ndarray, train: np.ndarray, seed: int) -> np.ndarray:
+    """A held-out vector plus GENUINE_JITTER copies jittered at the training spread."""
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0.0, 1.0, (GENUINE_JITTER, len(x))) * train.std(axis=0)
+    return np.vstack([x, x + noise])
+
+
+def _serving_scorer(scorer: Scorer, runtime: str) -> Scorer:
+    if runtime != "snapshot" or not isinstance(scorer, IsolationForestScorer):
+        return scorer
+    from app.ml.snapshot import PackedForestScorer, pack_forest  # snapshot imports the model module
+
+    forest, norm = pack_forest(scorer.forest)
+    return PackedForestScorer(scorer.scaler.mean_, scorer.scaler.scale_, forest, norm)
+
+
+def serving_runtime() -> str:
+    return "snapshot" if settings.MODEL_SNAPSHOT_PATH else "sklearn"
+
+
+def measure_score_us(scorer: Scorer, X: np.ndarray, runtime: str = "sklearn") -> float:
+    """Median single-vector scoring time in microseconds on ``runtime``."""
+    serving = _serving_scorer(scorer, runtime)
+    times = []
+    for i in range(_TIMING_REPEATS):
+        x = X[i % len(X)]
+        start = time.perf_counter()
+        serving.score(x)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1e6)
+
+
+def _evaluate(
+    X: np.ndarray, impostors: np.ndarray, n_estimators: int, max_samples: Union[float, str], runtime: str
+) -> Tuple[float, float]:
+    """Leave-one-out AUC and scoring time for one forest size."""
+    genuine, impostor = [], []
+    score_us = None
+    mask = np.ones(len(X), dtype=bool)
+    for i in range(len(X)):
+        mask[i] = False
+        scorer = IsolationForestScorer(n_estimators=n_estimators, max_samples=max_samples).fit(X[mask])
+        mask[i] = True
+        genuine.append(scorer.score_many(_held_out_genuine(X[i], X[mask], seed=i)))
+        impostor.append(scorer.score_many(impostors))
+        if score_us is None:
+            score_us = measure_score_us(scorer, X, runtime)
+    return separation(np.concatenate(genuine), np.concatenate(impostor)), score_us
+
+
+def size_isolation_forest(
+    X: np.ndarray,
+    impostors: Optional[np.ndarray] = None,
+    latency_budget_ms: Optional[float] = None,
+    tolerance: Optional[float] = None,
+    runtime: Optional[str] = None,
+) -> Tuple[IsolationForestScorer, SizingResult]:
+    """
+    Fit the smallest adequate forest on ``X`` (one user's enrollment vectors).
+
+    Args:
+        impostors: Other users' vectors in the same feature schema; topped up
+            with synthetic ones when fewer than MIN_IMPOSTORS
+        latency_budget_ms: Max single-vector scoring time (IF_LATENCY_BUDGET_MS)
+        tolerance: Max AUC loss against the full model (IF_SIZING_TOLERANCE)
+        runtime: "sklearn" or "snapshot" (default: snapshot when MODEL_SNAPSHOT_PATH is set)
+    """
+    X = np.asarray(X, dtype=np.float64)
+    budget_us = (latency_budget_ms if latency_budget_ms is not None else settings.IF_LATENCY_BUDGET_MS) * 1e3
+    tolerance = tolerance if tolerance is not None else settings.IF_SIZING_TOLERANCE
+    runtime = runtime or serving_runtime()
+
+    pool: List[np.ndarray] = []
+    if impostors is not None and len(impostors):
+        pool.append(np.asarray(impostors, dtype=np.float64))
+    have = sum(len(p) for p in pool)
+    if have < MIN_IMPOSTORS:
+        pool.append(synthetic_impostors(X, MIN_IMPOSTORS - have))
+    impostors = np.concatenate(pool)
+
+    full_auc, full_us = _evaluate(X, impostors, *FULL_MODEL, runtime)
+    candidates = sorted(
+        ((n, m) for n in CANDIDATE_ESTIMATORS for m in CANDIDATE_MAX_SAMPLES),
+        key=lambda c: (c[0] * c[1], c[0]),
+    )
+    chosen = None
+    tried = 0
+    fallback = (FULL_MODEL, full_auc, full_us)
+    for n_estimators, max_samples in candidates:
+        if (n_estimators, max_samples) == (100, 1.0) and len(X) <= 256:
+            auc, score_us = full_auc, full_us  # Same forest as "auto" below 256 samples
+        else:
+            auc, score_us = _evaluate(X, impostors, n_estimators, max_samples, runtime)
+        tried += 1
+        if score_us <= budget_us and (fallback[2] > budget_us or auc > fallback[1]):
+            fallback = ((n_estimators, max_samples), auc, score_us)  # Best in budget so far
+        if full_auc - auc <= tolerance and score_us <= budget_us:
+            chosen = ((n_estimators, max_samples), auc, score_us)
+            break
+    (n_estimators, max_samples), auc, score_us = chosen or fallback
+
+    scorer = IsolationForestScorer(n_estimators=n_estimators, max_samples=max_samples).fit(X)
+    result = SizingResult(
+        n_estimators=n_estimators,
+        max_samples=int(scorer.forest.max_samples_),
+        score_us=round(score_us, 1),
+        separation=round(auc, 4),
+        full_separation=round(full_auc, 4),
+        full_score_us=round(full_us, 1),
+        within_tolerance=full_auc - auc <= tolerance,
+        within_budget=score_us <= budget_us,
+        runtime=runtime,
+        candidates_tried=tried,
+    )
+    return scorer, result
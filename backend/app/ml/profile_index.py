@@ -0,0 +1,204 @@
+"""
+KeyAuth - In-Memory Profile Index
+Candidate generation for 1:N identification ("type to log in").
+
+Every enrolled user is summarized by a centroid and a spread vector of their
+enrollment feature vectors, stored as rows of two float32 matrices. There is
+one index per device class, in that device's feature schema, so a web
+sample is only compared on the timing features web profiles keep. A query
+is compared to all rows in fixed-size blocks with a spread-scaled Manhattan
+distance, keeping only the best candidates; those are then re-ranked with
+their full models by the caller.
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from app.database import scan_shards
+from app.memory import estimate_bytes
+from app.models import User, KeystrokeProfile
+from app.ml.feature_matrix import profile_vectors
+from app.ml.feature_schema import device_class, get_schema, schema_for_device
+from app.config import settings
+
+_BLOCK_ROWS = 4096
+_MIN_SPREAD = 1e-3
+
+
+def summarize(vectors: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Centroid and (floored) per-feature spread of a user's enrollment vectors."""
+    X = np.asarray(vectors, dtype=np.float64)
+    centroid = X.mean(axis=0)
+    spread = np.maximum(X.std(axis=0), np.maximum(0.05 * np.abs(centroid), _MIN_SPREAD))
+    return centroid.astype(np.float32), spread.astype(np.float32)
+
+
+class ProfileIndex:
+    """
+    Per-process index of enrolled users' centroid and spread vectors for
+    one device class.
+
+    Loaded lazily from the database on first use, updated incrementally when
+    enrollment completes in this process, and rebuilt once older than
+    ``ttl_seconds`` so other workers' enrollments are picked up.
+    """
+
+    def __init__(self, device_type: str = "web", ttl_seconds: float = 300.0):
+        self.device_type = device_type
+        self.schema = schema_for_device(device_type)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._user_ids: List[str] = []
+        self._usernames: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._centroids = np.empty((0, 0), dtype=np.float32)
+        self._spreads = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": self._size,
+                "bytes": self._centroids.nbytes + self._spreads.nbytes
+                + estimate_bytes(self._user_ids) + estimate_bytes(self._usernames) + estimate_bytes(self._rows),
+                "cap": None,
+                "evictions": 0,
+            }
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+
+    def load(self, db: Session):
+        """(Re)build the index from every enrolled user's stored vectors for this device (shards in parallel)."""
+        def _rows(session: Session):
+            return (
+                session.query(
+                    User.id,
+                    User.username,
+                    KeystrokeProfile.feature_schema,
+                    KeystrokeProfile.feature_matrix,
+                    KeystrokeProfile.feature_vectors,
+                )
+                .join(KeystrokeProfile, KeystrokeProfile.user_id == User.id)
+                .filter(User.is_enrolled.is_(True), KeystrokeProfile.device_type == self.device_type)
+                .all()
+            )
+
+        entries = []
+        for row in (row for rows in scan_shards(db, _rows) for row in rows):
+            vectors = profile_vectors(row)
+            if vectors is not None:
+                vectors = self.schema.project(vectors, get_schema(row.feature_schema))
+                entries.append((row.id, row.username, summarize(vectors)))
+
+        with self._lock:
+            self._user_ids = [e[0] for e in entries]
+            self._usernames = [e[1] for e in entries]
+            self._rows = {user_id: i for i, user_id in enumerate(self._user_ids)}
+            self._size = len(entries)
+            if entries:
+                self._centroids = np.stack([e[2][0] for e in entries])
+                self._spreads = np.stack([e[2][1] for e in entries])
+            else:
+                self._centroids = np.empty((0, 0), dtype=np.float32)
+                self._spreads = np.empty((0, 0), dtype=np.float32)
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self, db: Session):
+        if self.is_stale:
+            self.load(db)
+
+    def upsert(self, user_id: str, username: str, vectors: Sequence[Sequence[float]]):
+        """Add or replace one user's row (called when enrollment completes), in this index's schema."""
+        centroid, spread = summarize(vectors)
+        with self._lock:
+            if self._loaded_at is None:
+                return  # Not built yet — the first load will include this user
+            row = self._rows.get(user_id)
+            if row is None:
+                row = self._size
+                self._grow(row + 1, len(centroid))
+                self._user_ids.append(user_id)
+                self._usernames.append(username)
+                self._rows[user_id] = row
+                self._size += 1
+            self._centroids[row] = centroid
+            self._spreads[row] = spread
+
+    def centroids(self, exclude_user_id: Optional[str] = None, limit: int = 64) -> np.ndarray:
+        """Up to ``limit`` other users' centroids (impostor examples for model sizing)."""
+        with self._lock:
+            rows = [i for i, user_id in enumerate(self._user_ids) if user_id != exclude_user_id][:limit]
+            return self._centroids[rows].astype(np.float64) if rows else np.empty((0, self.schema.dim))
+
+    def _grow(self, rows: int, dim: int):
+        """Ensure matrix capacity for ``rows`` rows (amortized doubling)."""
+        if self._centroids.shape[0] >= rows and self._centroids.shape[1] == dim:
+            return
+        capacity = max(rows, 2 * self._centroids.shape[0], 16)
+        centroids = np.zeros((capacity, dim), dtype=np.float32)
+        spreads = np.ones((capacity, dim), dtype=np.float32)
+        if self._size:
+            centroids[:self._size] = self._centroids[:self._size]
+            spreads[:self._size] = self._spreads[:self._size]
+        self._centroids, self._spreads = centroids, spreads
+
+    def search(self, vector: Sequence[float], k: int) -> List[Tuple[str, str, float]]:
+        """
+        Blocked brute-force search for the ``k`` nearest user centroids.
+
+        Returns (user_id, username, distance) tuples, nearest first, where
+        distance is the mean spread-scaled absolute deviation per feature.
+        """
+        with self._lock:
+            size = self._size
+            centroids = self._centroids[:size]
+            spreads = self._spreads[:size]
+            user_ids = list(self._user_ids)
+            usernames = list(self._usernames)
+        if size == 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        k = min(k, size)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_dist = np.empty(0, dtype=np.float32)
+        for start in range(0, size, _BLOCK_ROWS):
+            block = slice(start, min(start + _BLOCK_ROWS, size))
+            dist = (np.abs(centroids[block] - query) / spreads[block]).mean(axis=1)
+            rows = np.arange(block.start, block.stop)
+            best_rows = np.concatenate([best_rows, rows])
+            best_dist = np.concatenate([best_dist, dist])
+            if len(best_dist) > k:
+                keep = np.argpartition(best_dist, k - 1)[:k]
+                best_rows, best_dist = best_rows[keep], best_dist[keep]
+
+        order = np.argsort(best_dist)
+        return [(user_ids[r], usernames[r], float(best_dist[i])) for i, r in zip(order, best_rows[order])]
+
+
+# Global instances, one per device class (created on first use)
+_indexes: Dict[str, ProfileIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def profile_indexes() -> Dict[str, ProfileIndex]:
+    """The indexes created so far, by device class."""
+    with _indexes_lock:
+        return dict(_indexes)
+
+
+def profile_index_for(device_type: Optional[str]) -> ProfileIndex:
+    """The profile index for the device class of ``device_type``."""
+    device = device_class(device_type)
+    with _indexes_lock:
+        index = _indexes.get(device)
+        if index is None:
+            index = _indexes[device] = ProfileIndex(device, ttl_seconds=settings.PROFILE_INDEX_TTL_SECONDS)
+        return index
@@ -0,0 +1,309 @@
+"""
+KeyAuth - Pluggable Per-User Scorers
+A scorer is fitted on one user's enrollment vectors and turns an attempt's
+feature vector into a 0-1 confidence score.
+
+Built-in scorers:
+  isolation_forest  — StandardScaler + Isolation Forest, 100 trees unless sized (default)
+  statistical       — Manhattan + cosine blend against every enrollment vector
+  scaled_manhattan  — mean absolute deviation-scaled Manhattan distance to the mean
+  mahalanobis       — Mahalanobis distance with a Ledoit-Wolf shrinkage covariance
+
+The distance scorers are calibrated on their own enrollment data: the
+reference distance is the mean leave-one-out distance of the enrollment
+vectors, and confidence halves for every further reference distance an
+attempt lies away (1.0 up to the reference). Their models are a handful of
+float64 arrays, packed so that load() works on any buffer without copying.
+
+Select one globally with AUTH_SCORER or per profile with
+KeystrokeProfile.scorer; add new ones with @register_scorer.
+"""
+import pickle
+import struct
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence, Type, Union
+import numpy as np
+from sklearn.covariance import LedoitWolf
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+_MIN_SCALE = 1e-3
+
+SCORERS: Dict[str, Type["Scorer"]] = {}
+
+
+def register_scorer(cls: Type["Scorer"]) -> Type["Scorer"]:
+    """Class decorator adding a scorer to the registry under ``cls.name``."""
+    SCORERS[cls.name] = cls
+    return cls
+
+
+def get_scorer_class(name: str) -> Type["Scorer"]:
+    try:
+        return SCORERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown scorer '{name}'. Available: {', '.join(sorted(SCORERS))}")
+
+
+def create_scorer(name: str) -> "Scorer":
+    return get_scorer_class(name)()
+
+
+class Scorer(ABC):
+    """Interface every per-user scorer implements."""
+
+    name: str = ""
+
+    @abstractmethod
+    def fit(self, X: np.ndarray) -> "Scorer":
+        """Fit on an (n_samples, n_features) matrix of enrollment vectors; returns self."""
+
+    @abstractmethod
+    def score_many(self, X: np.ndarray) -> np.ndarray:
+        """Confidence (0-1) for each row of X."""
+
+    def score(self, x: Sequence[float]) -> float:
+        """Confidence (0-1) for one feature vector."""
+        return float(self.score_many(np.asarray(x, dtype=np.float64)[None, :])[0])
+
+    @abstractmethod
+    def serialize(self) -> bytes:
+        """Model bytes for storage."""
+
+    @classmethod
+    @abstractmethod
+    def load(cls, data) -> "Scorer":
+        """Rebuild a fitted scorer from serialize() output (bytes or any buffer)."""
+
+
+# ── Packed float64 arrays ───────────────────────────────────────
+
+def _pack_arrays(*arrays: np.ndarray) -> bytes:
+    """u32 count, then per array u32 ndim + u32 shape..., padded to 8 bytes, then the data."""
+    header = [len(arrays)]
+    for array in arrays:
+        header += [array.ndim, *array.shape]
+    head = struct.pack(f"<{len(header)}I", *header)
+    head += b"\0" * (-len(head) % 8)
+    return head + b"".join(np.ascontiguousarray(a, dtype="<f8").tobytes() for a in arrays)
+
+
+def _unpack_arrays(data) -> List[np.ndarray]:
+    """Views over the arrays in a _pack_arrays() buffer."""
+    (count,) = struct.unpack_from("<I", data, 0)
+    offset = 4
+    shapes = []
+    for _ in range(count):
+        (ndim,) = struct.unpack_from("<I", data, offset)
+        shapes.append(struct.unpack_from(f"<{ndim}I", data, offset + 4))
+        offset += 4 + 4 * ndim
+    offset += -offset % 8
+    arrays = []
+    for shape in shapes:
+        size = int(np.prod(shape))
+        arrays.append(np.frombuffer(data, dtype="<f8", count=size, offset=offset).reshape(shape))
+        offset += 8 * size
+    return arrays
+
+
+def _calibrated_confidence(distances: np.ndarray, reference: float) -> np.ndarray:
+    return 2.0 ** (-np.maximum(distances / reference - 1.0, 0.0))
+
+
+def _leave_one_out_reference(X: np.ndarray, fit, distance) -> float:
+    """Mean distance of each enrollment vector to a model fitted on the others."""
+    if len(X) < 3:
+        return 1.0
+    mask = np.ones(len(X), dtype=bool)
+    distances = []
+    for i in range(len(X)):
+        mask[i] = False
+        params = fit(X[mask])
+        distances.append(distance(params, X[i:i + 1])[0])
+        mask[i] = True
+    return max(float(np.mean(distances)), 1e-6)
+
+
+# ── Scorers ─────────────────────────────────────────────────────
+
+@register_scorer
+class IsolationForestScorer(Scorer):
+    """
+    Anomaly score of an Isolation Forest on standardized features.
+
+    ``n_estimators`` and ``max_samples`` only apply to fit(); the defaults are
+    the full model, smaller ones come from app.ml.model_sizing.
+    """
+
+    name = "isolation_forest"
+
+    def __init__(
+        self,
+        scaler: StandardScaler = None,
+        forest: IsolationForest = None,
+        n_estimators: int = 100,
+        max_samples: Union[int, float, str] = "auto",
+    ):
+        self.scaler = scaler
+        self.forest = forest
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+
+    def fit(self, X: np.ndarray) -> "IsolationForestScorer":
+        X = np.asarray(X, dtype=np.float64)
+        self.scaler = StandardScaler().fit(X)
+        # Contamination set low since all training data is "genuine"
+        self.forest = IsolationForest(
+            n_estimators=self.n_estimators,
+            max_samples=self.max_samples,
+            contamination=0.1,
+            random_state=42,
+        )
+        self.forest.fit(self.scaler.transform(X))
+        return self
+
+    def score_many(self, X: np.ndarray) -> np.ndarray:
+        # score_samples returns anomaly score (higher = more normal), typically
+        # -0.5 to 0.5; map so that ~0 raw score → 0.85 confidence (threshold zone)
+        raw = self.forest.score_samples(self.scaler.transform(np.asarray(X, dtype=np.float64)))
+        return np.clip(1.0 / (1.0 + np.exp(-10 * (raw + 0.1))), 0.0, 1.0)
+
+    def serialize(self) -> bytes:
+        return pickle.dumps((self.scaler, self.forest))
+
+    @classmethod
+    def load(cls, data) -> "IsolationForestScorer":
+        return cls(*pickle.loads(data))
+
+
+@register_scorer
+class StatisticalScorer(Scorer):
+    """
+    Blend of Manhattan distance (60%) and cosine similarity (40%) between the
+    per-vector z-normalized attempt and every enrollment vector.
+    """
+
+    name = "statistical"
+
+    def __init__(self, training: np.ndarray = None):
+        self.training = training
+
+    @staticmethod
+    def _normalize(X: np.ndarray) -> np.ndarray:
+        mean = X.mean(axis=1, keepdims=True)
+        std = X.std(axis=1, keepdims=True)
+        return np.divide(X - mean, std, out=np.zeros_like(X), where=std != 0)
+
+    def fit(self, X: np.ndarray) -> "StatisticalScorer":
+        self.training = np.asarray(X, dtype=np.float64)
+        return self
+
+    def score_many(self, X: np.ndarray) -> np.ndarray:
+        X = self._normalize(np.asarray(X, dtype=np.float64))
+        T = self._normalize(self.training)
+        n_features = X.shape[1]
+
+        distances = np.abs(X[:, None, :] - T[None, :, :]).sum(axis=2).mean(axis=1)
+        norms = np.linalg.norm(X, axis=1)[:, None] * np.linalg.norm(T, axis=1)[None, :]
+        cosine = np.divide(X @ T.T, norms, out=np.zeros_like(norms), where=norms != 0).mean(axis=1)
+
+        # Typical normalized Manhattan distances range from 0 to ~len(vector)
+        distance_confidence = np.maximum(0.0, 1.0 - distances / (n_features * 1.5))
+        return np.clip(0.6 * distance_confidence + 0.4 * np.maximum(0.0, cosine), 0.0, 1.0)
+
+    def serialize(self) -> bytes:
+        return _pack_arrays(self.training)
+
+    @classmethod
+    def load(cls, data) -> "StatisticalScorer":
+        (training,) = _unpack_arrays(data)
+        return cls(training)
+
+
+@register_scorer
+class ScaledManhattanScorer(Scorer):
+    """Manhattan distance to the enrollment mean, each feature scaled by its mean absolute deviation."""
+
+    name = "scaled_manhattan"
+
+    def __init__(self, mean: np.ndarray = None, scale: np.ndarray = None, reference: float = 1.0):
+        self.mean = mean
+        self.scale = scale
+        self.reference = reference
+
+    @staticmethod
+    def _fit_params(X: np.ndarray):
+        mean = X.mean(axis=0)
+        scale = np.maximum(np.abs(X - mean).mean(axis=0), np.maximum(0.05 * np.abs(mean), _MIN_SCALE))
+        return mean, scale
+
+    @staticmethod
+    def _distance(params, X: np.ndarray) -> np.ndarray:
+        mean, scale = params
+        return (np.abs(X - mean) / scale).mean(axis=1)
+
+    def fit(self, X: np.ndarray) -> "ScaledManhattanScorer":
+        X = np.asarray(X, dtype=np.float64)
+        self.mean, self.scale = self._fit_params(X)
+        self.reference = _leave_one_out_reference(X, self._fit_params, self._distance)
+        return self
+
+    def score_many(self, X: np.ndarray) -> np.ndarray:
+        distances = self._distance((self.mean, self.scale), np.asarray(X, dtype=np.float64))
+        return _calibrated_confidence(distances, self.reference)
+
+    def serialize(self) -> bytes:
+        return _pack_arrays(np.array([self.reference]), self.mean, self.scale)
+
+    @classmethod
+    def load(cls, data) -> "ScaledManhattanScorer":
+        reference, mean, scale = _unpack_arrays(data)
+        return cls(mean, scale, float(reference[0]))
+
+
+@register_scorer
+class MahalanobisScorer(Scorer):
+    """
+    Mahalanobis distance to the enrollment mean on standardized features,
+    using a Ledoit-Wolf shrinkage covariance so it stays well-conditioned
+    with far fewer samples than features.
+    """
+
+    name = "mahalanobis"
+
+    def __init__(self, mean: np.ndarray = None, scale: np.ndarray = None, precision: np.ndarray = None, reference: float = 1.0):
+        self.mean = mean
+        self.scale = scale
+        self.precision = precision
+        self.reference = reference
+
+    @staticmethod
+    def _fit_params(X: np.ndarray):
+        mean = X.mean(axis=0)
+        scale = np.maximum(X.std(axis=0), np.maximum(0.05 * np.abs(mean), _MIN_SCALE))
+        covariance = LedoitWolf(assume_centered=True).fit((X - mean) / scale).covariance_
+        return mean, scale, np.linalg.pinv(covariance)
+
+    @staticmethod
+    def _distance(params, X: np.ndarray) -> np.ndarray:
+        mean, scale, precision = params
+        Z = (X - mean) / scale
+        return np.sqrt(np.maximum(np.einsum("ij,jk,ik->i", Z, precision, Z), 0.0) / X.shape[1])
+
+    def fit(self, X: np.ndarray) -> "MahalanobisScorer":
+        X = np.asarray(X, dtype=np.float64)
+        self.mean, self.scale, self.precision = self._fit_params(X)
+        self.reference = _leave_one_out_reference(X, self._fit_params, self._distance)
+        return self
+
+    def score_many(self, X: np.ndarray) -> np.ndarray:
+        distances = self._distance((self.mean, self.scale, self.precision), np.asarray(X, dtype=np.float64))
+        return _calibrated_confidence(distances, self.reference)
+
+    def serialize(self) -> bytes:
+        return _pack_arrays(np.array([self.reference]), self.mean, self.scale, self.precision)
+
+    @classmethod
+    def load(cls, data) -> "MahalanobisScorer":
+        reference, mean, scale, precision = _unpack_arrays(data)
+        return cls(mean, scale, precision, float(reference[0]))
@@ -0,0 +1,282 @@
+"""
+KeyAuth - Continuous Session Scoring
+Sliding-window keystroke features for long sessions, re-scored every K events.
+
+The window is split into a fixed number of panes. Each pane keeps, per timing
+series, exact running moments (count / mean / M2 / min / max) and P² quantile
+sketches for q25, median and q75 — a constant amount of state no matter how
+many events it has seen. When the newest pane fills up the oldest one is
+dropped, so the window slides in pane-sized steps and never has to be
+re-sorted. Window statistics merge the panes: moments exactly, quantiles as
+a count-weighted blend of the pane estimates.
+"""
+import math
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from app.ml.feature_extractor import feature_vector_from_stats
+from app.ml.feature_schema import FULL, FeatureSchema
+from app.ml.model import KeystrokeAuthModel
+
+
+class P2Quantile:
+    """
+    P² streaming quantile estimator (Jain & Chlamtac, 1985).
+
+    Tracks one quantile with five markers; O(1) memory and update time.
+    """
+
+    __slots__ = ("p", "count", "_q", "_n", "_np", "_dn")
+
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        self._q: List[float] = []
+        self._n = [0, 1, 2, 3, 4]
+        self._np = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self._dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float):
+        self.count += 1
+        q = self._q
+        if self.count <= 5:
+            q.append(x)
+            if self.count == 5:
+                q.sort()
+            return
+
+        n = self._n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self._np
+        for i in range(5):
+            desired[i] += self._dn[i]
+
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self._q, self._n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> float:
+        if self.count == 0:
+            return 0.0
+        if self.count < 5:
+            # Too few points for markers — exact linear-interpolated percentile
+            ordered = sorted(self._q)
+            pos = self.p * (len(ordered) - 1)
+            lo = int(math.floor(pos))
+            hi = min(lo + 1, len(ordered) - 1)
+            return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+        return self._q[2]
+
+
+class _SeriesSketch:
+    """Running moments plus q25 / median / q75 sketches for one timing series."""
+
+    __slots__ = ("count", "mean", "m2", "min", "max", "q25", "median", "q75")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.q25 = P2Quantile(0.25)
+        self.median = P2Quantile(0.5)
+        self.q75 = P2Quantile(0.75)
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        self.q25.add(x)
+        self.median.add(x)
+        self.q75.add(x)
+
+
+def _merge_statistics(sketches: List[_SeriesSketch]) -> Dict[str, float]:
+    """Combine pane sketches into the compute_statistics() dict for the window."""
+    sketches = [s for s in sketches if s.count]
+    total = sum(s.count for s in sketches)
+    if not total:
+        return {"mean": 0.0, "std": 0.0, "min": 0.0, "max": 0.0, "median": 0.0, "q25": 0.0, "q75": 0.0}
+
+    # Chan et al. parallel combination of mean / M2
+    count, mean, m2 = 0, 0.0, 0.0
+    for s in sketches:
+        combined = count + s.count
+        delta = s.mean - mean
+        mean += delta * s.count / combined
+        m2 += s.m2 + delta * delta * count * s.count / combined
+        count = combined
+
+    def blend(attr: str) -> float:
+        return sum(getattr(s, attr).value() * s.count for s in sketches) / total
+
+    return {
+        "mean": mean,
+        "std": math.sqrt(m2 / total),
+        "min": min(s.min for s in sketches),
+        "max": max(s.max for s in sketches),
+        "median": blend("median"),
+        "q25": blend("q25"),
+        "q75": blend("q75"),
+    }
+
+
+class _Pane:
+    __slots__ = ("events", "first_press", "dwell", "flight", "digraph", "pressure", "touch_size")
+
+    def __init__(self, first_press: float):
+        self.events = 0
+        self.first_press = first_press
+        self.dwell = _SeriesSketch()
+        self.flight = _SeriesSketch()
+        self.digraph = _SeriesSketch()
+        self.pressure = _SeriesSketch()
+        self.touch_size = _SeriesSketch()
+
+
+class SlidingWindowFeatures:
+    """
+    Bounded-memory sliding-window version of extract_features.
+
+    Covers between ``(panes - 1) * pane_size`` and ``panes * pane_size`` of the
+    most recent events.
+    """
+
+    def __init__(self, pane_size: int = 50, panes: int = 4):
+        self.pane_size = pane_size
+        self._panes: Deque[_Pane] = deque(maxlen=panes)
+        self._prev_press: Optional[float] = None
+        self._prev_release: Optional[float] = None
+        self._last_release = 0.0
+
+    def add(
+        self,
+        press_time: float,
+        release_time: float,
+        pressure: Optional[float] = None,
+        touch_size: Optional[float] = None,
+    ):
+        if not self._panes or self._panes[-1].events >= self.pane_size:
+            self._panes.append(_Pane(press_time))  # deque drops the oldest pane
+        pane = self._panes[-1]
+        pane.events += 1
+
+        dwell = release_time - press_time
+        if dwell > 0:
+            pane.dwell.add(dwell)
+        if self._prev_press is not None:
+            pane.flight.add(press_time - self._prev_release)
+            pane.digraph.add(press_time - self._prev_press)
+        # Missing mobile values (None or NaN) are skipped, as extract_features does
+        if pressure is not None and not math.isnan(pressure):
+            pane.pressure.add(pressure)
+        if touch_size is not None and not math.isnan(touch_size):
+            pane.touch_size.add(touch_size)
+
+        self._prev_press = press_time
+        self._prev_release = release_time
+        self._last_release = release_time
+
+    @property
+    def events(self) -> int:
+        return sum(p.events for p in self._panes)
+
+    def vector(self) -> List[float]:
+        """The 36-feature vector for the current window."""
+        panes = list(self._panes)
+        total_time_ms = self._last_release - panes[0].first_press if panes else 0.0
+        typing_speed = self.events / max(total_time_ms / 1000.0, 0.001)
+        return feature_vector_from_stats(
+            _merge_statistics([p.dwell for p in panes]),
+            _merge_statistics([p.flight for p in panes]),
+            _merge_statistics([p.digraph for p in panes]),
+            typing_speed,
+            _merge_statistics([p.pressure for p in panes]),
+            _merge_statistics([p.touch_size for p in panes]),
+        )
+
+
+class SessionScorer:
+    """
+    Continuous authentication over a long typing session.
+
+    Feeds events into a sliding window; every ``rescore_every`` events the
+    window is projected onto ``schema`` (the profile's feature schema),
+    scored against the user's model and the result updates an exponentially
+    smoothed trust value.
+    """
+
+    def __init__(
+        self,
+        model: KeystrokeAuthModel,
+        schema: FeatureSchema = FULL,
+        rescore_every: int = 25,
+        pane_size: int = 50,
+        panes: int = 4,
+        smoothing: float = 0.3,
+        min_events: int = 20,
+    ):
+        self.model = model
+        self.schema = schema
+        self.rescore_every = rescore_every
+        self.smoothing = smoothing
+        self.min_events = min_events
+        self.window = SlidingWindowFeatures(pane_size=pane_size, panes=panes)
+        self.total_events = 0
+        self.trust: Optional[float] = None
+
+    def add(
+        self,
+        press_time: float,
+        release_time: float,
+        pressure: Optional[float] = None,
+        touch_size: Optional[float] = None,
+    ) -> bool:
+        """Add one event; returns True when a re-score is due (call score())."""
+        self.window.add(press_time, release_time, pressure, touch_size)
+        self.total_events += 1
+        return self.total_events >= self.min_events and self.total_events % self.rescore_every == 0
+
+    def score(self) -> Dict:
+        """Score the current window and fold it into the trust value."""
+        confidence, method = self.model.authenticate(self.schema.project(self.window.vector()))
+        if self.trust is None:
+            self.trust = confidence
+        else:
+            self.trust = self.smoothing * confidence + (1 - self.smoothing) * self.trust
+        return {
+            "events": self.total_events,
+            "window_events": self.window.events,
+            "confidence": round(confidence, 4),
+            "trust": round(self.trust, 4),
+            "method": method,
+        }
@@ -0,0 +1,283 @@
+"""
+KeyAuth - Shadow Scoring
+Scores live login attempts with candidate scorers off the request path, to
+compare them against the deciding model without affecting decisions.
+
+After an attempt is decided, its projected feature vector, digraph vector
+and primary score go onto a bounded queue (SHADOW_QUEUE_SIZE). When the
+queue is full the attempt is dropped and counted; the request never waits.
+SHADOW_WORKERS background threads score each attempt with every scorer in
+SHADOW_CANDIDATES, fitted on the same enrollment vectors as the primary
+model (and blended with digraph similarity the same way), keeping the
+fitted candidates of recently seen profiles in an LRU.
+
+Results are appended to SHADOW_STORE_DIR as compressed NPZ chunks of up to
+SHADOW_FLUSH_EVERY attempts (or whatever is buffered after
+SHADOW_FLUSH_SECONDS), one file per chunk and process: timestamp, user id,
+device type, primary score, threshold and decision, and a
+``candidate.<name>`` column per candidate (NaN where it could not score).
+``python -m app.jobs.shadow_report`` summarizes them.
+"""
+import glob
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence
+import numpy as np
+from app.config import settings
+from app.memory import estimate_items
+from app.ml.digraph_features import SparseVector
+from app.ml.model import KeystrokeAuthModel
+from app.ml.scorers import create_scorer, get_scorer_class
+
+CANDIDATE_PREFIX = "candidate."
+
+
+class ShadowItem(NamedTuple):
+    """One decided attempt, as queued for the shadow workers."""
+    model_key: Hashable  # Identifies the primary model's training data, e.g. (profile id, updated_at)
+    auth_model: KeystrokeAuthModel
+    vector: Sequence[float]
+    digraph: Optional[SparseVector]
+    primary_score: float
+    threshold: float
+    user_id: str
+    device_type: str
+    timestamp: float
+
+
+class ShadowScorer:
+    """Bounded queue, worker threads and chunked NPZ store for shadow scores."""
+
+    def __init__(
+        self,
+        candidates: List[str],
+        store_dir: str,
+        queue_size: int = 1024,
+        workers: int = 1,
+        flush_every: int = 1000,
+        flush_seconds: float = 60,
+        model_cache_size: int = 256,
+    ):
+        for name in candidates:
+            get_scorer_class(name)  # Fail at startup on a misspelled candidate
+        self.candidates = candidates
+        self.store_dir = store_dir
+        self.workers = workers
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.model_cache_size = model_cache_size
+        self._queue: "queue.Queue[Optional[ShadowItem]]" = queue.Queue(maxsize=queue_size)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._models: "OrderedDict[tuple, Optional[KeystrokeAuthModel]]" = OrderedDict()
+        self._buffer: List[tuple] = []
+        self._buffer_since = time.monotonic()
+        self._chunk = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.scored = 0
+        self.failed = 0
+        self.written = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.candidates)
+
+    def submit(self, item: ShadowItem) -> bool:
+        """Queue an attempt for shadow scoring; False (and counted) if the queue is full."""
+        if not self.enabled:
+            return False
+        if not self._threads:
+            self._start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"shadow-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                self._flush_if_due()
+                continue
+            if item is None:  # close()
+                break
+            scores = [self._score(item, name) for name in self.candidates]
+            with self._lock:
+                self.scored += 1
+                self._buffer.append((
+                    item.timestamp, item.user_id, item.device_type,
+                    item.primary_score, item.threshold, item.primary_score >= item.threshold, *scores,
+                ))
+            self._flush_if_due()
+
+    # ── Candidate models ────────────────────────────────────────
+
+    def _candidate_model(self, item: ShadowItem, name: str) -> Optional[KeystrokeAuthModel]:
+        key = (item.model_key, name)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+        model = None
+        X = np.asarray(item.auth_model.training_vectors, dtype=np.float64)
+        if len(X) >= 2:
+            model = KeystrokeAuthModel()
+            model.training_vectors = X
+            model.digraph_vectors = item.auth_model.digraph_vectors
+            model.scorer = create_scorer(name).fit(X)
+            model.is_trained = True
+        with self._lock:
+            self._models[key] = model
+            while len(self._models) > self.model_cache_size:
+                self._models.popitem(last=False)
+                self.evictions += 1
+        return model
+
+    def _score(self, item: ShadowItem, name: str) -> float:
+        try:
+            model = self._candidate_model(item, name)
+            if model is None:
+                return float("nan")
+            score, _method = model.authenticate(item.vector, item.digraph)
+        except Exception:  # A candidate that cannot fit or score this profile must not stop the worker
+            with self._lock:
+                self.failed += 1
+            return float("nan")
+        return round(score, 4)
+
+    # ── Store ───────────────────────────────────────────────────
+
+    def _flush_if_due(self):
+        with self._lock:
+            due = self._buffer and (
+                len(self._buffer) >= self.flush_every
+                or time.monotonic() - self._buffer_since >= self.flush_seconds
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> Optional[str]:
+        """Write buffered scores as one chunk; returns its path (None if nothing was buffered)."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._buffer_since = time.monotonic()
+            self._chunk += 1
+            chunk = self._chunk
+        if not rows:
+            return None
+        columns = list(zip(*rows))
+        arrays = {
+            "timestamp": np.array(columns[0], dtype=np.float64),
+            "user_id": np.array(columns[1], dtype=str),
+            "device_type": np.array(columns[2], dtype=str),
+            "primary": np.array(columns[3], dtype=np.float32),
+            "threshold": np.array(columns[4], dtype=np.float32),
+            "accepted": np.array(columns[5], dtype=bool),
+        }
+        for i, name in enumerate(self.candidates):
+            arrays[CANDIDATE_PREFIX + name] = np.array(columns[6 + i], dtype=np.float32)
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = os.path.join(self.store_dir, f"shadow-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{chunk:05d}.npz")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, path)  # Readers never see a partial chunk
+        with self._lock:
+            self.written += len(rows)
+        return path
+
+    def close(self, timeout: float = 5.0):
+        """Stop the workers after the queued attempts (waiting up to ``timeout``) and write what is buffered."""
+        threads, self._threads = self._threads, []
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(timeout)
+        self.flush()
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "candidates": self.candidates,
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "scored": self.scored,
+                "failed": self.failed,
+                "buffered": len(self._buffer),
+                "written": self.written,
+                "cached_models": len(self._models),
+            }
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            models = [model for model in self._models.values() if model is not None]
+            return {
+                "entries": len(self._models),
+                "bytes": estimate_items(models, len(models), _model_bytes),
+                "cap": self.model_cache_size,
+                "evictions": self.evictions,
+                "queued": self._queue.qsize(),
+            }
+
+
+def _model_bytes(model: KeystrokeAuthModel) -> int:
+    """Approximate size of a fitted candidate: its serialized scorer and training vectors."""
+    return len(model.scorer.serialize()) + np.asarray(model.training_vectors).nbytes
+
+
+def load_shadow_scores(store_dir: str) -> Dict[str, np.ndarray]:
+    """Every chunk in ``store_dir`` concatenated by column; candidates missing from a chunk are NaN."""
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(store_dir, "shadow-*.npz"))):
+        with np.load(path) as chunk:
+            chunks.append({key: chunk[key] for key in chunk.files})
+    if not chunks:
+        return {}
+    keys = list(dict.fromkeys(key for chunk in chunks for key in chunk))
+    columns = {}
+    for key in keys:
+        parts = []
+        for chunk in chunks:
+            if key in chunk:
+                parts.append(chunk[key])
+            else:
+                parts.append(np.full(len(chunk["primary"]), np.nan, dtype=np.float32))
+        columns[key] = np.concatenate(parts)
+    return columns
+
+
+shadow_scorer = ShadowScorer(
+    [name.strip() for name in settings.SHADOW_CANDIDATES.split(",") if name.strip()],
+    settings.SHADOW_STORE_DIR,
+    queue_size=settings.SHADOW_QUEUE_SIZE,
+    workers=settings.SHADOW_WORKERS,
+    flush_every=settings.SHADOW_FLUSH_EVERY,
+    flush_seconds=settings.SHADOW_FLUSH_SECONDS,
+    model_cache_size=settings.SHADOW_MODEL_CACHE_SIZE,
+)
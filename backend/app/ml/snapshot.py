@@ -0,0 +1,307 @@
+"""
+KeyAuth - Memory-Mapped Model Snapshot
+One file holding every enrolled profile's scoring data, so a fresh worker can
+authenticate without fetching and unpickling models from the database.
+
+The file is written offline (``python -m app.jobs.export_snapshot``) and
+mapped read-only at startup. Every array — training matrix, scaler
+parameters, the Isolation Forest flattened into node arrays (other scorers
+keep their own packed bytes), packed digraph vectors — is a view into the
+mapping, so opening the snapshot costs one index parse and scoring copies
+nothing. Entries are keyed by profile id (a user has one profile per device
+class). A profile updated after the export is not served from the
+snapshot; the caller falls back to the stored model.
+
+File layout (little-endian, every array 8-byte aligned):
+  header   4s magic "KMS1" | u32 version | f8 created_at (unix seconds)
+           | u64 index offset | u64 index length
+  arrays   per-profile arrays, back to back
+  index    JSON: {"profiles": {profile_id: {"updated_at", "scorer", "norm",
+                                            "arrays": {name: [offset, dtype, shape]}}}}
+"""
+import json
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, List, Optional, Tuple
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from app.memory import estimate_bytes
+from app.ml.digraph_features import unpack_sparse_vectors
+from app.ml.model import KeystrokeAuthModel
+from app.ml.scorers import IsolationForestScorer, Scorer, get_scorer_class
+
+MAGIC = b"KMS1"
+VERSION = 3
+_HEADER = struct.Struct("<4sIdQQ")
+_EULER_GAMMA = 0.5772156649015329
+
+
+def _average_path_length(n: np.ndarray) -> np.ndarray:
+    """Expected path length of an unsuccessful BST search over n points."""
+    n = np.asarray(n, dtype=np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + _EULER_GAMMA) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+def _to_epoch(value: Optional[datetime]) -> float:
+    """Unix seconds for a stored timestamp (naive values are UTC)."""
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+# ── Flattened Isolation Forest ──────────────────────────────────
+
+def pack_forest(forest: IsolationForest) -> Tuple[Dict[str, np.ndarray], float]:
+    """
+    Flatten a fitted forest into concatenated node arrays.
+
+    Returns the arrays (feature, left, right, threshold, leaf_depth, roots)
+    and the score normalizer. ``leaf_depth`` already includes the
+    average-path-length correction for the samples left in each leaf, so
+    scoring only needs to find one leaf per tree.
+    """
+    features, lefts, rights, thresholds, depths, roots = [], [], [], [], [], []
+    base = 0
+    n_features = forest.n_features_in_
+    for tree, tree_features in zip(forest.estimators_, forest.estimators_features_):
+        t = tree.tree_
+        feature = t.feature.astype(np.int32)
+        internal = feature >= 0
+        if len(tree_features) != n_features:
+            # Trees fitted on a feature subset index into that subset
+            feature[internal] = np.asarray(tree_features)[feature[internal]]
+        feature[~internal] = -1
+
+        node_depth = np.zeros(t.node_count, dtype=np.float64)
+        for node in range(t.node_count):  # children always follow their parent
+            if internal[node]:
+                node_depth[t.children_left[node]] = node_depth[node] + 1
+                node_depth[t.children_right[node]] = node_depth[node] + 1
+
+        left = np.where(internal, t.children_left + base, -1).astype(np.int32)
+        right = np.where(internal, t.children_right + base, -1).astype(np.int32)
+        features.append(feature)
+        lefts.append(left)
+        rights.append(right)
+        thresholds.append(t.threshold.astype(np.float64))
+        depths.append(node_depth + _average_path_length(t.n_node_samples))
+        roots.append(base)
+        base += t.node_count
+
+    arrays = {
+        "feature": np.concatenate(features),
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+        "threshold": np.concatenate(thresholds),
+        "leaf_depth": np.concatenate(depths),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    norm = len(forest.estimators_) * float(_average_path_length([forest.max_samples_])[0])
+    return arrays, norm
+
+
+def forest_score_samples(forest: Dict[str, np.ndarray], norm: float, x: np.ndarray) -> float:
+    """IsolationForest.score_samples for one scaled vector, all trees walked together."""
+    x = np.asarray(x, dtype=np.float32).astype(np.float64)  # sklearn trees split on float32 inputs
+    feature, left, right, threshold = forest["feature"], forest["left"], forest["right"], forest["threshold"]
+    nodes = forest["roots"].astype(np.int64)
+    while True:
+        f = feature[nodes]
+        active = f >= 0
+        if not active.any():
+            break
+        go_left = x[np.where(active, f, 0)] <= threshold[nodes]
+        nodes = np.where(active, np.where(go_left, left[nodes], right[nodes]), nodes)
+    if norm == 0:
+        return -1.0
+    return -float(2.0 ** (-forest["leaf_depth"][nodes].sum() / norm))
+
+
+class PackedForestScorer(Scorer):
+    """Read-only isolation_forest scorer over a flattened forest."""
+
+    name = IsolationForestScorer.name
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, forest: Dict[str, np.ndarray], norm: float):
+        self.mean = mean
+        self.scale = scale
+        self.forest = forest
+        self.norm = norm
+
+    def fit(self, X: np.ndarray) -> "PackedForestScorer":
+        raise NotImplementedError("snapshot scorers are read-only")
+
+    def score_many(self, X: np.ndarray) -> np.ndarray:
+        X_scaled = (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+        raw = np.array([forest_score_samples(self.forest, self.norm, x) for x in X_scaled])
+        return np.clip(1.0 / (1.0 + np.exp(-10 * (raw + 0.1))), 0.0, 1.0)
+
+    def serialize(self) -> bytes:
+        raise NotImplementedError("snapshot scorers are read-only")
+
+    @classmethod
+    def load(cls, data) -> "PackedForestScorer":
+        raise NotImplementedError("snapshot scorers are read-only")
+
+
+class SnapshotModel(KeystrokeAuthModel):
+    """KeystrokeAuthModel whose arrays are views into a model snapshot."""
+
+    def __init__(self, training: np.ndarray, digraph: Optional[memoryview], scorer: Optional[Scorer]):
+        super().__init__()
+        self.training_vectors = training
+        self.digraph_vectors = unpack_sparse_vectors(digraph)
+        self.is_trained = scorer is not None
+        self.scorer = scorer
+
+
+# ── Writing ─────────────────────────────────────────────────────
+
+class SnapshotWriter:
+    """Streams profiles' arrays into a snapshot file, then writes the index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._file: BinaryIO = open(self._tmp_path, "wb")
+        self._file.write(b"\0" * _HEADER.size)
+        self._profiles: Dict[str, Dict] = {}
+        self.created_at = time.time()
+
+    def _write_array(self, array: np.ndarray) -> List:
+        offset = self._file.tell()
+        data = np.ascontiguousarray(array)
+        self._file.write(data.tobytes())
+        pad = -self._file.tell() % 8
+        if pad:
+            self._file.write(b"\0" * pad)
+        return [offset, data.dtype.str, list(data.shape)]
+
+    def add(self, profile_id: str, updated_at: Optional[datetime], model: KeystrokeAuthModel, digraph_data: Optional[bytes]):
+        arrays = {"training": self._write_array(np.asarray(model.training_vectors, dtype="<f4"))}
+        if digraph_data:
+            arrays["digraph"] = self._write_array(np.frombuffer(digraph_data, dtype=np.uint8))
+
+        norm = 0.0
+        scorer = model.scorer if model.is_trained else None
+        if isinstance(scorer, IsolationForestScorer):
+            arrays["scaler_mean"] = self._write_array(scorer.scaler.mean_.astype("<f8"))
+            arrays["scaler_scale"] = self._write_array(scorer.scaler.scale_.astype("<f8"))
+            forest, norm = pack_forest(scorer.forest)
+            for name, array in forest.items():
+                arrays[f"forest_{name}"] = self._write_array(array.astype(array.dtype.newbyteorder("<")))
+        elif scorer is not None:
+            arrays["scorer_data"] = self._write_array(np.frombuffer(scorer.serialize(), dtype=np.uint8))
+
+        self._profiles[profile_id] = {
+            "updated_at": _to_epoch(updated_at),
+            "scorer": scorer.name if scorer is not None else None,
+            "norm": norm,
+            "arrays": arrays,
+        }
+
+    def close(self) -> int:
+        """Write the index and header, atomically replace the target; returns file size."""
+        index = json.dumps({"profiles": self._profiles}, separators=(",", ":")).encode("utf-8")
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, self.created_at, index_offset, len(index)))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return os.path.getsize(self.path)
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+
+# ── Reading ─────────────────────────────────────────────────────
+
+class ModelSnapshot:
+    """Read-only view of a snapshot file; empty until open() is called."""
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.created_at: Optional[float] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._profiles: Dict[str, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._mmap is not None
+
+    def open(self, path: str):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, created_at, index_offset, index_len = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            raise ValueError(f"{path} is not a version {VERSION} model snapshot")
+        index = json.loads(mapped[index_offset:index_offset + index_len])
+        self.close()
+        self.path = path
+        self.created_at = created_at
+        self._mmap = mapped
+        self._profiles = index["profiles"]
+
+    def memory_usage(self) -> Dict:
+        """The profile index in memory; the mapped file itself is page cache, shared between workers."""
+        return {
+            "entries": len(self._profiles),
+            "bytes": estimate_bytes(self._profiles),
+            "cap": None,
+            "evictions": 0,
+            "mapped_bytes": len(self._mmap) if self._mmap is not None else 0,
+        }
+
+    def close(self):
+        self._profiles = {}
+        self._mmap = None  # Views handed out keep the mapping alive until released
+
+    def _view(self, spec: List) -> np.ndarray:
+        offset, dtype, shape = spec
+        count = int(np.prod(shape)) if shape else 1
+        return np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    def get(self, profile_id: str, updated_at: Optional[datetime]) -> Optional[SnapshotModel]:
+        """
+        The profile's model from the snapshot, or None when the profile is
+        missing or changed after the snapshot was written.
+        """
+        entry = self._profiles.get(profile_id)
+        if entry is None or self._mmap is None or _to_epoch(updated_at) > entry["updated_at"]:
+            return None
+        arrays = entry["arrays"]
+        digraph = None
+        if "digraph" in arrays:
+            offset, _, (length,) = arrays["digraph"]
+            digraph = memoryview(self._mmap)[offset:offset + length]
+        scorer = None
+        if "scaler_mean" in arrays:
+            forest = {
+                name[len("forest_"):]: self._view(spec)
+                for name, spec in arrays.items() if name.startswith("forest_")
+            }
+            scorer = PackedForestScorer(
+                self._view(arrays["scaler_mean"]), self._view(arrays["scaler_scale"]), forest, entry["norm"]
+            )
+        elif entry["scorer"] is not None:
+            offset, _, (length,) = arrays["scorer_data"]
+            scorer = get_scorer_class(entry["scorer"]).load(memoryview(self._mmap)[offset:offset + length])
+        return SnapshotModel(self._view(arrays["training"]), digraph, scorer)
+
+
+# Global instance (opened at startup when MODEL_SNAPSHOT_PATH is set)
+model_snapshot = ModelSnapshot()
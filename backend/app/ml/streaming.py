@@ -0,0 +1,134 @@
+"""
+KeyAuth - Incremental Feature Accumulation
+Builds the feature vector one keystroke at a time as events stream in.
+
+Each event does a constant amount of work: derive its dwell, flight and
+digraph values from the previous event, append them to growable buffers and
+update running sums for live metrics. When the last key arrives only the
+final statistics remain to be computed, using the same code path as
+extract_features so the resulting vectors are identical.
+"""
+import math
+from typing import Dict, List, Optional
+import numpy as np
+from app.ml.feature_extractor import build_features
+from app.ml.keystrokes import KeystrokeArrays
+
+
+class _Buffer:
+    """Append-only float64 buffer with amortized O(1) appends."""
+
+    def __init__(self, capacity: int):
+        self._data = np.empty(capacity, dtype=np.float64)
+        self._size = 0
+
+    def append(self, value: float):
+        if self._size == len(self._data):
+            self._data = np.concatenate([self._data, np.empty(len(self._data), dtype=np.float64)])
+        self._data[self._size] = value
+        self._size += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def view(self) -> np.ndarray:
+        return self._data[:self._size]
+
+
+class KeystrokeAccumulator:
+    """
+    Running dwell / flight / digraph accumulator for a streamed typing sample.
+
+    Events must be added in the same order they would appear in the
+    ``keystrokes`` list of a regular request.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.keys: List[str] = []
+        self._press = _Buffer(capacity)
+        self._release = _Buffer(capacity)
+        self._dwell = _Buffer(capacity)
+        self._flight = _Buffer(capacity)
+        self._digraph = _Buffer(capacity)
+        self._pressure = _Buffer(capacity)
+        self._touch_size = _Buffer(capacity)
+        self._dwell_sum = 0.0
+        self._flight_sum = 0.0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(
+        self,
+        key: str,
+        press_time: float,
+        release_time: float,
+        pressure: Optional[float] = None,
+        touch_size: Optional[float] = None,
+    ):
+        """Fold one keystroke into the running accumulators."""
+        if self.keys:
+            prev_press = self._press.view()[-1]
+            prev_release = self._release.view()[-1]
+            flight = press_time - prev_release
+            self._flight.append(flight)
+            self._flight_sum += flight
+            self._digraph.append(press_time - prev_press)
+
+        dwell = release_time - press_time
+        if dwell > 0:
+            self._dwell.append(dwell)
+            self._dwell_sum += dwell
+
+        # Missing mobile values (None or NaN) are skipped, as _present does
+        if pressure is not None and not math.isnan(pressure):
+            self._pressure.append(pressure)
+        if touch_size is not None and not math.isnan(touch_size):
+            self._touch_size.append(touch_size)
+
+        self.keys.append(key)
+        self._press.append(press_time)
+        self._release.append(release_time)
+
+    def live_metrics(self) -> Dict:
+        """Cheap running metrics for progress feedback while the user types."""
+        n = len(self.keys)
+        if n < 2:
+            return {"keystrokes": n, "dwell_time": 0.0, "flight_time": 0.0, "typing_speed": 0.0}
+        return {
+            "keystrokes": n,
+            "dwell_time": round(self._dwell_sum / len(self._dwell), 2) if len(self._dwell) else 0.0,
+            "flight_time": round(self._flight_sum / len(self._flight), 2),
+            "typing_speed": round(self._typing_speed(), 2),
+        }
+
+    def _typing_speed(self) -> float:
+        total_time_ms = float(self._release.view()[-1] - self._press.view()[0])
+        total_time_sec = max(total_time_ms / 1000.0, 0.001)
+        return len(self.keys) / total_time_sec
+
+    def arrays(self) -> KeystrokeArrays:
+        """The accumulated sample in columnar form (for anti-replay hashing)."""
+        return KeystrokeArrays(
+            keys=self.keys,
+            press_times=self._press.view(),
+            release_times=self._release.view(),
+        )
+
+    def features(self) -> Dict:
+        """
+        Finalize the feature dict — equal to extract_features on the same events.
+
+        Raises:
+            ValueError: If fewer than 2 keystrokes were accumulated
+        """
+        if len(self.keys) < 2:
+            raise ValueError("Need at least 2 keystrokes to extract features")
+        return build_features(
+            self._dwell.view(),
+            self._flight.view(),
+            self._digraph.view(),
+            self._typing_speed(),
+            self._pressure.view(),
+            self._touch_size.view(),
+        )
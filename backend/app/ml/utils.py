@@ -3,7 +3,7 @@ KeyAuth - ML Utilities
 Data preprocessing and helper functions
 """
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Union
 
 
 def normalize_features(features: List[float]) -> List[float]:
@@ -19,13 +19,13 @@ def normalize_features(features: List[float]) -> List[float]:
     return ((arr - mean) / std).tolist()
 
 
-def compute_statistics(values: List[float]) -> Dict[str, float]:
+def compute_statistics(values: Union[List[float], np.ndarray]) -> Dict[str, float]:
     """
-    Compute statistical features from a list of timing values.
+    Compute statistical features from a list or array of timing values.
     
     Returns: dict with mean, std, min, max, median, q25, q75
     """
-    if not values:
+    if len(values) == 0:
         return {
             "mean": 0.0, "std": 0.0, "min": 0.0,
             "max": 0.0, "median": 0.0, "q25": 0.0, "q75": 0.0,
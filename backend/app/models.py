@@ -4,9 +4,12 @@ SQLAlchemy ORM models for users, keystroke profiles, enrollment samples, and aut
 """
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Float, Integer, Text, DateTime, ForeignKey, Boolean, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column, String, Float, Integer, Text, Date, DateTime, ForeignKey, Boolean, JSON, LargeBinary, Index, UniqueConstraint,
+)
+from sqlalchemy.orm import deferred, relationship
 from app.database import Base
+from app.ml.feature_schema import device_class
 
 
 def generate_uuid():
@@ -21,12 +24,19 @@ class User(Base):
     name = Column(String(100), nullable=False)
     device_type = Column(String(20), default="web")  # web, mobile, both
     is_enrolled = Column(Boolean, default=False)
+    auth_log_version = Column(Integer, default=0, nullable=True)  # Bumped with every auth log write (app/response_cache.py)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Relationships
-    keystroke_profile = relationship("KeystrokeProfile", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    keystroke_profiles = relationship("KeystrokeProfile", back_populates="user", cascade="all, delete-orphan")
     enrollment_samples = relationship("EnrollmentSample", back_populates="user", cascade="all, delete-orphan")
     auth_logs = relationship("AuthLog", back_populates="user", cascade="all, delete-orphan")
+    auth_log_daily = relationship("AuthLogDaily", back_populates="user", cascade="all, delete-orphan")
+
+    def profile_for(self, device_type):
+        """The keystroke profile for the device class of ``device_type``, if enrolled on it."""
+        device = device_class(device_type)
+        return next((p for p in self.keystroke_profiles if p.device_type == device), None)
 
     def __repr__(self):
         return f"<User(username='{self.username}', enrolled={self.is_enrolled})>"
@@ -34,21 +44,29 @@ class User(Base):
 
 class KeystrokeProfile(Base):
     __tablename__ = "keystroke_profiles"
+    __table_args__ = (UniqueConstraint("user_id", "device_type", name="uq_keystroke_profiles_user_device"),)
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
-    user_id = Column(String(36), ForeignKey("users.id"), unique=True, nullable=False)
-    feature_vectors = Column(JSON, nullable=True)  # Stored training feature vectors
-    model_data = Column(Text, nullable=True)  # Base64-encoded trained model (pickle)
+    user_id = Column(String(36), ForeignKey("users.id"), nullable=False, index=True)
+    device_type = Column(String(20), nullable=True)  # Device class (web, mobile); one profile per class
+    feature_schema = Column(String(30), nullable=True)  # ml/feature_schema.py name; None = full 36-feature layout
+    feature_matrix = Column(LargeBinary, nullable=True)  # Packed float32 training vectors (ml/feature_matrix.py)
+    feature_version = Column(Integer, nullable=True)  # FEATURE_VERSION its rows were extracted with (ml/feature_extractor.py); None = 1
+    feature_vectors = Column(JSON(none_as_null=True), nullable=True)  # Legacy JSON training vectors, moved into feature_matrix
+    digraph_vectors = Column(LargeBinary, nullable=True)  # Packed hashed-digraph sparse vectors (optional)
+    model_data = deferred(Column(Text, nullable=True))  # Base64-encoded trained model (pickle), loaded on access
     threshold = Column(Float, default=0.85)
+    scorer = Column(String(30), nullable=True)  # Registered scorer name; None = AUTH_SCORER
+    model_cost = Column(JSON(none_as_null=True), nullable=True)  # Trained scorer's configuration and size; measured scoring time when IF_SIZING_ENABLED (ml/model_sizing.py)
     sample_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     # Relationships
-    user = relationship("User", back_populates="keystroke_profile")
+    user = relationship("User", back_populates="keystroke_profiles")
 
     def __repr__(self):
-        return f"<KeystrokeProfile(user_id='{self.user_id}', samples={self.sample_count})>"
+        return f"<KeystrokeProfile(user_id='{self.user_id}', device='{self.device_type}', samples={self.sample_count})>"
 
 
 class EnrollmentSample(Base):
@@ -56,8 +74,9 @@ class EnrollmentSample(Base):
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
-    raw_keystrokes = Column(JSON, nullable=False)  # Raw key events
-    features = Column(JSON, nullable=False)  # Extracted feature vector
+    raw_keystrokes = Column(JSON(none_as_null=True), nullable=True)  # Raw key events; None once trimmed after training
+    features = Column(JSON(none_as_null=True), nullable=True)  # Legacy per-sample vector; now only in KeystrokeProfile.feature_matrix
+    feature_version = Column(Integer, nullable=True)  # FEATURE_VERSION of its row in the profile's matrix; None = 1
     device_type = Column(String(20), default="web")
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
@@ -70,6 +89,7 @@ class EnrollmentSample(Base):
 
 class AuthLog(Base):
     __tablename__ = "auth_logs"
+    __table_args__ = (Index("ix_auth_logs_user_timestamp", "user_id", "timestamp"),)
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
@@ -77,10 +97,31 @@ class AuthLog(Base):
     result = Column(String(10), nullable=False)  # "accepted" or "rejected"
     device_type = Column(String(20), default="web")
     ip_address = Column(String(45), nullable=True)
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
 
     # Relationships
     user = relationship("User", back_populates="auth_logs")
 
     def __repr__(self):
         return f"<AuthLog(user_id='{self.user_id}', result='{self.result}', score={self.confidence_score})>"
+
+
+class AuthLogDaily(Base):
+    """Per-user, per-day, per-device totals of auth logs past retention (app/jobs/compact_auth_logs.py)."""
+
+    __tablename__ = "auth_log_daily"
+    __table_args__ = (UniqueConstraint("user_id", "day", "device_type", name="uq_auth_log_daily_user_day_device"),)
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    user_id = Column(String(36), ForeignKey("users.id"), nullable=False, index=True)
+    day = Column(Date, nullable=False)  # UTC date of the attempts
+    device_type = Column(String(20), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    accepted = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)  # Mean = confidence_sum / attempts
+
+    # Relationships
+    user = relationship("User", back_populates="auth_log_daily")
+
+    def __repr__(self):
+        return f"<AuthLogDaily(user_id='{self.user_id}', day={self.day}, attempts={self.attempts})>"
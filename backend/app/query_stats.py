@@ -0,0 +1,197 @@
+"""
+KeyAuth - Per-Request Query Accounting
+Counts the SQL statements each request runs and the time spent in them.
+
+Engine cursor events add every statement to the QueryStats of the request
+being served, found through a context variable that QueryStatsMiddleware
+sets. Sync handlers run in a threadpool copy of that context and the SQLite
+writer runs queued work in the submitting request's context, so their
+statements count too. Totals per route are exposed at /metrics/queries; in
+DEBUG every response carries X-DB-Queries / X-DB-Time-Ms, and a request
+running more than QUERY_BUDGET statements is logged with its statements.
+
+Tests can bound a route with ``max_queries``:
+
+    with max_queries(4):
+        client.post("/api/authenticate", json=payload)
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, List, Optional
+from sqlalchemy import event
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MAX_RECORDED_STATEMENTS = 50
+
+
+class QueryStats:
+    """Statements run in one request (or one ``count_queries`` block)."""
+
+    def __init__(self, record_statements: bool = False):
+        self.count = 0
+        self.db_ms = 0.0
+        self.statements: Optional[List[str]] = [] if record_statements else None
+
+    def add(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.db_ms += elapsed_ms
+        if self.statements is not None and len(self.statements) < _MAX_RECORDED_STATEMENTS:
+            self.statements.append(" ".join(statement.split()))
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_captures: List[QueryStats] = []  # Process-wide count_queries() blocks
+_captures_lock = threading.Lock()
+
+
+def current_stats() -> Optional[QueryStats]:
+    """The QueryStats of the request being served, if any."""
+    return _current.get()
+
+
+# ── Engine instrumentation ──────────────────────────────────────
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1e3
+    stats = _current.get()
+    if stats is not None:
+        stats.add(statement, elapsed_ms)
+    if _captures:
+        with _captures_lock:
+            for capture in _captures:
+                capture.add(statement, elapsed_ms)
+
+
+def instrument_engine(engine):
+    """Attribute every statement run on ``engine`` to the current request."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ── Per-route totals ────────────────────────────────────────────
+
+class _RouteTotals:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_ms = 0.0
+        self.max_queries = 0
+        self.over_budget = 0
+        self.recent: Deque[int] = deque(maxlen=1024)  # Recent per-request counts, for p99
+
+
+class QueryMetrics:
+    """Query count and DB time per route, and how often the budget was exceeded."""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self._routes: Dict[str, _RouteTotals] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, stats: QueryStats):
+        over = self.budget > 0 and stats.count > self.budget
+        with self._lock:
+            totals = self._routes.setdefault(route, _RouteTotals())
+            totals.requests += 1
+            totals.queries += stats.count
+            totals.db_ms += stats.db_ms
+            totals.max_queries = max(totals.max_queries, stats.count)
+            totals.over_budget += over
+            totals.recent.append(stats.count)
+        if over:
+            logger.warning(
+                "%s ran %d queries (budget %d, %.1f ms in DB)%s",
+                route, stats.count, self.budget, stats.db_ms,
+                "".join(f"\n  {s}" for s in stats.statements or []),
+            )
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            routes = {}
+            for route, totals in sorted(self._routes.items()):
+                recent = sorted(totals.recent)
+                routes[route] = {
+                    "requests": totals.requests,
+                    "queries_avg": round(totals.queries / totals.requests, 2),
+                    "queries_p99": recent[min(len(recent) - 1, int(0.99 * len(recent)))],
+                    "queries_max": totals.max_queries,
+                    "db_ms_avg": round(totals.db_ms / totals.requests, 2),
+                    "over_budget": totals.over_budget,
+                }
+            return {"enabled": settings.QUERY_STATS_ENABLED, "budget": self.budget, "routes": routes}
+
+
+query_metrics = QueryMetrics(settings.QUERY_BUDGET)
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware giving each HTTP request its own QueryStats."""
+
+    def __init__(self, app, debug_headers: bool = False):
+        self.app = app
+        self.debug_headers = debug_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.QUERY_STATS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(record_statements=settings.QUERY_BUDGET > 0)
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and self.debug_headers:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.count).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.db_ms:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            if route is not None:  # Unmatched paths (404s) are not tracked
+                query_metrics.record(f"{scope['method']} {route.path}", stats)
+
+
+# ── Test helpers ────────────────────────────────────────────────
+
+@contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    """Count every statement run in the process (any thread) while the block runs."""
+    stats = QueryStats(record_statements=True)
+    with _captures_lock:
+        _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        with _captures_lock:
+            _captures.remove(stats)
+
+
+@contextmanager
+def max_queries(limit: int) -> Iterator[QueryStats]:
+    """
+    Fail with AssertionError when the block runs more than ``limit`` statements.
+
+    Raises:
+        AssertionError: listing the statements that were run
+    """
+    with count_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        listing = "".join(f"\n  {s}" for s in stats.statements)
+        raise AssertionError(f"{stats.count} queries run, at most {limit} expected:{listing}")
@@ -0,0 +1,151 @@
+"""
+KeyAuth - Conditional GETs and Response Cache
+Version-based ETags for per-user read endpoints, 304 answers to
+If-None-Match, and a small in-process cache of serialized responses.
+
+A user's version is their ``auth_log_version`` (bumped in the same write as
+every auth log, and by log compaction) together with the number of their
+keystroke profiles and the newest profile ``updated_at`` (changed by every
+enrollment). Reading it takes the user row, which the endpoints load anyway,
+and one aggregate query over the profiles. A request whose If-None-Match
+names the current ETag gets 304 without running the endpoint's queries;
+otherwise the JSON serialized for that ETag is served from the cache when
+this process has it. Cache entries are keyed by ETag, so a write in another
+worker process only makes them unreachable; writes in this process also
+drop the user's entries right away.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.memory import estimate_bytes
+from app.models import User, KeystrokeProfile
+
+CACHE_CONTROL = "private, no-cache"  # Browsers revalidate every poll with If-None-Match
+
+
+def user_etag(db: Session, user: User) -> str:
+    """Strong ETag of everything the per-user read endpoints return for ``user``."""
+    count, updated_at = (
+        db.query(func.count(KeystrokeProfile.id), func.max(KeystrokeProfile.updated_at))
+        .filter(KeystrokeProfile.user_id == user.id)
+        .one()
+    )
+    version = f"{user.id}:{user.auth_log_version or 0}:{count}:{updated_at.isoformat() if updated_at else ''}"
+    return '"' + hashlib.blake2b(version.encode(), digest_size=12).hexdigest() + '"'
+
+
+def bump_auth_log_version(session: Session, user_ids: Iterable[str]):
+    """Invalidate the users' ETags; call in the transaction that writes or compacts their auth logs."""
+    user_ids = list(user_ids)
+    match = User.id == user_ids[0] if len(user_ids) == 1 else User.id.in_(user_ids)  # One user: routed to its shard
+    session.query(User).filter(match).update(
+        {User.auth_log_version: func.coalesce(User.auth_log_version, 0) + 1},
+        synchronize_session=False,
+    )
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Bounded LRU of serialized JSON responses, keyed by (user id, URL) and valid for one ETag."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, url: str, etag: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get((user_id, url))
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, url))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: str, url: str, etag: str, body: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(user_id, url)] = (etag, body)
+            self._entries.move_to_end((user_id, url))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        """Drop every cached response of ``user_id``."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+            }
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": estimate_bytes(self._entries),
+                "cap": self.max_entries,
+                "evictions": self.evictions,
+            }
+
+    # ── Request helpers ─────────────────────────────────────────
+
+    def lookup(self, request: Request, db: Session, user: User) -> Tuple[Optional[str], Optional[Response]]:
+        """
+        The user's current ETag, and the response to send without running the
+        endpoint: 304 if the client already has that version, the cached body
+        if this process has it. (None, None) when the cache is disabled.
+        """
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return None, None
+        etag = user_etag(db, user)
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            with self._lock:
+                self.not_modified += 1
+            return etag, Response(status_code=304, headers=headers)
+        body = self.get(user.id, str(request.url), etag)
+        if body is not None:
+            return etag, Response(content=body, media_type="application/json", headers=headers)
+        return etag, None
+
+    def respond(self, request: Request, user_id: str, etag: Optional[str], model: BaseModel):
+        """``model`` serialized, cached under ``etag`` and sent with it (just ``model`` without an ETag)."""
+        if etag is None:
+            return model
+        body = model.model_dump_json().encode()
+        self.put(user_id, str(request.url), etag, body)
+        return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_SIZE)
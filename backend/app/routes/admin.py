@@ -0,0 +1,360 @@
+"""
+KeyAuth - Admin Routes
+Operator endpoints, guarded by the ADMIN_API_KEY (X-Admin-Key header).
+
+Bulk enrollment registers users together with all of their typing samples,
+as one JSON document or as streamed NDJSON (one user per line, handled in
+batches of BULK_ENROLL_BATCH as the lines arrive). For each batch, features
+of every sample are extracted up front, models of the users with enough
+samples are trained in parallel on a thread pool, and users, profiles and
+samples are inserted with one flush per shard instead of one transaction
+per sample.
+
+Memory accounting reports the size of this worker's in-process caches and
+can diff tracemalloc snapshots to find what keeps growing (app/memory.py).
+Auth statistics come from in-memory rolling counters (app/auth_stats.py).
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.admission import admission
+from app.auth_stats import auth_stats
+from app.auth import require_admin
+from app.config import settings
+from app.database import SHARDED, get_db, run_write, shards
+from app.memory import log_line, memory_report, tracer
+from app.models import User, KeystrokeProfile, EnrollmentSample, generate_uuid
+from app.schemas import BulkEnrollRequest, BulkEnrollResponse, BulkEnrollResult, BulkEnrollUser
+from app.ml.digraph_features import unpack_sparse_vectors
+from app.ml.feature_extractor import FEATURE_VERSION
+from app.ml.feature_matrix import extract_profile_matrix, unpack_matrix
+from app.ml.feature_schema import device_class, schema_for_device
+from app.ml.model import KeystrokeAuthModel
+from app.ml.profile_index import profile_index_for
+from app.routes.registration import sizing_impostors
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+_training_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _training_pool
+    if _training_pool is None:
+        workers = settings.BULK_ENROLL_WORKERS or os.cpu_count() or 1
+        _training_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-train")
+    return _training_pool
+
+
+class _Enrollment:
+    """One user of a batch, from its extracted features to the rows to insert."""
+
+    def __init__(self, position: int, req: BulkEnrollUser):
+        self.position = position
+        self.req = req
+        self.user_id = generate_uuid()
+        self.device = device_class(req.device_type)
+        self.schema = schema_for_device(req.device_type)
+        self.feature_matrix: Optional[bytes] = None
+        self.digraph_vectors: Optional[bytes] = None
+        self.model_data: Optional[str] = None
+        self.model_cost: Optional[Dict] = None
+
+    @property
+    def samples(self) -> int:
+        return len(self.req.samples)
+
+    @property
+    def is_enrolled(self) -> bool:
+        return self.samples >= settings.ENROLLMENT_SAMPLES_REQUIRED
+
+    def extract(self):
+        """Features of every sample, packed as the profile stores them (raises ValueError)."""
+        self.feature_matrix, self.digraph_vectors = extract_profile_matrix(
+            [sample.arrays for sample in self.req.samples], self.schema,
+        )
+
+    def train(self, impostors):
+        auth_model = KeystrokeAuthModel()
+        auth_model.training_vectors = unpack_matrix(self.feature_matrix)
+        auth_model.digraph_vectors = unpack_sparse_vectors(self.digraph_vectors)
+        auth_model.train(None, impostors)
+        self.model_data = auth_model.serialize()
+        self.model_cost = auth_model.model_cost
+
+    def add_user(self, session: Session):
+        req = self.req
+        session.add(User(
+            id=self.user_id,
+            username=req.username,
+            name=req.name,
+            device_type=req.device_type,
+            is_enrolled=self.is_enrolled,
+        ))
+
+    def add_rows(self, session: Session):
+        """Add the profile and samples (after the user is flushed, so sharded sessions can route them)."""
+        trim = self.is_enrolled and settings.TRIM_ENROLLMENT_KEYSTROKES
+        session.add(KeystrokeProfile(
+            user_id=self.user_id,
+            device_type=self.device,
+            feature_schema=self.schema.name,
+            feature_matrix=self.feature_matrix,
+            feature_version=FEATURE_VERSION,
+            digraph_vectors=self.digraph_vectors,
+            sample_count=self.samples,
+            model_data=self.model_data,
+            model_cost=self.model_cost,
+        ))
+        session.add_all([
+            EnrollmentSample(
+                user_id=self.user_id,
+                raw_keystrokes=None if trim else sample.arrays.to_records(),  # Features are in the profile's matrix
+                device_type=self.req.device_type,
+                feature_version=FEATURE_VERSION,
+            )
+            for sample in self.req.samples
+        ])
+
+    def result(self) -> BulkEnrollResult:
+        remaining = settings.ENROLLMENT_SAMPLES_REQUIRED - self.samples
+        return BulkEnrollResult(
+            username=self.req.username,
+            status="enrolled" if self.is_enrolled else "pending",
+            samples_collected=self.samples,
+            is_enrolled=self.is_enrolled,
+            detail=None if self.is_enrolled else f"{remaining} more sample(s) needed",
+        )
+
+
+def _insert(db: Session, enrollments: List[_Enrollment]):
+    """Insert a group of users that share a shard, with one flush for users and one for their rows."""
+    def _write(session):
+        for enrollment in enrollments:
+            enrollment.add_user(session)
+        session.flush()
+        for enrollment in enrollments:
+            enrollment.add_rows(session)
+
+    run_write(db, _write, enrollments[0].req.username)
+
+
+def enroll_users(db: Session, users: List[Tuple[int, BulkEnrollUser]]) -> Dict[int, BulkEnrollResult]:
+    """Register and enroll one batch of (position, user); returns each position's result."""
+    results: Dict[int, BulkEnrollResult] = {}
+
+    def fail(position: int, username: str, state: str, detail: str):
+        results[position] = BulkEnrollResult(username=username, status=state, detail=detail)
+
+    names = [req.username for _, req in users]
+    taken = {name for (name,) in db.query(User.username).filter(User.username.in_(names))}
+    enrollments, seen = [], set()
+    for position, req in users:
+        if req.username in taken or req.username in seen:
+            fail(position, req.username, "exists", f"Username '{req.username}' is already taken")
+            continue
+        seen.add(req.username)
+        enrollment = _Enrollment(position, req)
+        try:
+            enrollment.extract()
+        except ValueError as e:
+            fail(position, req.username, "invalid", str(e))
+            continue
+        enrollments.append(enrollment)
+
+    # Train every complete enrollment in parallel; sizing impostors are shared per device
+    impostors = {}
+    for enrollment in enrollments:
+        if enrollment.is_enrolled and enrollment.device not in impostors:
+            impostors[enrollment.device] = sizing_impostors(db, enrollment.device, enrollment.schema, None)
+    pool = _pool()
+    futures = [
+        (enrollment, pool.submit(enrollment.train, impostors[enrollment.device]))
+        for enrollment in enrollments if enrollment.is_enrolled
+    ]
+    for enrollment, future in futures:
+        try:
+            future.result()
+        except ValueError as e:
+            enrollments.remove(enrollment)
+            fail(enrollment.position, enrollment.req.username, "invalid", f"Training failed: {e}")
+
+    groups: Dict[int, List[_Enrollment]] = {}
+    for enrollment in enrollments:
+        groups.setdefault(shards.shard_for(enrollment.req.username) if SHARDED else 0, []).append(enrollment)
+    stored = []
+    for group in groups.values():
+        try:
+            _insert(db, group)
+            stored.extend(group)
+        except IntegrityError:
+            # A username was registered since the check: store the rest one by one
+            for enrollment in group:
+                try:
+                    _insert(db, [enrollment])
+                    stored.append(enrollment)
+                except IntegrityError:
+                    fail(enrollment.position, enrollment.req.username, "exists",
+                         f"Username '{enrollment.req.username}' is already taken")
+
+    for enrollment in stored:
+        results[enrollment.position] = enrollment.result()
+        if enrollment.is_enrolled:
+            index_schema = schema_for_device(enrollment.device)
+            vectors = index_schema.project(unpack_matrix(enrollment.feature_matrix), enrollment.schema)
+            profile_index_for(enrollment.device).upsert(enrollment.user_id, enrollment.req.username, vectors)
+    return results
+
+
+async def _ndjson_users(request: Request) -> AsyncIterator[Tuple[int, Optional[BulkEnrollUser], str]]:
+    """(line number, parsed user or None, error) for each non-empty line of a streamed NDJSON body."""
+    buffer, line_no = b"", 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield (line_no, *_parse_line(line))
+    if buffer.strip():
+        yield (line_no + 1, *_parse_line(buffer))
+
+
+def _parse_line(line: bytes) -> Tuple[Optional[BulkEnrollUser], str]:
+    try:
+        return BulkEnrollUser.model_validate_json(line), ""
+    except ValidationError as e:
+        error = e.errors(include_url=False)[0]
+        location = ".".join(str(part) for part in error["loc"])
+        return None, f"{location}: {error['msg']}" if location else error["msg"]
+
+
+@router.post(
+    "/bulk-enroll",
+    response_model=BulkEnrollResponse,
+    dependencies=[Depends(admission.slot("enroll"))],
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": BulkEnrollRequest.model_json_schema()},
+        NDJSON_CONTENT_TYPE: {"schema": BulkEnrollUser.model_json_schema()},
+    }}},
+)
+async def bulk_enroll(request: Request, db: Session = Depends(get_db)):
+    """
+    Register users with all of their enrollment samples in one request.
+
+    Send ``{"users": [...]}`` as JSON (at most BULK_ENROLL_MAX_USERS), or one
+    user object per line as ``application/x-ndjson``, which is processed in
+    batches while it streams in. Users with at least
+    ENROLLMENT_SAMPLES_REQUIRED samples are trained and enrolled; the others
+    are stored and can finish through /api/enroll. Returns each user's result
+    in request order; a bad user does not fail the rest.
+    """
+    results: Dict[int, BulkEnrollResult] = {}
+    batch: List[Tuple[int, BulkEnrollUser]] = []
+
+    async def flush():
+        results.update(await run_in_threadpool(enroll_users, db, batch))
+        batch.clear()
+
+    if request.headers.get("content-type", "").startswith(NDJSON_CONTENT_TYPE):
+        async for line_no, user, error in _ndjson_users(request):
+            if user is None:
+                results[line_no] = BulkEnrollResult(username=f"line {line_no}", status="invalid", detail=error)
+                continue
+            batch.append((line_no, user))
+            if len(batch) >= settings.BULK_ENROLL_BATCH:
+                await flush()
+    else:
+        try:
+            req = BulkEnrollRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+        if len(req.users) > settings.BULK_ENROLL_MAX_USERS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {settings.BULK_ENROLL_MAX_USERS} users per request; stream larger imports as NDJSON",
+            )
+        for position, user in enumerate(req.users):
+            batch.append((position, user))
+            if len(batch) >= settings.BULK_ENROLL_BATCH:
+                await flush()
+    if batch:
+        await flush()
+
+    ordered = [results[position] for position in sorted(results)]
+    return BulkEnrollResponse(
+        received=len(ordered),
+        enrolled=sum(r.status == "enrolled" for r in ordered),
+        pending=sum(r.status == "pending" for r in ordered),
+        failed=sum(r.status in ("exists", "invalid") for r in ordered),
+        results=ordered,
+    )
+
+
+# ── Memory accounting ───────────────────────────────────────────
+
+@router.get("/memory")
+def memory(log: bool = False):
+    """
+    Entry counts, estimated bytes, caps and evictions of this worker's
+    in-process structures, its RSS, and tracemalloc status. ``log=true``
+    also prints the one-line summary to the server log.
+    """
+    report = memory_report()
+    if log:
+        print(log_line(report), flush=True)
+    return report
+
+
+@router.post("/memory/snapshots")
+def take_memory_snapshot(top: int = 20):
+    """
+    Take a tracemalloc snapshot (starting tracing on the first one) and
+    return the allocation sites that grew most since the previous snapshot.
+    """
+    taken = tracer.take(settings.MEMORY_TRACEMALLOC_FRAMES)
+    if taken["id"] - 1 in {s["id"] for s in tracer.status()["snapshots"]}:
+        taken["diff"] = tracer.diff(taken["id"] - 1, taken["id"], top)
+    return taken
+
+
+@router.get("/memory/snapshots/{base_id}/diff")
+def memory_snapshot_diff(base_id: int, to: Optional[int] = None, top: int = 20, group_by: str = "lineno"):
+    """Allocation sites that grew most from snapshot ``base_id`` to ``to`` (default: the latest)."""
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="group_by must be lineno, filename or traceback")
+    try:
+        return tracer.diff(base_id, to, top, group_by)
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown snapshot id")
+
+
+@router.delete("/memory/snapshots", status_code=status.HTTP_204_NO_CONTENT)
+def stop_memory_tracing():
+    """Drop every snapshot and stop tracemalloc."""
+    tracer.stop()
+
+
+# ── Auth statistics ─────────────────────────────────────────────
+
+@router.get("/auth-stats")
+def auth_statistics(resolution: str = "minute", last: Optional[int] = None):
+    """
+    Login attempts, accepted/rejected, mean confidence and scoring methods
+    per ``resolution`` bucket (second: the last hour, minute: the last day)
+    for the last ``last`` buckets, from this worker's rolling counters.
+    """
+    if last is not None and last < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="last must be at least 1")
+    try:
+        return auth_stats.report(resolution, last)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -2,101 +2,156 @@
 KeyAuth - Authentication Routes
 Handles login via keystroke matching.
 """
+import time
+from typing import Dict, List, Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User, AuthLog
+from app.admission import admission
+from app.auth_stats import auth_stats
+from app.database import get_db, run_write
+from app.models import User, AuthLog, KeystrokeProfile
 from app.schemas import AuthRequest, AuthResponse
+from app.ml.digraph_features import SparseVector, optional_digraph_features
 from app.ml.feature_extractor import extract_features
+from app.ml.feature_matrix import profile_vectors
+from app.ml.feature_schema import device_class, get_schema, schema_for_device
+from app.ml.keystrokes import KeystrokeArrays
 from app.ml.model import KeystrokeAuthModel
+from app.ml.shadow import ShadowItem, shadow_scorer
+from app.ml.snapshot import model_snapshot
 from app.auth import create_access_token
+from app.response_cache import bump_auth_log_version, response_cache
 from app.security import anti_replay, rate_limiter
 from app.config import settings
 
 router = APIRouter(prefix="/api", tags=["Authentication"])
 
 
-@router.post("/authenticate", response_model=AuthResponse)
-def authenticate_user(req: AuthRequest, request: Request, db: Session = Depends(get_db)):
-    """
-    Authenticate a user by analyzing their keystroke patterns.
-    
-    Process:
-      1. Verify user exists and is enrolled
-      2. Check rate limits and anti-replay
-      3. Extract features from submitted keystrokes
-      4. Load user's trained model
-      5. Compare patterns and compute confidence score
-      6. If score > threshold → issue JWT token
-    """
-    # ── Rate Limiting ───────────────────────────────────────────
-    if not rate_limiter.is_allowed(req.username):
-        remaining = rate_limiter.remaining_attempts(req.username)
+def check_rate_limit(username: str):
+    """Reject the attempt with 429 if the user is over the rate limit, else record it."""
+    if not rate_limiter.is_allowed(username):
+        remaining = rate_limiter.remaining_attempts(username)
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Too many authentication attempts. Please wait before trying again. Remaining: {remaining}",
         )
-    rate_limiter.record_attempt(req.username)
+    rate_limiter.record_attempt(username)
+
+
+def candidate_profiles(user: User, device_type: Optional[str]) -> List[KeystrokeProfile]:
+    """
+    The user's profiles that can score a sample from ``device_type``: the
+    device's own profile first, then any other profile whose schema the
+    sample's features cover (a mobile sample can use a web profile), or that
+    predates feature schemas (those served every device as one model).
+    """
+    device = device_class(device_type)
+    schema = schema_for_device(device)
+    own = [p for p in user.keystroke_profiles if p.device_type == device]
+    others = [
+        p for p in user.keystroke_profiles
+        if p.device_type != device and (p.feature_schema is None or schema.covers(get_schema(p.feature_schema)))
+    ]
+    return own + others
+
+
+def load_auth_model(
+    db: Session, username: str, device_type: Optional[str] = "web"
+) -> Tuple[User, KeystrokeProfile, KeystrokeAuthModel]:
+    """
+    Look up an enrolled user and load the trained model that scores samples
+    from ``device_type``, from the model snapshot when it is current for
+    that profile, otherwise from the database.
 
-    # ── Find User ───────────────────────────────────────────────
-    user = db.query(User).filter(User.username == req.username).first()
+    Raises:
+        HTTPException: 404 unknown user, 403 not enrolled (on this device),
+            500 no trained model
+    """
+    user = db.query(User).filter(User.username == username).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User '{req.username}' not found",
+            detail=f"User '{username}' not found",
         )
 
+    profiles = candidate_profiles(user, device_type)
     if not user.is_enrolled:
-        profile = user.keystroke_profile
-        samples = profile.sample_count if profile else 0
+        samples = max((p.sample_count for p in profiles), default=0)
         remaining = settings.ENROLLMENT_SAMPLES_REQUIRED - samples
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"User not fully enrolled. {remaining} more typing sample(s) needed.",
         )
 
-    # ── Anti-Replay Check ───────────────────────────────────────
-    if not anti_replay.check_and_record(req.keystrokes):
+    for profile in profiles:
+        snapshot_model = model_snapshot.get(profile.id, profile.updated_at)
+        if snapshot_model is not None:
+            return user, profile, snapshot_model
+        if profile.model_data:
+            return user, profile, KeystrokeAuthModel.deserialize(profile.model_data, profile_vectors(profile))
+
+    if not any(p.sample_count >= settings.ENROLLMENT_SAMPLES_REQUIRED for p in profiles):
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Duplicate submission detected. Please type the phrase again.",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"User not enrolled on {device_class(device_type)} devices. Log in from an enrolled device and enroll this one.",
         )
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="No trained model found for this user.",
+    )
 
-    # ── Extract Features ────────────────────────────────────────
-    try:
-        features = extract_features(req.keystrokes)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
 
-    # ── Load Model & Authenticate ───────────────────────────────
-    profile = user.keystroke_profile
-    if not profile or not profile.model_data:
+def check_replay(arrays: KeystrokeArrays):
+    """Reject a submission that was already seen within the anti-replay window."""
+    if not anti_replay.check_and_record(arrays):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="No trained model found for this user.",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Duplicate submission detected. Please type the phrase again.",
         )
 
-    auth_model = KeystrokeAuthModel.deserialize(profile.model_data)
-    confidence_score, method = auth_model.authenticate(features["vector"])
+
+def decide(
+    db: Session,
+    user: User,
+    profile: KeystrokeProfile,
+    auth_model: KeystrokeAuthModel,
+    features: Dict,
+    device_type: str,
+    client_ip: Optional[str],
+    digraph: Optional[SparseVector] = None,
+) -> AuthResponse:
+    """Score the features in the profile's schema, log the attempt and build the response."""
+    vector = get_schema(profile.feature_schema).project(features["vector"])
+    confidence_score, method = auth_model.authenticate(vector, digraph)
     confidence_score = round(confidence_score, 4)
 
     # ── Decision ────────────────────────────────────────────────
     threshold = profile.threshold or settings.AUTH_CONFIDENCE_THRESHOLD
     authenticated = confidence_score >= threshold
 
-    # Get client IP
-    client_ip = request.client.host if request.client else None
-
     # Log the attempt
     auth_log = AuthLog(
         user_id=user.id,
         confidence_score=confidence_score,
         result="accepted" if authenticated else "rejected",
-        device_type=req.device_type,
+        device_type=device_type,
         ip_address=client_ip,
     )
-    db.add(auth_log)
-    db.commit()
+    user_id = user.id
+
+    def _log_attempt(session):
+        session.add(auth_log)
+        bump_auth_log_version(session, [user_id])  # New ETag for the user's history and profile
+
+    run_write(db, _log_attempt, user.username)
+    response_cache.invalidate(user_id)
+    auth_stats.record(authenticated, confidence_score, method)
+    if shadow_scorer.enabled:
+        # Candidate scorers see the same attempt after the decision, on background workers
+        shadow_scorer.submit(ShadowItem(
+            (profile.id, profile.updated_at), auth_model, vector, digraph,
+            confidence_score, threshold, user_id, device_type, time.time(),
+        ))
 
     # ── Response ────────────────────────────────────────────────
     if authenticated:
@@ -114,3 +169,33 @@ def authenticate_user(req: AuthRequest, request: Request, db: Session = Depends(
             message=f"❌ Authentication failed. Confidence {confidence_score:.1%} is below threshold {threshold:.1%}.",
             token=None,
         )
+
+
+@router.post("/authenticate", response_model=AuthResponse, dependencies=[Depends(admission.slot("authenticate"))])
+def authenticate_user(req: AuthRequest, request: Request, db: Session = Depends(get_db)):
+    """
+    Authenticate a user by analyzing their keystroke patterns.
+
+    Process:
+      1. Check rate limits
+      2. Verify user exists and is enrolled, load the model for their device
+      3. Anti-replay check
+      4. Extract features from submitted keystrokes
+      5. Compare patterns and compute confidence score
+      6. If score > threshold → issue JWT token
+    """
+    check_rate_limit(req.username)
+    user, profile, auth_model = load_auth_model(db, req.username, req.device_type)
+    check_replay(req.arrays)
+
+    # ── Extract Features ────────────────────────────────────────
+    try:
+        features = extract_features(req.arrays)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    digraph = optional_digraph_features(req.arrays)
+
+    # Get client IP
+    client_ip = request.client.host if request.client else None
+
+    return decide(db, user, profile, auth_model, features, req.device_type, client_ip, digraph)
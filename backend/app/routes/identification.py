@@ -0,0 +1,86 @@
+"""
+KeyAuth - Identification Routes
+1:N "type to log in" lookup without a claimed username.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from app.admission import admission
+from app.database import get_db
+from app.models import User, KeystrokeProfile
+from app.schemas import IdentifyRequest, IdentifyResponse, IdentifyCandidate
+from app.ml.digraph_features import optional_digraph_features
+from app.ml.feature_extractor import extract_features
+from app.ml.feature_matrix import profile_vectors
+from app.ml.feature_schema import device_class, get_schema
+from app.ml.model import KeystrokeAuthModel
+from app.ml.profile_index import profile_index_for
+from app.routes.authentication import check_rate_limit, check_replay
+from app.config import settings
+
+router = APIRouter(prefix="/api", tags=["Identification"])
+
+
+@router.post("/identify", response_model=IdentifyResponse, dependencies=[Depends(admission.slot("authenticate"))])
+def identify_user(req: IdentifyRequest, request: Request, db: Session = Depends(get_db)):
+    """
+    Find the enrolled users whose typing best matches the sample.
+
+    Process:
+      1. Rate limit per client IP and anti-replay check
+      2. Extract features
+      3. Generate candidates from the device's in-memory profile index
+      4. Re-rank candidates with their full trained models for that device
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    check_rate_limit(f"identify:{client_ip}")
+    check_replay(req.arrays)
+
+    try:
+        features = extract_features(req.arrays)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    digraph = optional_digraph_features(req.arrays)
+
+    # ── Candidate Generation ────────────────────────────────────
+    device = device_class(req.device_type)
+    profile_index = profile_index_for(device)
+    profile_index.ensure_loaded(db)
+    query = profile_index.schema.project(features["vector"])
+    candidates = profile_index.search(query, max(settings.IDENTIFY_CANDIDATES, req.top_k))
+    distances = {user_id: distance for user_id, _, distance in candidates}
+
+    # ── Re-rank With Full Models ────────────────────────────────
+    rows = (
+        db.query(
+            User.id,
+            User.username,
+            User.name,
+            KeystrokeProfile.model_data,
+            KeystrokeProfile.threshold,
+            KeystrokeProfile.feature_schema,
+            KeystrokeProfile.feature_matrix,
+            KeystrokeProfile.feature_vectors,
+        )
+        .join(KeystrokeProfile, KeystrokeProfile.user_id == User.id)
+        .filter(User.id.in_(list(distances)), KeystrokeProfile.device_type == device)
+        .all()
+    )
+    ranked = []
+    for row in rows:
+        user_id, username, name, model_data, threshold = row[:5]
+        if not model_data:
+            continue
+        auth_model = KeystrokeAuthModel.deserialize(model_data, profile_vectors(row))
+        vector = get_schema(row.feature_schema).project(features["vector"])
+        confidence, _ = auth_model.authenticate(vector, digraph)
+        confidence = round(confidence, 4)
+        ranked.append(IdentifyCandidate(
+            username=username,
+            name=name,
+            confidence_score=confidence,
+            distance=round(distances[user_id], 4),
+            matches=confidence >= (threshold or settings.AUTH_CONFIDENCE_THRESHOLD),
+        ))
+    ranked.sort(key=lambda c: c.confidence_score, reverse=True)
+
+    return IdentifyResponse(indexed_users=len(profile_index), candidates=ranked[:req.top_k])
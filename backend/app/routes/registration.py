@@ -2,24 +2,60 @@
 KeyAuth - Registration & Enrollment Routes
 Handles user creation and keystroke enrollment sample collection.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional, Tuple
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.admission import admission
+from app.database import get_db, run_write
 from app.models import User, KeystrokeProfile, EnrollmentSample
 from app.schemas import (
     RegisterRequest,
     EnrollRequest,
+    EnrollBatchRequest,
     EnrollmentStatusResponse,
     MessageResponse,
 )
-from app.ml.feature_extractor import extract_features
+from app.ml.digraph_features import optional_digraph_features, pack_sparse, unpack_sparse_vectors
+from app.ml.feature_extractor import FEATURE_VERSION, extract_features
+from app.ml.feature_matrix import (
+    append_row,
+    extract_profile_matrix,
+    pack_rows,
+    profile_feature_version,
+    profile_matrix,
+    unpack_matrix,
+)
+from app.ml.feature_schema import FeatureSchema, device_class, get_schema, schema_for_device
+from app.ml.keystrokes import KeystrokeArrays
 from app.ml.model import KeystrokeAuthModel
+from app.ml.profile_index import profile_index_for
+from app.auth import optional_security, verify_token
+from app.response_cache import response_cache
 from app.config import settings
 
 router = APIRouter(prefix="/api", tags=["Registration & Enrollment"])
 
 
-@router.post("/register", response_model=EnrollmentStatusResponse, status_code=201)
+def sizing_impostors(db: Session, device: str, schema: FeatureSchema, user_id: Optional[str]) -> Optional[np.ndarray]:
+    """Other users' centroids in ``schema``, when Isolation Forest sizing needs impostor examples."""
+    if not settings.IF_SIZING_ENABLED:
+        return None
+    index = profile_index_for(device)
+    if not index.schema.covers(schema):
+        return None
+    index.ensure_loaded(db)
+    return schema.project(index.centroids(exclude_user_id=user_id), index.schema)
+
+
+@router.post(
+    "/register",
+    response_model=EnrollmentStatusResponse,
+    status_code=201,
+    dependencies=[Depends(admission.slot("enroll"))],
+)
 def register_user(req: RegisterRequest, db: Session = Depends(get_db)):
     """
     Register a new user and submit the first enrollment typing sample.
@@ -36,36 +72,50 @@ def register_user(req: RegisterRequest, db: Session = Depends(get_db)):
 
     # Extract features from the first typing sample
     try:
-        features = extract_features(req.keystrokes)
+        features = extract_features(req.arrays)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # Create user
-    user = User(
-        username=req.username,
-        name=req.name,
-        device_type=req.device_type,
-    )
-    db.add(user)
-    db.flush()  # Get the user ID
-
-    # Create keystroke profile
-    profile = KeystrokeProfile(
-        user_id=user.id,
-        feature_vectors=[features["vector"]],
-        sample_count=1,
-    )
-    db.add(profile)
-
-    # Store the enrollment sample
-    sample = EnrollmentSample(
-        user_id=user.id,
-        raw_keystrokes=[ks.model_dump() for ks in req.keystrokes],
-        features=features["vector"],
-        device_type=req.device_type,
-    )
-    db.add(sample)
-    db.commit()
+    digraph = optional_digraph_features(req.arrays)
+    schema = schema_for_device(req.device_type)
+
+    # Create user, keystroke profile and the first enrollment sample
+    def _create_user(session):
+        user = User(
+            username=req.username,
+            name=req.name,
+            device_type=req.device_type,
+        )
+        session.add(user)
+        session.flush()  # Get the user ID
+
+        profile = KeystrokeProfile(
+            user_id=user.id,
+            device_type=device_class(req.device_type),
+            feature_schema=schema.name,
+            feature_matrix=pack_rows([schema.project(features["vector"])]),
+            feature_version=FEATURE_VERSION,
+            digraph_vectors=pack_sparse(digraph) if digraph is not None else None,
+            sample_count=1,
+        )
+        session.add(profile)
+
+        sample = EnrollmentSample(
+            user_id=user.id,
+            raw_keystrokes=req.arrays.to_records(),
+            device_type=req.device_type,
+            feature_version=FEATURE_VERSION,
+        )
+        session.add(sample)
+        return user
+
+    try:
+        user = run_write(db, _create_user, req.username)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Username '{req.username}' is already taken",
+        )
 
     return EnrollmentStatusResponse(
         username=user.username,
@@ -77,77 +127,179 @@ def register_user(req: RegisterRequest, db: Session = Depends(get_db)):
     )
 
 
-@router.post("/enroll", response_model=EnrollmentStatusResponse)
-def enroll_sample(req: EnrollRequest, db: Session = Depends(get_db)):
+def _reextract_profile(
+    db: Session, profile: KeystrokeProfile, schema: FeatureSchema
+) -> Tuple[bytes, Optional[bytes], List[str]]:
     """
-    Submit an additional enrollment typing sample.
-    
-    After collecting enough samples, the ML model is automatically trained.
+    The packed matrix and digraph vectors of a profile stored with an older
+    FEATURE_VERSION, extracted again from its samples' raw keystrokes, and
+    the ids of those samples.
+    """
+    samples = [
+        sample
+        for sample in db.query(EnrollmentSample)
+        .filter(EnrollmentSample.user_id == profile.user_id)
+        .order_by(EnrollmentSample.created_at)
+        if device_class(sample.device_type) == profile.device_type
+    ]
+    if len(samples) != profile.sample_count or any(sample.raw_keystrokes is None for sample in samples):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Stored samples for this device predate feature version {FEATURE_VERSION} and cannot be re-extracted.",
+        )
+    try:
+        feature_matrix, digraph_vectors = extract_profile_matrix(
+            [KeystrokeArrays.from_records(sample.raw_keystrokes) for sample in samples], schema,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Stored samples cannot be re-extracted: {e}")
+    return feature_matrix, digraph_vectors, [sample.id for sample in samples]
+
+
+def _enroll_samples(
+    db: Session,
+    username: str,
+    device_type: str,
+    samples: List[KeystrokeArrays],
+    credentials: Optional[HTTPAuthorizationCredentials],
+    name: Optional[str] = None,
+) -> EnrollmentStatusResponse:
+    """
+    Add typing samples to a user's profile for one device class, training the
+    model once enough samples are collected. With ``name``, a user that does
+    not exist yet is registered in the same write (and an existing one is a
+    conflict).
     """
     # Find user
-    user = db.query(User).filter(User.username == req.username).first()
-    if not user:
+    user = db.query(User).filter(User.username == username).first()
+    if not user and name is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User '{req.username}' not found. Please register first.",
+            detail=f"User '{username}' not found. Please register first.",
+        )
+    if user and name is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Username '{username}' is already taken",
         )
 
-    if user.is_enrolled:
+    device = device_class(device_type)
+    profile = user.profile_for(device) if user else None
+    if profile is not None and profile.sample_count >= settings.ENROLLMENT_SAMPLES_REQUIRED:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User is already fully enrolled. Use re-enroll to update your typing pattern.",
         )
+    if user and profile is None and user.is_enrolled:
+        if credentials is None or verify_token(credentials.credentials).get("sub") != user.username:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Log in first to enroll a new {device} device.",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
 
-    # Extract features
-    try:
-        features = extract_features(req.keystrokes)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    # Store enrollment sample
-    sample = EnrollmentSample(
-        user_id=user.id,
-        raw_keystrokes=[ks.model_dump() for ks in req.keystrokes],
-        features=features["vector"],
-        device_type=req.device_type,
-    )
-    db.add(sample)
-
-    # Update profile
-    profile = user.keystroke_profile
-    if profile.feature_vectors is None:
-        profile.feature_vectors = []
-
-    # SQLAlchemy JSON mutation detection
-    vectors = list(profile.feature_vectors)
-    vectors.append(features["vector"])
-    profile.feature_vectors = vectors
-    profile.sample_count = len(vectors)
+    # Extract features; project onto the schema the profile was (or will be) enrolled with
+    schema = get_schema(profile.feature_schema) if profile is not None else schema_for_device(device)
+    feature_matrix = profile_matrix(profile) if profile is not None else None
+    digraph_vectors = profile.digraph_vectors if profile is not None else None
+    stale_sample_ids: List[str] = []
+    if profile is not None and profile_feature_version(profile) != FEATURE_VERSION:
+        # Never mix rows of two feature versions: re-extract the stored samples first
+        feature_matrix, digraph_vectors, stale_sample_ids = _reextract_profile(db, profile, schema)
+    for i, arrays in enumerate(samples):
+        try:
+            # Append packed rows; the stored rows are not re-encoded
+            feature_matrix = append_row(feature_matrix, schema.project(extract_features(arrays)["vector"]))
+        except ValueError as e:
+            detail = str(e) if len(samples) == 1 else f"Sample {i + 1}: {e}"
+            raise HTTPException(status_code=400, detail=detail)
+        digraph = optional_digraph_features(arrays)
+        if digraph is not None:
+            digraph_vectors = (digraph_vectors or b"") + pack_sparse(digraph)
+    vectors = unpack_matrix(feature_matrix)
 
     # Check if we have enough samples to train the model
-    samples_collected = profile.sample_count
+    samples_collected = len(vectors)
     is_enrolled = samples_collected >= settings.ENROLLMENT_SAMPLES_REQUIRED
 
+    model_data = None
     if is_enrolled:
         # Train the ML model
         auth_model = KeystrokeAuthModel()
-        for vec in profile.feature_vectors:
-            auth_model.add_training_sample(vec)
-        auth_model.train()
+        auth_model.training_vectors = vectors
+        auth_model.digraph_vectors = unpack_sparse_vectors(digraph_vectors)
+        impostors = sizing_impostors(db, device, schema, user.id if user else None)
+        auth_model.train(profile.scorer if profile is not None else None, impostors)
 
-        # Serialize and store the trained model
-        profile.model_data = auth_model.serialize()
-        user.is_enrolled = True
+        # Serialize the trained model for storage
+        model_data = auth_model.serialize()
         message = "🎉 Enrollment complete! Your typing pattern has been learned. You can now authenticate."
     else:
         remaining = settings.ENROLLMENT_SAMPLES_REQUIRED - samples_collected
-        message = f"Sample recorded. {remaining} more sample(s) needed to complete enrollment."
+        recorded = "Sample recorded" if len(samples) == 1 else f"{len(samples)} samples recorded"
+        message = f"{recorded}. {remaining} more sample(s) needed to complete enrollment."
 
-    db.commit()
+    user_id = user.id if user else None
+    profile_id = profile.id if profile is not None else None
+
+    def _store_samples(session):
+        if user_id is None:
+            new_user = User(username=username, name=name, device_type=device_type)
+            session.add(new_user)
+            session.flush()  # Get the user ID
+            stored_user_id = new_user.id
+        else:
+            stored_user_id = user_id
+        session.add_all([
+            EnrollmentSample(
+                user_id=stored_user_id,
+                raw_keystrokes=arrays.to_records(),
+                device_type=device_type,
+                feature_version=FEATURE_VERSION,
+            )
+            for arrays in samples
+        ])
+        if stale_sample_ids:
+            session.query(EnrollmentSample).filter(EnrollmentSample.id.in_(stale_sample_ids)).update(
+                {EnrollmentSample.feature_version: FEATURE_VERSION}, synchronize_session=False,
+            )
+        if profile_id is None:
+            stored_profile = KeystrokeProfile(user_id=stored_user_id, device_type=device, feature_schema=schema.name)
+            session.add(stored_profile)
+        else:
+            stored_profile = session.get(KeystrokeProfile, profile_id)
+        stored_profile.feature_matrix = feature_matrix
+        stored_profile.feature_version = FEATURE_VERSION
+        stored_profile.feature_vectors = None
+        stored_profile.digraph_vectors = digraph_vectors
+        stored_profile.sample_count = samples_collected
+        if is_enrolled:
+            stored_profile.model_data = model_data
+            stored_profile.model_cost = auth_model.model_cost
+            session.get(User, stored_user_id).is_enrolled = True
+            if settings.TRIM_ENROLLMENT_KEYSTROKES:
+                session.flush()
+                for sample in session.query(EnrollmentSample).filter(EnrollmentSample.user_id == stored_user_id):
+                    if device_class(sample.device_type) == device:
+                        sample.raw_keystrokes = None  # Features are in the profile's matrix
+        return stored_user_id
+
+    try:
+        user_id = run_write(db, _store_samples, username)
+    except IntegrityError:
+        detail = (
+            f"Username '{username}' is already taken" if user is None
+            else "Another enrollment for this device is in progress. Please retry."
+        )
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+    response_cache.invalidate(user_id)
+    if is_enrolled:
+        index_schema = schema_for_device(device)
+        profile_index_for(device).upsert(user_id, username, index_schema.project(vectors, schema))
 
     return EnrollmentStatusResponse(
-        username=user.username,
-        name=user.name,
+        username=username,
+        name=user.name if user else name,
         samples_collected=samples_collected,
         samples_required=settings.ENROLLMENT_SAMPLES_REQUIRED,
         is_enrolled=is_enrolled,
@@ -155,24 +307,80 @@ def enroll_sample(req: EnrollRequest, db: Session = Depends(get_db)):
     )
 
 
-@router.get("/enrollment-status/{username}", response_model=EnrollmentStatusResponse)
-def get_enrollment_status(username: str, db: Session = Depends(get_db)):
-    """Check enrollment progress for a user."""
+@router.post("/enroll", response_model=EnrollmentStatusResponse, dependencies=[Depends(admission.slot("enroll"))])
+def enroll_sample(
+    req: EnrollRequest,
+    db: Session = Depends(get_db),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    """
+    Submit an additional enrollment typing sample.
+    
+    Samples are collected per device class (web, mobile), each with its own
+    profile and model. After collecting enough samples for a device, its ML
+    model is automatically trained. Adding a new device to an already
+    enrolled user requires that user's bearer token.
+    """
+    return _enroll_samples(db, req.username, req.device_type, [req.arrays], credentials)
+
+
+@router.post(
+    "/enroll/batch",
+    response_model=EnrollmentStatusResponse,
+    dependencies=[Depends(admission.slot("enroll"))],
+)
+def enroll_batch(
+    req: EnrollBatchRequest,
+    db: Session = Depends(get_db),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    """
+    Submit several enrollment typing samples at once.
+
+    All samples are validated before any is stored, then stored together
+    and the model is trained once if they complete enrollment. Fewer samples
+    than required are recorded as progress. With ``name``, the username is
+    registered by the same call (409 if taken), so a client can buffer a
+    whole enrollment and send it in one request.
+    """
+    samples = [sample.arrays for sample in req.samples]
+    return _enroll_samples(db, req.username, req.device_type, samples, credentials, name=req.name)
+
+
+@router.get(
+    "/enrollment-status/{username}",
+    response_model=EnrollmentStatusResponse,
+    dependencies=[Depends(admission.slot("read"))],
+)
+def get_enrollment_status(
+    username: str,
+    request: Request,
+    device_type: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Check enrollment progress for a user on one device class (default: the one they registered with).
+    Sends an ETag and answers If-None-Match with 304.
+    """
     user = db.query(User).filter(User.username == username).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User '{username}' not found",
         )
+    etag, cached = response_cache.lookup(request, db, user)
+    if cached is not None:
+        return cached
 
-    profile = user.keystroke_profile
+    profile = user.profile_for(device_type or user.device_type)
     samples = profile.sample_count if profile else 0
+    is_enrolled = user.is_enrolled and samples >= settings.ENROLLMENT_SAMPLES_REQUIRED
 
-    return EnrollmentStatusResponse(
+    return response_cache.respond(request, user.id, etag, EnrollmentStatusResponse(
         username=user.username,
         name=user.name,
         samples_collected=samples,
         samples_required=settings.ENROLLMENT_SAMPLES_REQUIRED,
-        is_enrolled=user.is_enrolled,
-        message="Enrollment complete" if user.is_enrolled else f"{settings.ENROLLMENT_SAMPLES_REQUIRED - samples} more sample(s) needed",
-    )
+        is_enrolled=is_enrolled,
+        message="Enrollment complete" if is_enrolled else f"{settings.ENROLLMENT_SAMPLES_REQUIRED - samples} more sample(s) needed",
+    ))
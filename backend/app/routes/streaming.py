@@ -0,0 +1,187 @@
+"""
+KeyAuth - Streaming Authentication Routes
+WebSocket login that ingests key events while the user is still typing.
+
+Protocol (JSON text frames):
+  client → {"type": "start", "username": "...", "device_type": "web"}
+  client → {"type": "key", "key": "t", "press_time": ..., "release_time": ..., ...}   (repeated)
+  client → {"type": "end"}
+  server → {"type": "result", "authenticated": ..., "confidence_score": ..., "message": ..., "token": ...}
+        or {"type": "error", "status": 4xx, "detail": "..."}
+
+The user's model is loaded in the background as soon as "start" arrives and
+features accumulate per event, so only scoring is left once "end" arrives.
+The database is only used for that load and for logging the attempt, each
+on a session of its own, so an open socket holds no connection. A stream
+silent for STREAM_IDLE_TIMEOUT_SECONDS is closed, and scoring takes an
+"authenticate" admission slot like POST /api/authenticate.
+
+/ws/session scores an already logged-in user continuously:
+  client → {"type": "start", "token": "<JWT>", "device_type": "web"}
+  client → {"type": "key", ...}                                  (any number)
+  server → {"type": "trust", "events": ..., "confidence": ..., "trust": ..., "trusted": ...}
+           every SESSION_RESCORE_EVERY events
+
+The model is loaded on a short-lived session at "start"; the open socket
+holds no database connection. "start" must arrive within
+STREAM_IDLE_TIMEOUT_SECONDS, and the stream is closed after
+SESSION_IDLE_TIMEOUT_SECONDS without a message.
+"""
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from app.admission import admission
+from app.auth import verify_token
+from app.config import settings
+from app.database import SessionLocal
+from app.memory import track_session
+from app.schemas import KeystrokeEvent
+from app.ml.digraph_features import optional_digraph_features
+from app.ml.feature_schema import get_schema
+from app.ml.session import SessionScorer
+from app.ml.streaming import KeystrokeAccumulator
+from app.routes.authentication import check_rate_limit, check_replay, decide, load_auth_model
+
+router = APIRouter(prefix="/ws", tags=["Streaming Authentication"])
+
+MIN_KEYSTROKES = 5
+
+
+def _in_session(work, *args):
+    """Run ``work(db, *args)`` on a session of its own, closed as soon as it returns (call in a thread)."""
+    with SessionLocal() as db:
+        track_session(db)
+        return work(db, *args)
+
+
+async def _receive(websocket: WebSocket, timeout: Optional[float] = None):
+    """Next JSON message; 408 if none arrives within ``timeout`` (default STREAM_IDLE_TIMEOUT_SECONDS)."""
+    if timeout is None:
+        timeout = settings.STREAM_IDLE_TIMEOUT_SECONDS
+    try:
+        return await asyncio.wait_for(websocket.receive_json(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_408_REQUEST_TIMEOUT, detail="No message received in time")
+
+
+@router.websocket("/authenticate")
+async def authenticate_stream(websocket: WebSocket):
+    """Authenticate from a stream of key events (see module docstring for the protocol)."""
+    await websocket.accept()
+    prefetch = None
+    try:
+        start = await _receive(websocket)
+        if not isinstance(start, dict) or start.get("type") != "start" or not start.get("username"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="First message must be {'type': 'start', 'username': ...}",
+            )
+        username = start["username"]
+        device_type = start.get("device_type", "web")
+
+        check_rate_limit(username)
+        prefetch = asyncio.ensure_future(run_in_threadpool(_in_session, load_auth_model, username, device_type))
+
+        accumulator = KeystrokeAccumulator()
+        while True:
+            message = await _receive(websocket)
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "end":
+                break
+            if kind != "key":
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a 'key' or 'end' message")
+            try:
+                event = KeystrokeEvent.model_validate(message)
+            except ValidationError as e:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+            accumulator.add(event.key, event.press_time, event.release_time, event.pressure, event.touch_size)
+
+            # Surface a failed prefetch (unknown / unenrolled user) without waiting for "end"
+            if prefetch.done():
+                prefetch.result()
+
+        if len(accumulator) < MIN_KEYSTROKES:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"At least {MIN_KEYSTROKES} keystrokes are required",
+            )
+
+        user, profile, auth_model = await prefetch
+        arrays = accumulator.arrays()
+        check_replay(arrays)
+        features = accumulator.features()
+        digraph = optional_digraph_features(arrays)
+
+        client_ip = websocket.client.host if websocket.client else None
+        async with admission.hold("authenticate"):
+            response = await run_in_threadpool(
+                _in_session, decide, user, profile, auth_model, features, device_type, client_ip, digraph,
+            )
+        await websocket.send_json({"type": "result", **response.model_dump()})
+        await websocket.close()
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    except ValueError:
+        await websocket.send_json({"type": "error", "status": 400, "detail": "Messages must be JSON objects"})
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Don't leave an in-flight model load behind the closed socket
+        if prefetch is not None:
+            await asyncio.gather(prefetch, return_exceptions=True)
+
+
+@router.websocket("/session")
+async def score_session(websocket: WebSocket):
+    """Continuously score a logged-in user's typing (see module docstring)."""
+    await websocket.accept()
+    try:
+        start = await _receive(websocket)
+        if not isinstance(start, dict) or start.get("type") != "start" or not start.get("token"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="First message must be {'type': 'start', 'token': ...}",
+            )
+        payload = verify_token(start["token"])
+        device_type = start.get("device_type", "web")
+        # The only database read; scoring works from the loaded model
+        user, profile, auth_model = await run_in_threadpool(_in_session, load_auth_model, payload["sub"], device_type)
+        threshold = profile.threshold or settings.AUTH_CONFIDENCE_THRESHOLD
+
+        scorer = SessionScorer(
+            auth_model,
+            schema=get_schema(profile.feature_schema),
+            rescore_every=settings.SESSION_RESCORE_EVERY,
+            pane_size=settings.SESSION_PANE_SIZE,
+            panes=settings.SESSION_PANES,
+            smoothing=settings.SESSION_TRUST_SMOOTHING,
+        )
+        while True:
+            message = await _receive(websocket, settings.SESSION_IDLE_TIMEOUT_SECONDS)
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "end":
+                break
+            if kind != "key":
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a 'key' or 'end' message")
+            try:
+                event = KeystrokeEvent.model_validate(message)
+            except ValidationError as e:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+            if scorer.add(event.press_time, event.release_time, event.pressure, event.touch_size):
+                update = await run_in_threadpool(scorer.score)
+                await websocket.send_json({"type": "trust", **update, "trusted": update["trust"] >= threshold})
+
+        await websocket.close()
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    except ValueError:
+        await websocket.send_json({"type": "error", "status": 400, "detail": "Messages must be JSON objects"})
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+    except WebSocketDisconnect:
+        pass
@@ -2,33 +2,90 @@
 KeyAuth - User Profile Routes
 Protected endpoints for user data and auth history.
 """
-from fastapi import APIRouter, Depends
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
+from app.admission import admission
 from app.database import get_db
-from app.models import User, AuthLog
-from app.schemas import UserProfile, AuthHistoryResponse, AuthLogEntry
+from app.models import User, AuthLog, AuthLogDaily
+from app.schemas import UserProfile, AuthHistoryResponse, AuthLogEntry, AuthDailyEntry
 from app.auth import get_current_user
+from app.response_cache import response_cache
 
-router = APIRouter(prefix="/api/user", tags=["User Profile"])
+router = APIRouter(prefix="/api/user", tags=["User Profile"], dependencies=[Depends(admission.slot("read"))])
+
+
+def _last_attempts(raw, days, n: int) -> Tuple[int, float, float]:
+    """
+    (attempts, accepted, confidence sum) over the last ``n`` attempts: the
+    ``raw`` (result, confidence) pairs first, newest first, then the newest
+    ``days`` rows (a partly used day counts pro rata).
+    """
+    attempts, accepted, confidence = 0, 0.0, 0.0
+    for result, score in raw[:n]:
+        attempts += 1
+        accepted += result == "accepted"
+        confidence += score
+    if attempts < n:
+        for day in days:
+            take = min(day.attempts, n - attempts)
+            accepted += day.accepted * take / day.attempts
+            confidence += day.confidence_sum * take / day.attempts
+            attempts += take
+            if attempts >= n:
+                break
+    return attempts, accepted, confidence
+
+
+def recent_accept_rate(db: Session, user_id: str, n: int = 20) -> Optional[float]:
+    """
+    Share of the user's last ``n`` attempts that were accepted. Raw logs come
+    first; once compaction has rolled older ones up, the newest daily rows
+    make up the rest (a partly used day counts pro rata).
+    """
+    raw = (
+        db.query(AuthLog.result, AuthLog.confidence_score)
+        .filter(AuthLog.user_id == user_id)
+        .order_by(AuthLog.timestamp.desc())
+        .limit(n)
+        .all()
+    )
+    days = ()
+    if len(raw) < n:
+        days = (
+            db.query(AuthLogDaily)
+            .filter(AuthLogDaily.user_id == user_id)
+            .order_by(AuthLogDaily.day.desc())
+        )
+    attempts, accepted, _ = _last_attempts(raw, days, n)
+    return accepted / attempts if attempts else None
 
 
 @router.get("/profile", response_model=UserProfile)
-def get_profile(current_user: User = Depends(get_current_user)):
+def get_profile(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
     """
     Get the authenticated user's profile.
-    Requires valid JWT token.
+    Requires valid JWT token. Sends an ETag and answers If-None-Match with 304.
     """
-    profile = current_user.keystroke_profile
+    etag, cached = response_cache.lookup(request, db, current_user)
+    if cached is not None:
+        return cached
+
+    profile = current_user.profile_for(current_user.device_type)
     samples = profile.sample_count if profile else 0
 
     # Compute security score based on enrollment completeness and auth history
     security_score = None
-    if current_user.is_enrolled and current_user.auth_logs:
-        recent_logs = sorted(current_user.auth_logs, key=lambda x: x.timestamp, reverse=True)[:20]
-        accepted = sum(1 for log in recent_logs if log.result == "accepted")
-        security_score = round((accepted / len(recent_logs)) * 100, 1) if recent_logs else None
+    if current_user.is_enrolled:
+        rate = recent_accept_rate(db, current_user.id)
+        security_score = round(rate * 100, 1) if rate is not None else None
 
-    return UserProfile(
+    return response_cache.respond(request, current_user.id, etag, UserProfile(
         id=current_user.id,
         username=current_user.username,
         name=current_user.name,
@@ -37,18 +94,25 @@ def get_profile(current_user: User = Depends(get_current_user)):
         enrollment_samples=samples,
         security_score=security_score,
         created_at=current_user.created_at,
-    )
+    ))
 
 
 @router.get("/auth-history", response_model=AuthHistoryResponse)
 def get_auth_history(
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
-    Get the authenticated user's authentication attempt history.
-    Requires valid JWT token.
+    Get the authenticated user's authentication attempt history: the 50 most
+    recent attempts with totals over the last 50, up to 90 days rolled up by
+    compaction, and all-time totals.
+    Requires valid JWT token. Sends an ETag and answers If-None-Match with 304.
     """
+    etag, cached = response_cache.lookup(request, db, current_user)
+    if cached is not None:
+        return cached
+
     logs = (
         db.query(AuthLog)
         .filter(AuthLog.user_id == current_user.id)
@@ -57,12 +121,36 @@ def get_auth_history(
         .all()
     )
 
-    total = len(logs)
-    accepted = sum(1 for log in logs if log.result == "accepted")
+    daily = (
+        db.query(AuthLogDaily)
+        .filter(AuthLogDaily.user_id == current_user.id)
+        .order_by(AuthLogDaily.day.desc(), AuthLogDaily.device_type)
+        .limit(90)
+        .all()
+    )
+
+    # Dashboard figures cover the last 50 attempts, as recent_accept_rate
+    # counts them; the 90 daily rows hold at least the 50 that may be missing
+    total, accepted, confidence_sum = _last_attempts(
+        [(log.result, log.confidence_score) for log in logs], daily, 50,
+    )
     success_rate = round((accepted / total) * 100, 1) if total > 0 else 0.0
-    avg_confidence = round(
-        sum(log.confidence_score for log in logs) / total * 100, 1
-    ) if total > 0 else 0.0
+    avg_confidence = round(confidence_sum / total * 100, 1) if total > 0 else 0.0
+
+    # All-time totals: raw logs still kept plus the rolled-up days
+    raw = db.query(
+        func.count(AuthLog.id),
+        func.sum(case((AuthLog.result == "accepted", 1), else_=0)),
+        func.sum(AuthLog.confidence_score),
+    ).filter(AuthLog.user_id == current_user.id).one()
+    rolled = db.query(
+        func.sum(AuthLogDaily.attempts),
+        func.sum(AuthLogDaily.accepted),
+        func.sum(AuthLogDaily.confidence_sum),
+    ).filter(AuthLogDaily.user_id == current_user.id).one()
+    all_time = (raw[0] or 0) + (rolled[0] or 0)
+    all_time_accepted = (raw[1] or 0) + (rolled[1] or 0)
+    all_time_confidence = (raw[2] or 0.0) + (rolled[2] or 0.0)
 
     history = [
         AuthLogEntry(
@@ -76,10 +164,23 @@ def get_auth_history(
         for log in logs
     ]
 
-    return AuthHistoryResponse(
+    return response_cache.respond(request, current_user.id, etag, AuthHistoryResponse(
         username=current_user.username,
         total_attempts=total,
         success_rate=success_rate,
         avg_confidence=avg_confidence,
+        all_time_attempts=all_time,
+        all_time_success_rate=round((all_time_accepted / all_time) * 100, 1) if all_time > 0 else 0.0,
+        all_time_avg_confidence=round(all_time_confidence / all_time * 100, 1) if all_time > 0 else 0.0,
         history=history,
-    )
+        daily=[
+            AuthDailyEntry(
+                day=row.day,
+                device_type=row.device_type,
+                attempts=row.attempts,
+                accepted=row.accepted,
+                avg_confidence=round(row.confidence_sum / row.attempts * 100, 1),
+            )
+            for row in daily
+        ],
+    ))
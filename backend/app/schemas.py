@@ -2,9 +2,14 @@
 KeyAuth - Pydantic Schemas
 Request/Response models for API validation
 """
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime
+from functools import cached_property
+from pydantic import BaseModel, Field, PlainValidator, WithJsonSchema, field_validator, model_validator
+from typing import Any, List, Optional
+from typing_extensions import Annotated
+from datetime import date, datetime
+import math
+import numpy as np
+from app.ml.keystrokes import KeystrokeArrays, decode_packed
 
 
 # ── Keystroke Data ──────────────────────────────────────────────
@@ -12,11 +17,115 @@ from datetime import datetime
 class KeystrokeEvent(BaseModel):
     """A single key press/release event."""
     key: str = Field(..., description="The key character pressed")
-    press_time: float = Field(..., description="Timestamp when key was pressed (ms)")
-    release_time: float = Field(..., description="Timestamp when key was released (ms)")
+    press_time: float = Field(..., allow_inf_nan=False, description="Timestamp when key was pressed (ms)")
+    release_time: float = Field(..., allow_inf_nan=False, description="Timestamp when key was released (ms)")
     pressure: Optional[float] = Field(None, description="Touch pressure (mobile only, 0-1)")
     touch_size: Optional[float] = Field(None, description="Touch area size (mobile only)")
 
+    @field_validator("pressure", "touch_size")
+    @classmethod
+    def _not_infinite(cls, value: Optional[float]) -> Optional[float]:
+        """None and NaN mean "no value"; infinity is rejected, as in _float_column."""
+        if value is not None and math.isinf(value):
+            raise ValueError("must not be infinite")
+        return value
+
+
+def _float_column(value: Any) -> np.ndarray:
+    """Decode a JSON number array (or an already-decoded array) to float64; null → NaN (no value)."""
+    if isinstance(value, np.ndarray):
+        column = value
+    elif isinstance(value, (list, tuple)):
+        try:
+            column = np.asarray(value, dtype=np.float64)  # None → NaN
+        except (TypeError, ValueError):
+            raise ValueError("must be an array of numbers")
+    else:
+        raise ValueError("must be an array of numbers")
+    if column.ndim != 1:
+        raise ValueError("must be a flat array of numbers")
+    if np.isinf(column).any():
+        raise ValueError("must not contain infinite values")
+    return column
+
+
+def _timing_column(value: Any) -> np.ndarray:
+    """Like _float_column, but every value is required: no null, NaN or infinity."""
+    column = _float_column(value)
+    if not np.isfinite(column).all():
+        raise ValueError("must contain only finite numbers (no null or NaN)")
+    return column
+
+
+FloatColumn = Annotated[
+    Any,
+    PlainValidator(_float_column),
+    WithJsonSchema({"type": "array", "items": {"type": ["number", "null"]}}),
+]
+TimingColumn = Annotated[
+    Any,
+    PlainValidator(_timing_column),
+    WithJsonSchema({"type": "array", "items": {"type": "number"}}),
+]
+
+
+class KeystrokeColumns(BaseModel):
+    """Parallel-array encoding of a typing session (one entry per keystroke)."""
+    keys: List[str] = Field(..., min_length=5, description="Key characters in typing order")
+    press_times: TimingColumn = Field(..., description="Press timestamps (ms)")
+    release_times: TimingColumn = Field(..., description="Release timestamps (ms)")
+    pressure: Optional[FloatColumn] = Field(None, description="Touch pressure (mobile only, 0-1)")
+    touch_size: Optional[FloatColumn] = Field(None, description="Touch area size (mobile only)")
+
+
+class KeystrokePayload(BaseModel):
+    """
+    Base for requests carrying a typing sample.
+
+    Accepts either ``keystrokes`` (list of event objects) or ``columns``
+    (parallel arrays). A packed binary body is decoded into ``columns``,
+    with the remaining fields taken from its JSON metadata.
+    """
+    keystrokes: Optional[List[KeystrokeEvent]] = Field(None, min_length=5, description="List of keystroke events")
+    columns: Optional[KeystrokeColumns] = Field(None, description="Columnar alternative to keystrokes")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _decode_packed_body(cls, data: Any) -> Any:
+        if isinstance(data, (bytes, bytearray)):
+            meta, arrays = decode_packed(bytes(data))
+            data = {
+                **meta,
+                "columns": {
+                    "keys": arrays.keys,
+                    "press_times": arrays.press_times,
+                    "release_times": arrays.release_times,
+                    "pressure": arrays.pressure,
+                    "touch_size": arrays.touch_size,
+                },
+            }
+        return data
+
+    @model_validator(mode="after")
+    def _check_sample(self):
+        if (self.keystrokes is None) == (self.columns is None):
+            raise ValueError("Provide exactly one of 'keystrokes' or 'columns'")
+        if self.columns is not None:
+            self.arrays  # Validates that all column lengths agree
+        return self
+
+    @cached_property
+    def arrays(self) -> KeystrokeArrays:
+        """The typing sample as NumPy columns, whichever encoding was sent."""
+        if self.columns is not None:
+            c = self.columns
+            return KeystrokeArrays.from_columns(c.keys, c.press_times, c.release_times, c.pressure, c.touch_size)
+        return KeystrokeArrays.from_events(self.keystrokes)
+
+
+class TypingSample(KeystrokePayload):
+    """One typing sample, in a request that carries several."""
+
 
 class KeystrokeData(BaseModel):
     """Collection of keystroke events from a typing session."""
@@ -26,21 +135,27 @@ class KeystrokeData(BaseModel):
 
 # ── Registration & Enrollment ───────────────────────────────────
 
-class RegisterRequest(BaseModel):
+class RegisterRequest(KeystrokePayload):
     """Initial user registration with first typing sample."""
     username: str = Field(..., min_length=3, max_length=50, description="Unique username")
     name: str = Field(..., min_length=1, max_length=100, description="Full name")
-    keystrokes: List[KeystrokeEvent] = Field(..., min_length=5, description="First enrollment typing sample")
     device_type: str = Field(default="web")
 
 
-class EnrollRequest(BaseModel):
+class EnrollRequest(KeystrokePayload):
     """Additional enrollment sample submission."""
     username: str = Field(..., description="Username to enroll sample for")
-    keystrokes: List[KeystrokeEvent] = Field(..., min_length=5)
     device_type: str = Field(default="web")
 
 
+class EnrollBatchRequest(BaseModel):
+    """Several enrollment samples submitted together."""
+    username: str = Field(..., min_length=3, max_length=50, description="Username to enroll samples for")
+    name: Optional[str] = Field(None, min_length=1, max_length=100, description="Full name; registers the user if new")
+    device_type: str = Field(default="web")
+    samples: List[TypingSample] = Field(..., min_length=1, max_length=20, description="Typing samples, in typing order")
+
+
 class EnrollmentStatusResponse(BaseModel):
     """Enrollment progress for a user."""
     username: str
@@ -53,10 +168,9 @@ class EnrollmentStatusResponse(BaseModel):
 
 # ── Authentication ──────────────────────────────────────────────
 
-class AuthRequest(BaseModel):
+class AuthRequest(KeystrokePayload):
     """Login attempt with keystroke data."""
     username: str = Field(..., description="Username to authenticate")
-    keystrokes: List[KeystrokeEvent] = Field(..., min_length=5)
     device_type: str = Field(default="web")
 
 
@@ -68,6 +182,29 @@ class AuthResponse(BaseModel):
     token: Optional[str] = None
 
 
+# ── Identification ──────────────────────────────────────────────
+
+class IdentifyRequest(KeystrokePayload):
+    """Typing sample with no claimed username (1:N identification)."""
+    top_k: int = Field(default=5, ge=1, le=20, description="Number of candidates to return")
+    device_type: str = Field(default="web")
+
+
+class IdentifyCandidate(BaseModel):
+    """One enrolled user ranked against the typing sample."""
+    username: str
+    name: str
+    confidence_score: float
+    distance: float
+    matches: bool
+
+
+class IdentifyResponse(BaseModel):
+    """Best-matching enrolled users, highest confidence first."""
+    indexed_users: int
+    candidates: List[IdentifyCandidate]
+
+
 # ── User Profile ────────────────────────────────────────────────
 
 class UserProfile(BaseModel):
@@ -98,13 +235,66 @@ class AuthLogEntry(BaseModel):
         from_attributes = True
 
 
+class AuthDailyEntry(BaseModel):
+    """One day's attempts on one device, rolled up from logs past retention."""
+    day: date
+    device_type: str
+    attempts: int
+    accepted: int
+    avg_confidence: float
+
+
 class AuthHistoryResponse(BaseModel):
-    """Authentication history for a user."""
+    """
+    Authentication history for a user. total_attempts, success_rate and
+    avg_confidence cover the last 50 attempts; the all_time_* figures include
+    every rolled-up day.
+    """
     username: str
     total_attempts: int
     success_rate: float
     avg_confidence: float
+    all_time_attempts: int = 0
+    all_time_success_rate: float = 0.0
+    all_time_avg_confidence: float = 0.0
     history: List[AuthLogEntry]
+    daily: List[AuthDailyEntry] = []
+
+
+# ── Admin ───────────────────────────────────────────────────────
+
+class BulkEnrollUser(BaseModel):
+    """A user to create together with all of their enrollment samples (one NDJSON line)."""
+    username: str = Field(..., min_length=3, max_length=50, description="Unique username")
+    name: str = Field(..., min_length=1, max_length=100, description="Full name")
+    device_type: str = Field(default="web")
+    samples: List[TypingSample] = Field(..., min_length=1, max_length=50, description="Enrollment typing samples")
+
+
+class BulkEnrollRequest(BaseModel):
+    """Users to register and enroll in one request."""
+    users: List[BulkEnrollUser] = Field(..., min_length=1)
+
+
+class BulkEnrollResult(BaseModel):
+    """
+    Outcome for one user: ``enrolled`` (model trained), ``pending`` (stored,
+    more samples needed), ``exists`` (username taken) or ``invalid``.
+    """
+    username: str
+    status: str
+    samples_collected: int = 0
+    is_enrolled: bool = False
+    detail: Optional[str] = None
+
+
+class BulkEnrollResponse(BaseModel):
+    """Per-user results of a bulk enrollment, in request order."""
+    received: int
+    enrolled: int
+    pending: int
+    failed: int
+    results: List[BulkEnrollResult]
 
 
 # ── General ─────────────────────────────────────────────────────
@@ -3,9 +3,14 @@ KeyAuth - Security Module
 Encryption, anti-replay protection, and rate limiting helpers
 """
 import hashlib
+import threading
 import time
-from typing import Dict, Optional
-from collections import defaultdict
+from collections import OrderedDict
+from typing import Dict, List
+import numpy as np
+from app.config import settings
+from app.memory import estimate_bytes
+from app.ml.keystrokes import KeystrokeArrays
 
 
 class AntiReplayGuard:
@@ -13,74 +18,122 @@ class AntiReplayGuard:
     Prevents replay attacks by tracking recent keystroke submission hashes.
     Each submission is hashed and stored with a timestamp.
     Duplicate submissions within the window are rejected.
+
+    At most ``max_entries`` hashes are kept (0 = unbounded); past that the
+    oldest is evicted and counted, even inside the window.
     """
 
-    def __init__(self, window_seconds: int = 300):
+    def __init__(self, window_seconds: int = 300, max_entries: int = 0):
         self.window = window_seconds
-        self._cache: Dict[str, float] = {}
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._cache: "OrderedDict[str, float]" = OrderedDict()  # Oldest first
+        self._lock = threading.Lock()
 
-    def _hash_keystrokes(self, keystrokes_data: list) -> str:
+    def _hash_keystrokes(self, keystrokes_data: KeystrokeArrays) -> str:
         """Create a hash of keystroke data for deduplication."""
-        raw = str([(k.key, k.press_time, k.release_time) for k in keystrokes_data])
-        return hashlib.sha256(raw.encode()).hexdigest()
+        digest = hashlib.sha256("\x00".join(keystrokes_data.keys).encode())
+        digest.update(np.ascontiguousarray(keystrokes_data.press_times, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(keystrokes_data.release_times, dtype=np.float64).tobytes())
+        return digest.hexdigest()
 
-    def check_and_record(self, keystrokes_data: list) -> bool:
+    def check_and_record(self, keystrokes_data: KeystrokeArrays) -> bool:
         """
         Check if this submission is a replay. Records it if new.
         
         Returns True if the submission is VALID (not a replay).
         Returns False if it's a duplicate (replay attack).
         """
-        self._cleanup()
         submission_hash = self._hash_keystrokes(keystrokes_data)
+        with self._lock:
+            self._cleanup()
+            if submission_hash in self._cache:
+                return False  # Replay detected
 
-        if submission_hash in self._cache:
-            return False  # Replay detected
-
-        self._cache[submission_hash] = time.time()
-        return True
+            self._cache[submission_hash] = time.time()
+            if self.max_entries and len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+            return True
 
     def _cleanup(self):
-        """Remove expired entries from the cache."""
+        """Remove expired entries from the cache (insertion order is time order)."""
         now = time.time()
-        expired = [k for k, v in self._cache.items() if now - v > self.window]
-        for k in expired:
-            del self._cache[k]
+        while self._cache:
+            recorded_at = next(iter(self._cache.values()))
+            if now - recorded_at <= self.window:
+                break
+            self._cache.popitem(last=False)
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "bytes": estimate_bytes(self._cache),
+                "cap": self.max_entries or None,
+                "evictions": self.evictions,
+            }
 
 
 class RateLimiter:
     """
     Simple in-memory rate limiter per username.
     Limits authentication attempts to prevent brute force.
+
+    Usernames without attempts in the window are dropped. At most
+    ``max_users`` usernames are tracked (0 = unbounded); past that the least
+    recently seen is evicted and counted.
     """
 
-    def __init__(self, max_attempts: int = 10, window_seconds: int = 60):
+    def __init__(self, max_attempts: int = 10, window_seconds: int = 60, max_users: int = 0):
         self.max_attempts = max_attempts
         self.window = window_seconds
-        self._attempts: Dict[str, list] = defaultdict(list)
+        self.max_users = max_users
+        self.evictions = 0
+        self._attempts: "OrderedDict[str, List[float]]" = OrderedDict()  # Least recently seen first
+        self._lock = threading.Lock()
+
+    def _recent(self, username: str) -> List[float]:
+        """Attempts of ``username`` still in the window (caller holds the lock)."""
+        now = time.time()
+        attempts = [t for t in self._attempts.get(username, ()) if now - t < self.window]
+        if attempts:
+            self._attempts[username] = attempts
+        else:
+            self._attempts.pop(username, None)
+        return attempts
 
     def is_allowed(self, username: str) -> bool:
         """Check if the user is allowed to make another attempt."""
-        now = time.time()
-        # Clean old attempts
-        self._attempts[username] = [
-            t for t in self._attempts[username] if now - t < self.window
-        ]
-        return len(self._attempts[username]) < self.max_attempts
+        with self._lock:
+            return len(self._recent(username)) < self.max_attempts
 
     def record_attempt(self, username: str):
         """Record an authentication attempt."""
-        self._attempts[username].append(time.time())
+        with self._lock:
+            attempts = self._recent(username)
+            attempts.append(time.time())
+            self._attempts[username] = attempts
+            self._attempts.move_to_end(username)
+            if self.max_users and len(self._attempts) > self.max_users:
+                self._attempts.popitem(last=False)
+                self.evictions += 1
 
     def remaining_attempts(self, username: str) -> int:
         """Get remaining attempts for a user."""
-        now = time.time()
-        self._attempts[username] = [
-            t for t in self._attempts[username] if now - t < self.window
-        ]
-        return max(0, self.max_attempts - len(self._attempts[username]))
+        with self._lock:
+            return max(0, self.max_attempts - len(self._recent(username)))
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._attempts),
+                "bytes": estimate_bytes(self._attempts),
+                "cap": self.max_users or None,
+                "evictions": self.evictions,
+            }
 
 
 # Global instances
-anti_replay = AntiReplayGuard(window_seconds=300)
-rate_limiter = RateLimiter(max_attempts=10, window_seconds=60)
+anti_replay = AntiReplayGuard(window_seconds=300, max_entries=settings.ANTI_REPLAY_MAX_ENTRIES)
+rate_limiter = RateLimiter(max_attempts=10, window_seconds=60, max_users=settings.RATE_LIMITER_MAX_USERS)
@@ -0,0 +1,206 @@
+"""
+KeyAuth - Hash-Sharded Storage
+Partitions users, and every row that belongs to one, across DATABASE_SHARDS
+databases by a stable hash of the username.
+
+A user lives on shard ``shard_for(username)`` together with its keystroke
+profiles, enrollment samples and auth logs, so every per-user query stays on
+one database and joins never cross shards. Request sessions are SQLAlchemy
+ShardedSessions: a query filtering on a username or a user id goes to that
+user's shard, lazy loads follow the row they were loaded from, and anything
+else (an admin scan, a 1:N search) fans out to every shard. Writes in SQLite
+production mode go to the owning shard's writer thread, so each database
+file has its own write lock and group commit.
+
+Changing DATABASE_SHARDS moves users' home shards; run
+``python -m app.jobs.rebalance_shards`` with the service stopped to move
+their rows.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, TypeVar
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BindParameter
+
+T = TypeVar("T")
+
+USERS_TABLE = "users"
+USER_KEY = "user_id"  # Column tying a row of a sharded table to its user
+
+
+def shard_for(username: str, shards: int) -> int:
+    """Home shard of ``username`` (stable across processes and Python versions)."""
+    if shards <= 1:
+        return 0
+    digest = hashlib.blake2b(username.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def shard_url(url: str, shard: int) -> str:
+    """
+    Database URL of one shard: ``{shard}`` in the URL is replaced by the shard
+    number; otherwise a SQLite file gets a ``.shardN`` suffix (shard 0 keeps
+    the original file, so an unsharded database becomes shard 0).
+
+    Raises:
+        ValueError: a non-SQLite URL without a ``{shard}`` placeholder
+    """
+    if "{shard}" in url:
+        return url.replace("{shard}", str(shard))
+    if shard == 0:
+        return url
+    parsed = make_url(url)
+    if not parsed.drivername.startswith("sqlite") or parsed.database in (None, "", ":memory:"):
+        raise ValueError("DATABASE_URL needs a {shard} placeholder to shard a non-file database")
+    stem, dot, ext = parsed.database.rpartition(".")
+    database = f"{stem}.shard{shard}.{ext}" if dot else f"{parsed.database}.shard{shard}"
+    return parsed.set(database=database).render_as_string(hide_password=False)
+
+
+class _UserShards:
+    """Bounded user id → shard map, filled from every User row a session loads or inserts."""
+
+    def __init__(self, size: int = 100_000):
+        self._size = size
+        self._shards: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> Optional[str]:
+        with self._lock:
+            return self._shards.get(user_id)
+
+    def put(self, user_id, shard_id: str):
+        with self._lock:
+            self._shards[user_id] = shard_id
+            self._shards.move_to_end(user_id)
+            if len(self._shards) > self._size:
+                self._shards.popitem(last=False)
+
+
+def _key_comparisons(statement) -> Dict[str, List]:
+    """Values compared for equality with users.username, users.id or a user_id column."""
+    found: Dict[str, List] = {"username": [], "user_id": []}
+    whereclause = getattr(statement, "whereclause", None)
+    if whereclause is None:
+        return found
+
+    def visit_binary(binary):
+        if binary.operator is not operators.eq:
+            return
+        column, value = binary.left, binary.right
+        if isinstance(column, BindParameter):
+            column, value = value, column
+        if not isinstance(value, BindParameter) or not hasattr(column, "table"):
+            return
+        table = getattr(column.table, "name", None)
+        if table == USERS_TABLE and column.key == "username":
+            found["username"].append(value.effective_value)
+        elif (table == USERS_TABLE and column.key == "id") or column.key == USER_KEY:
+            found["user_id"].append(value.effective_value)
+
+    visitors.traverse(whereclause, {}, {"binary": visit_binary})
+    return found
+
+
+class ShardSet:
+    """
+    The shard databases and the routing between them.
+
+    Args:
+        engines: Writer engine per shard
+        read_engines: Engine request sessions read from, per shard
+    """
+
+    def __init__(self, engines: Sequence[Engine], read_engines: Sequence[Engine]):
+        self.engines = list(engines)
+        self.read_engines = list(read_engines)
+        self._user_shards = _UserShards()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.session_factory = sessionmaker(
+            class_=ShardedSession,
+            autocommit=False,
+            autoflush=False,
+            shards={str(i): e for i, e in enumerate(self.read_engines)},
+            shard_chooser=self._shard_chooser,
+            identity_chooser=self._identity_chooser,
+            execute_chooser=self._execute_chooser,
+        )
+        event.listen(self.session_factory, "loaded_as_persistent", self._on_persistent)
+        event.listen(self.session_factory, "pending_to_persistent", self._on_persistent)
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    @property
+    def all_ids(self) -> List[str]:
+        return [str(i) for i in range(len(self.engines))]
+
+    def shard_for(self, username: str) -> int:
+        return shard_for(username, len(self.engines))
+
+    def _user_shard(self, user_id) -> Optional[str]:
+        return self._user_shards.get(user_id)
+
+    def _on_persistent(self, session, instance):
+        state = sa_inspect(instance)
+        if state.mapper.local_table.name == USERS_TABLE and state.identity_token is not None:
+            self._user_shards.put(instance.id, state.identity_token)
+
+    # ── ShardedSession choosers ─────────────────────────────────
+
+    def _shard_chooser(self, mapper, instance, clause=None) -> str:
+        """Shard a new or changed row is written to."""
+        if instance is not None:
+            token = sa_inspect(instance).identity_token
+            if token is not None:
+                return token
+            if mapper.local_table.name == USERS_TABLE:
+                return str(self.shard_for(instance.username))
+            shard_id = self._user_shard(getattr(instance, USER_KEY, None))
+            if shard_id is not None:
+                return shard_id
+        raise ValueError(f"Cannot choose a shard for {mapper.class_.__name__}: its user was not loaded in this process")
+
+    def _identity_chooser(self, mapper, primary_key, *, lazy_loaded_from=None, **kw) -> List[str]:
+        """Shards to look a row up by primary key in (session.get)."""
+        if lazy_loaded_from is not None:
+            return [lazy_loaded_from.identity_token]
+        if mapper.local_table.name == USERS_TABLE:
+            shard_id = self._user_shard(primary_key[0])
+            if shard_id is not None:
+                return [shard_id]
+        return self.all_ids
+
+    def _execute_chooser(self, orm_context) -> List[str]:
+        """Shards a statement runs on: the user's when the WHERE clause names one, else all."""
+        if orm_context.is_select and orm_context.lazy_loaded_from is not None:
+            return [orm_context.lazy_loaded_from.identity_token]
+        found = _key_comparisons(orm_context.statement)
+        shard_ids = {str(self.shard_for(username)) for username in found["username"]}
+        for user_id in found["user_id"]:
+            shard_id = self._user_shard(user_id)
+            if shard_id is None:
+                return self.all_ids
+            shard_ids.add(shard_id)
+        return sorted(shard_ids) if shard_ids else self.all_ids
+
+    # ── Writes and scans ────────────────────────────────────────
+
+    def scan(self, work: Callable[[Session], T], engines: Optional[Iterable[Engine]] = None) -> List[T]:
+        """Run ``work(session)`` on every shard in parallel; one result per shard, in shard order."""
+        engines = list(engines) if engines is not None else self.read_engines
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=len(self.engines), thread_name_prefix="shard-scan")
+
+        def run(engine: Engine) -> T:
+            with Session(bind=engine) as session:
+                return work(session)
+
+        return list(self._pool.map(run, engines))
@@ -0,0 +1,95 @@
+"""
+KeyAuth - SQLite Single-Writer Queue
+Serializes all database writes through one dedicated thread with group commit.
+
+SQLite allows a single writer at a time. Instead of letting request threads
+fight over the write lock (and hit "database is locked"), each write is
+submitted as a unit of work to a queue. The writer thread drains whatever is
+waiting, runs each unit inside its own SAVEPOINT, and commits the whole batch
+with a single fsync.
+"""
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+from sqlalchemy.orm import Session, sessionmaker
+
+WriteWork = Callable[[Session], Any]
+
+
+def _flushed(work: WriteWork, session: Session) -> Any:
+    """Run ``work`` and flush its changes, so its statements run in the caller's context."""
+    result = work(session)
+    session.flush()
+    return result
+
+
+class SQLiteWriter:
+    """
+    Dedicated writer thread with group commit.
+
+    Each submitted ``work(session)`` callable runs in a nested transaction, so
+    a failing unit is rolled back on its own without affecting the rest of
+    the batch. The batch is committed once all units have run.
+    """
+
+    def __init__(self, session_factory: sessionmaker, max_batch: int = 64):
+        self._session_factory = session_factory
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Tuple[WriteWork, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, work: WriteWork) -> Future:
+        """Queue a unit of work; the future resolves once it is committed."""
+        future: Future = Future()
+        context = contextvars.copy_context()  # Statements count toward the submitting request
+        self._queue.put((lambda session: context.run(_flushed, work, session), future))
+        return future
+
+    def execute(self, work: WriteWork) -> Any:
+        """Submit a unit of work and block until it has been committed."""
+        return self.submit(work).result()
+
+    def _drain(self) -> List[Tuple[WriteWork, Future]]:
+        """Block for the first job, then take whatever else is already queued."""
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drain()
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List[Tuple[WriteWork, Future]]):
+        done: List[Tuple[Future, Any]] = []
+        session = self._session_factory()
+        try:
+            for work, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                savepoint = session.begin_nested()
+                try:
+                    result = work(session)
+                    savepoint.commit()
+                    done.append((future, result))
+                except Exception as e:
+                    savepoint.rollback()
+                    future.set_exception(e)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            for future, _ in done:
+                future.set_exception(e)
+            return
+        finally:
+            session.close()
+
+        for future, result in done:
+            future.set_result(result)
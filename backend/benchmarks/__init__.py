@@ -0,0 +1 @@
+"""KeyAuth Benchmarks"""
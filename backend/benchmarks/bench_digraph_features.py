@@ -0,0 +1,58 @@
+"""
+KeyAuth - Hashed digraph feature benchmark
+Times per-request extraction and sparse scoring, and reports stored bytes.
+
+    python -m benchmarks.bench_digraph_features --buckets 512
+"""
+import argparse
+import random
+import time
+from app.ml.digraph_features import extract_digraph_features, pack_sparse
+from app.ml.keystrokes import KeystrokeArrays
+from app.ml.model import KeystrokeAuthModel
+
+PHRASE = "the quick brown fox jumps over the lazy dog"
+
+
+def _sample(text: str, seed: int) -> KeystrokeArrays:
+    rng = random.Random(seed)
+    t, press, release = 0.0, [], []
+    for _ in text:
+        t += max(rng.gauss(130, 25), 20)
+        press.append(t)
+        release.append(t + max(rng.gauss(90, 10), 10))
+    return KeystrokeArrays.from_columns(list(text), press, release)
+
+
+def _time_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--buckets", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{args.buckets} hash buckets")
+    print(f"{'text':<12} {'keys':>6} {'nnz':>5} {'bytes':>6} {'extract us':>11} {'score us':>9}")
+    for label, text in (("phrase", PHRASE), ("paragraph", PHRASE * 10)):
+        model = KeystrokeAuthModel()
+        for seed in range(5):
+            model.digraph_vectors.append(extract_digraph_features(_sample(text, seed), args.buckets))
+        attempt = _sample(text, 99)
+        vector = extract_digraph_features(attempt, args.buckets)
+
+        extract_us = _time_us(lambda: extract_digraph_features(attempt, args.buckets), args.repeat)
+        score_us = _time_us(lambda: model._digraph_authenticate(vector), args.repeat)
+        print(
+            f"{label:<12} {len(text):>6} {len(vector.indices):>5} {len(pack_sparse(vector)):>6} "
+            f"{extract_us:>11.1f} {score_us:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+KeyAuth - Load test
+Drives a mix of API traffic at a target rate against a local uvicorn server.
+
+Unlike the micro-benchmarks, requests go through a real server with
+``--workers`` processes, so anti-replay, the rate limiter, SQLite commits,
+model loading and admission control all contend as they would in
+production. Synthetic enrolled users (each with their own typing rhythm) are
+seeded once through POST /api/admin/bulk-enroll into a template database
+under ``--workdir``; every run starts from a fresh copy of it.
+
+Requests are started on an open-loop schedule at ``--rate`` per second and
+latency is measured from each request's scheduled start, so client-side
+queueing (``--max-inflight``) shows up in the percentiles instead of hiding
+them. Traffic mix (weights):
+
+  authenticate  login of a seeded user with a fresh typing sample
+  profile       GET /api/user/profile with that user's token
+  register      new user with a first sample
+  enroll        next sample of a user registered during the run
+
+Server CPU (percent of one core, summed over the uvicorn processes) and RSS
+are sampled from /proc while the load runs (Linux). Results, with the
+configuration, are written as JSON for comparing runs. Run from the backend
+directory:
+
+    python -m benchmarks.bench_load --workers 4 --users 2000 --rate 200 --duration 60 --output load.json
+    python -m benchmarks.bench_load --env SQLITE_PRODUCTION_MODE=true --output load-prod.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+import numpy as np
+from app.auth import create_access_token
+from app.config import settings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHRASE = "the quick brown fox jumps"
+ADMIN_KEY = "load-test-admin-key"
+ENDPOINTS = ("authenticate", "profile", "register", "enroll")
+
+
+# ── Synthetic typists ───────────────────────────────────────────
+
+class Typist:
+    """A user's typing rhythm; every sample is a fresh draw around it."""
+
+    def __init__(self, seed: int):
+        rng = random.Random(seed)
+        self.dwell = rng.uniform(60, 130)
+        self.flight = rng.uniform(40, 160)
+        self.jitter = rng.uniform(0.05, 0.2)
+        self._rng = random.Random(seed * 7919 + 1)
+
+    def sample(self) -> Dict:
+        rng, t = self._rng, 1000.0
+        keys, press, release = [], [], []
+        for key in PHRASE:
+            t += max(5.0, rng.gauss(self.flight, self.flight * self.jitter))
+            dwell = max(10.0, rng.gauss(self.dwell, self.dwell * self.jitter))
+            keys.append(key)
+            press.append(round(t, 3))
+            release.append(round(t + dwell, 3))
+            t += dwell
+        return {"keys": keys, "press_times": press, "release_times": release}
+
+
+def _username(i: int) -> str:
+    return f"load{i:06d}"
+
+
+# ── Server ──────────────────────────────────────────────────────
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """A uvicorn process (plus its workers) on a private port."""
+
+    def __init__(self, db_path: str, workers: int, env: Dict[str, str]):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{db_path}",
+            "ADMIN_API_KEY": ADMIN_KEY,
+            "SECRET_KEY": settings.SECRET_KEY,  # So the harness can mint tokens the server accepts
+            "DEBUG": "false",
+            **env,
+        }
+        self.workers = workers
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "Server":
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=self.env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {self.process.returncode}")
+            try:
+                if httpx.get(self.url + "/", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("uvicorn did not start within 60s")
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class ProcessSampler:
+    """CPU and RSS of a process and its descendants, read from /proc."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._page = os.sysconf("SC_PAGE_SIZE")
+        self._last: Dict[int, int] = {}
+        self._last_at = time.monotonic()
+        self.timeline: List[Dict] = []
+
+    def _tree(self) -> List[int]:
+        parents = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as f:
+                        parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+        tree, frontier = [self.pid], [self.pid]
+        while frontier:
+            frontier = [pid for pid, parent in parents.items() if parent in frontier]
+            tree.extend(frontier)
+        return tree
+
+    def sample(self, elapsed: float):
+        cpu, rss, now = {}, 0, time.monotonic()
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/{pid}/statm") as f:
+                    rss += int(f.read().split()[1]) * self._page
+            except (OSError, IndexError, ValueError):
+                continue
+            cpu[pid] = int(fields[11]) + int(fields[12])  # utime + stime
+        interval = now - self._last_at
+        used = sum(ticks - self._last[pid] for pid, ticks in cpu.items() if pid in self._last)
+        if self._last and interval > 0:
+            self.timeline.append({
+                "t": round(elapsed, 2),
+                "cpu_percent": round(used / self._ticks / interval * 100, 1),
+                "rss_mb": round(rss / 2**20, 1),
+                "processes": len(cpu),
+            })
+        self._last, self._last_at = cpu, now
+
+
+# ── Seeding ─────────────────────────────────────────────────────
+
+def seed_database(path: str, users: int, samples: int, env: Dict[str, str]) -> float:
+    """Create ``users`` enrolled synthetic users in a new database at ``path``; returns seconds taken."""
+    def lines():
+        for i in range(users):
+            typist = Typist(i)
+            yield (json.dumps({
+                "username": _username(i),
+                "name": f"Load User {i}",
+                "samples": [{"columns": typist.sample()} for _ in range(samples)],
+            }) + "\n").encode()
+
+    start = time.perf_counter()
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with Server(tmp, 1, env) as server:
+        response = httpx.post(
+            server.url + "/api/admin/bulk-enroll",
+            content=lines(),
+            headers={"X-Admin-Key": ADMIN_KEY, "Content-Type": "application/x-ndjson"},
+            timeout=None,
+        )
+        response.raise_for_status()
+        result = response.json()
+        if result["enrolled"] != users:
+            raise RuntimeError(f"Seeding enrolled {result['enrolled']} of {users} users")
+    os.replace(tmp, path)
+    return time.perf_counter() - start
+
+
+# ── Load ────────────────────────────────────────────────────────
+
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, n_users: int, seed: int):
+        self.client = client
+        self.n_users = n_users
+        self.rng = random.Random(seed)
+        self.typists: Dict[str, Typist] = {}
+        self.pending: List[str] = []  # Registered during the run, still enrolling
+        self.next_user = 0
+        self.run_tag = f"{seed % 100000:05d}"
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.statuses: Dict[str, Dict[str, int]] = {name: {} for name in ENDPOINTS}
+        self.tokens: Dict[str, str] = {}
+
+    def _typist(self, username: str, seed: int) -> Typist:
+        if username not in self.typists:
+            self.typists[username] = Typist(seed)
+        return self.typists[username]
+
+    async def _call(self, name: str, scheduled: float, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.latencies[name].append((time.perf_counter() - scheduled) * 1e3)
+        self.statuses[name][status] = self.statuses[name].get(status, 0) + 1
+        return response
+
+    async def authenticate(self, scheduled: float):
+        i = self.rng.randrange(self.n_users)
+        username = _username(i)
+        await self._call("authenticate", scheduled, "POST", "/api/authenticate",
+                         json={"username": username, "columns": self._typist(username, i).sample()})
+
+    async def profile(self, scheduled: float):
+        username = _username(self.rng.randrange(self.n_users))
+        if username not in self.tokens:
+            self.tokens[username] = create_access_token({"sub": username})
+        await self._call("profile", scheduled, "GET", "/api/user/profile",
+                         headers={"Authorization": f"Bearer {self.tokens[username]}"})
+
+    async def register(self, scheduled: float):
+        self.next_user += 1
+        username = f"new{self.run_tag}x{self.next_user:06d}"
+        typist = self._typist(username, 10**6 + self.next_user)
+        response = await self._call("register", scheduled, "POST", "/api/register",
+                                    json={"username": username, "name": username, "columns": typist.sample()})
+        if response is not None and response.status_code == 201:
+            self.pending.append(username)
+
+    async def enroll(self, scheduled: float):
+        if not self.pending:
+            return await self.register(scheduled)
+        username = self.pending.pop(0)
+        response = await self._call("enroll", scheduled, "POST", "/api/enroll",
+                                    json={"username": username, "columns": self.typists[username].sample()})
+        if response is not None and response.status_code == 200 and not response.json()["is_enrolled"]:
+            self.pending.append(username)
+
+
+async def drive(url: str, n_users: int, mix: Dict[str, float], rate: float, duration: float,
+                max_inflight: int, sampler: ProcessSampler, sample_every: float, seed: int) -> Dict:
+    limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        run = LoadRun(client, n_users, seed)
+        names, weights = zip(*mix.items())
+        inflight = asyncio.Semaphore(max_inflight)
+        tasks = set()
+
+        async def one(name: str, scheduled: float):
+            async with inflight:
+                await getattr(run, name)(scheduled)
+
+        async def sample_server(start: float):
+            while True:
+                await asyncio.sleep(sample_every)
+                sampler.sample(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        sampler.sample(0.0)
+        sampling = asyncio.ensure_future(sample_server(start))
+        n = 0
+        while True:
+            scheduled = start + n / rate
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(one(run.rng.choices(names, weights)[0], scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            n += 1
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        sampling.cancel()
+        sampler.sample(elapsed)
+
+    endpoints = {}
+    for name in ENDPOINTS:
+        latencies, statuses = np.array(run.latencies[name]), run.statuses[name]
+        count = len(latencies)
+        if not count:
+            continue
+        errors = sum(c for status, c in statuses.items() if not status.startswith("2"))
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        endpoints[name] = {
+            "requests": count,
+            "throughput_rps": round(count / elapsed, 1),
+            "errors": errors,
+            "error_rate": round(errors / count, 4),
+            "status_codes": dict(sorted(statuses.items())),
+            "p50_ms": round(float(p50), 1),
+            "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1),
+            "max_ms": round(float(latencies.max()), 1),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1),
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--users", type=int, default=2000, help="seeded enrolled users")
+    parser.add_argument("--rate", type=float, default=100, help="requests started per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("authenticate=70,profile=20,register=5,enroll=5"),
+                        help="endpoint weights, e.g. authenticate=70,profile=20,register=5,enroll=5")
+    parser.add_argument("--max-inflight", type=int, default=256, help="concurrent requests (and connections)")
+    parser.add_argument("--sample-every", type=float, default=1.0, help="seconds between server CPU/RSS samples")
+    parser.add_argument("--workdir", default="./load_test", help="where the seeded template database is kept")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra server setting, e.g. SQLITE_PRODUCTION_MODE=true (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    env = dict(item.split("=", 1) for item in args.env)
+    os.makedirs(args.workdir, exist_ok=True)
+    samples = settings.ENROLLMENT_SAMPLES_REQUIRED
+    template = os.path.abspath(os.path.join(args.workdir, f"seed-{args.users}x{samples}.db"))
+    seed_seconds = None
+    if not os.path.exists(template):
+        print(f"Seeding {args.users} enrolled users into {template} ...")
+        seed_seconds = seed_database(template, args.users, samples, env)
+        print(f"  seeded in {seed_seconds:.1f}s ({args.users / seed_seconds:.1f} users/s)")
+    database = os.path.abspath(os.path.join(args.workdir, "run.db"))
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    shutil.copy(template, database)
+
+    print(f"{args.workers} workers, {args.rate:g} req/s for {args.duration:g}s, mix {args.mix}, {os.cpu_count()} CPUs")
+    with Server(database, args.workers, env) as server:
+        sampler = ProcessSampler(server.process.pid)
+        result = asyncio.run(drive(
+            server.url, args.users, args.mix, args.rate, args.duration,
+            args.max_inflight, sampler, args.sample_every, args.seed,
+        ))
+
+    timeline = sampler.timeline
+    result["server"] = {
+        "cpu_percent_avg": round(float(np.mean([s["cpu_percent"] for s in timeline])), 1) if timeline else None,
+        "rss_mb_max": max((s["rss_mb"] for s in timeline), default=None),
+        "timeline": timeline,
+    }
+    result = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "workers": args.workers, "users": args.users, "rate": args.rate, "duration": args.duration,
+            "mix": args.mix, "max_inflight": args.max_inflight, "env": env, "cpus": os.cpu_count(),
+            "seed_seconds": seed_seconds,
+        },
+        **result,
+    }
+
+    print(f"{'endpoint':<13} {'requests':>8} {'req/s':>7} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, e in result["endpoints"].items():
+        print(f"{name:<13} {e['requests']:>8} {e['throughput_rps']:>7.1f} {e['error_rate']:>7.1%} "
+              f"{e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f}")
+    print(f"total {result['requests']} requests, {result['throughput_rps']} req/s; server CPU avg "
+          f"{result['server']['cpu_percent_avg']}%, RSS max {result['server']['rss_mb_max']} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+KeyAuth - Isolation Forest sizing benchmark
+Chosen forest size, scoring latency and separation per latency budget.
+
+Synthetic users as in bench_scorers; each user is sized against the other
+users' enrollment means as impostors. Separation is the AUC of fresh genuine
+attempts against other users' attempts, for the sized and the full model.
+Run from the backend directory:
+
+    python -m benchmarks.bench_model_sizing --budgets 0.3 1 5
+"""
+import argparse
+import time
+from collections import Counter
+import numpy as np
+from app.ml.model_sizing import measure_score_us, separation, size_isolation_forest
+from app.ml.scorers import IsolationForestScorer
+from benchmarks.bench_scorers import N_FEATURES, _user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budgets", type=float, nargs="+", default=[0.3, 1.0, 5.0], help="ms per scored vector")
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--runtime", choices=["sklearn", "snapshot"], default="sklearn")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    users = [_user(rng) for _ in range(args.users)]
+    enrollment = [draw(args.samples) for draw in users]
+    attempts = [draw(10) for draw in users]
+    means = np.stack([X.mean(axis=0) for X in enrollment])
+
+    full = [IsolationForestScorer().fit(X) for X in enrollment]
+    full_us = np.mean([measure_score_us(s, X, args.runtime) for s, X in zip(full, enrollment)])
+    full_auc = np.mean([
+        separation(s.score_many(attempts[i]), s.score_many(np.concatenate(attempts[:i] + attempts[i + 1:])))
+        for i, s in enumerate(full)
+    ])
+    print(f"{args.users} users × {args.samples} samples, {N_FEATURES} features, runtime {args.runtime}")
+    print(f"full model: 100 trees, {full_us:.0f} us/score, AUC {full_auc:.3f}")
+    print(f"{'budget ms':>9} {'size s':>7} {'score us':>9} {'AUC':>6} {'in budget':>9}  chosen (trees×samples: users)")
+    for budget in args.budgets:
+        sizing_s, score_us, aucs, in_budget, chosen = 0.0, [], [], 0, Counter()
+        for i, X in enumerate(enrollment):
+            start = time.perf_counter()
+            scorer, result = size_isolation_forest(
+                X, np.delete(means, i, axis=0), latency_budget_ms=budget, tolerance=args.tolerance, runtime=args.runtime,
+            )
+            sizing_s += time.perf_counter() - start
+            score_us.append(result.score_us)
+            in_budget += result.within_budget
+            chosen[f"{result.n_estimators}×{result.max_samples}"] += 1
+            impostors = np.concatenate(attempts[:i] + attempts[i + 1:])
+            aucs.append(separation(scorer.score_many(attempts[i]), scorer.score_many(impostors)))
+        print(
+            f"{budget:>9.2f} {sizing_s / args.users:>7.2f} {np.mean(score_us):>9.0f} {np.mean(aucs):>6.3f} "
+            f"{in_budget:>4}/{args.users:<4}  {', '.join(f'{k}: {v}' for k, v in chosen.most_common())}"
+        )
+
+
+if __name__ == "__main__":
+    main()
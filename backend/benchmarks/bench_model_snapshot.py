@@ -0,0 +1,113 @@
+"""
+KeyAuth - Model snapshot benchmark
+Compares a cold worker loading models from the database with one mapping a snapshot.
+
+Seeds a temporary SQLite database with enrolled users, exports the snapshot,
+then measures per-user first-request latency both ways (the DB path fetches
+model_data and unpickles it; the snapshot path only builds views). Run from
+the backend directory:
+
+    python -m benchmarks.bench_model_snapshot --users 200
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import User, KeystrokeProfile
+from app.jobs.export_snapshot import export_snapshot
+from app.ml.feature_matrix import pack_rows, profile_vectors
+from app.ml.model import KeystrokeAuthModel
+from app.ml.snapshot import ModelSnapshot
+
+
+def _seed(session_factory, n_users: int, samples: int, rng: np.random.Generator) -> list:
+    session = session_factory()
+    attempts = []
+    for i in range(n_users):
+        base = rng.normal(120, 40, 36)
+        model = KeystrokeAuthModel()
+        vectors = [(base + rng.normal(0, 5, 36)).tolist() for _ in range(samples)]
+        for vector in vectors:
+            model.add_training_sample(vector)
+        model.train()
+        user = User(username=f"user{i}", name=f"User {i}", is_enrolled=True)
+        session.add(user)
+        session.flush()
+        profile = KeystrokeProfile(
+            user_id=user.id,
+            device_type="mobile",
+            feature_schema="mobile/v1",
+            feature_matrix=pack_rows(vectors),
+            model_data=model.serialize(),
+            sample_count=samples,
+        )
+        session.add(profile)
+        session.flush()
+        attempts.append((profile.id, (base + rng.normal(0, 5, 36)).tolist()))
+    session.commit()
+    session.close()
+    return attempts
+
+
+def _percentiles(values_us: list) -> str:
+    values = sorted(values_us)
+    p50 = statistics.median(values)
+    p99 = values[min(len(values) - 1, int(0.99 * len(values)))]
+    return f"{p50:>9.1f} {p99:>9.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autoflush=False, bind=engine)
+    attempts = _seed(Session, args.users, args.samples, np.random.default_rng(0))
+
+    path = os.path.join(workdir, "models.kms")
+    db = Session()
+    start = time.perf_counter()
+    result = export_snapshot(db, path)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    snapshot = ModelSnapshot()
+    snapshot.open(path)
+    open_ms = (time.perf_counter() - start) * 1e3
+
+    db_us, snap_us, max_diff = [], [], 0.0
+    for profile_id, vector in attempts:
+        db.expunge_all()  # Cold: nothing cached in the session
+        start = time.perf_counter()
+        profile = db.get(KeystrokeProfile, profile_id)
+        db_score, _ = KeystrokeAuthModel.deserialize(profile.model_data, profile_vectors(profile)).authenticate(vector)
+        db_us.append((time.perf_counter() - start) * 1e6)
+
+        db.expunge_all()
+        start = time.perf_counter()
+        profile = db.get(KeystrokeProfile, profile_id)
+        snap_score, _ = snapshot.get(profile_id, profile.updated_at).authenticate(vector)
+        snap_us.append((time.perf_counter() - start) * 1e6)
+        max_diff = max(max_diff, abs(db_score - snap_score))
+    db.close()
+
+    print(f"{result['profiles']} users, {args.samples} samples each")
+    print(f"snapshot build {build_s:.2f}s, {result['bytes'] / 1e6:.2f} MB "
+          f"({result['bytes'] / max(result['profiles'], 1) / 1e3:.1f} KB/user), open {open_ms:.1f} ms")
+    print(f"{'first request':<16} {'p50 us':>9} {'p99 us':>9}")
+    print(f"{'database':<16} {_percentiles(db_us)}")
+    print(f"{'snapshot':<16} {_percentiles(snap_us)}")
+    print(f"max |score difference| {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
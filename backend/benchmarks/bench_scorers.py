@@ -0,0 +1,79 @@
+"""
+KeyAuth - Scorer benchmark
+Training time, model bytes and scoring latency for every registered scorer.
+
+Synthetic users have a random 36-feature typing profile with per-feature
+noise; genuine attempts are drawn from the same profile, impostor attempts
+from other users'. Accept rates are at AUTH_CONFIDENCE_THRESHOLD. Run from
+the backend directory:
+
+    python -m benchmarks.bench_scorers --samples 5 10 20
+"""
+import argparse
+import time
+import numpy as np
+from app.ml.scorers import SCORERS, create_scorer
+from app.config import settings
+
+N_FEATURES = 36
+
+
+def _user(rng: np.random.Generator):
+    base = rng.normal(120, 40, N_FEATURES)
+    noise = np.abs(base) * rng.uniform(0.03, 0.12, N_FEATURES)
+    return lambda n: base + rng.normal(0, 1, (n, N_FEATURES)) * noise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=256, help="vectors per score_many call")
+    args = parser.parse_args()
+
+    threshold = settings.AUTH_CONFIDENCE_THRESHOLD
+    print(f"{args.users} users, threshold {threshold}")
+    print(
+        f"{'scorer':<18} {'samples':>7} {'fit ms':>8} {'bytes':>8} {'score us':>9} "
+        f"{'many us/vec':>11} {'genuine':>8} {'impostor':>9}"
+    )
+    for n_samples in args.samples:
+        rng = np.random.default_rng(n_samples)
+        users = [_user(rng) for _ in range(args.users)]
+        enrollment = [draw(n_samples) for draw in users]
+        genuine = [draw(20) for draw in users]
+
+        for name in SCORERS:
+            fit_s, sizes, single_s, many_s = 0.0, [], 0.0, 0.0
+            accepted_genuine, accepted_impostor, impostor_total = 0, 0, 0
+            for i, X in enumerate(enrollment):
+                start = time.perf_counter()
+                scorer = create_scorer(name).fit(X)
+                fit_s += time.perf_counter() - start
+                sizes.append(len(scorer.serialize()))
+
+                start = time.perf_counter()
+                for x in genuine[i]:
+                    scorer.score(x)
+                single_s += (time.perf_counter() - start) / len(genuine[i])
+
+                batch = np.resize(genuine[i], (args.batch, N_FEATURES))
+                start = time.perf_counter()
+                scorer.score_many(batch)
+                many_s += (time.perf_counter() - start) / args.batch
+
+                accepted_genuine += int((scorer.score_many(genuine[i]) >= threshold).sum())
+                impostors = np.concatenate([genuine[j][:2] for j in range(len(users)) if j != i])
+                accepted_impostor += int((scorer.score_many(impostors) >= threshold).sum())
+                impostor_total += len(impostors)
+
+            n = len(enrollment)
+            print(
+                f"{name:<18} {n_samples:>7} {fit_s / n * 1e3:>8.2f} {int(np.mean(sizes)):>8} "
+                f"{single_s / n * 1e6:>9.1f} {many_s / n * 1e6:>11.2f} "
+                f"{accepted_genuine / (20 * n):>8.1%} {accepted_impostor / impostor_total:>9.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
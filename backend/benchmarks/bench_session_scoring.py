@@ -0,0 +1,85 @@
+"""
+KeyAuth - Continuous session scoring benchmark
+Compares sliding-window sketches with recomputing extract_features on a
+naive window every K events.
+
+    python -m benchmarks.bench_session_scoring --events 20000 --window 200 --every 25
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from collections import deque
+import numpy as np
+from app.ml.feature_extractor import extract_features
+from app.ml.keystrokes import KeystrokeArrays
+from app.ml.session import SlidingWindowFeatures
+
+
+def _events(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    t = 0.0
+    for _ in range(n):
+        t += max(rng.gauss(130, 30), 20)
+        yield t, t + max(rng.gauss(90, 15), 10)
+
+
+def run_streaming(events, window: int, every: int, panes: int):
+    sliding = SlidingWindowFeatures(pane_size=window // panes, panes=panes)
+    vectors = []
+    for i, (press, release) in enumerate(events, 1):
+        sliding.add(press, release)
+        if i % every == 0:
+            vectors.append(sliding.vector())
+    return vectors, sliding
+
+
+def run_naive(events, window: int, every: int):
+    press_q, release_q = deque(maxlen=window), deque(maxlen=window)
+    vectors = []
+    for i, (press, release) in enumerate(events, 1):
+        press_q.append(press)
+        release_q.append(release)
+        if i % every == 0:
+            arrays = KeystrokeArrays(keys=[""] * len(press_q), press_times=np.array(press_q), release_times=np.array(release_q))
+            vectors.append(extract_features(arrays)["vector"])
+    return vectors, (press_q, release_q)
+
+
+def _measure(fn):
+    """Time a run, then repeat it under tracemalloc for peak memory."""
+    start = time.perf_counter()
+    vectors, _ = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return vectors, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--window", type=int, default=200)
+    parser.add_argument("--every", type=int, default=25)
+    parser.add_argument("--panes", type=int, default=4)
+    args = parser.parse_args()
+
+    events = list(_events(args.events))
+    streaming, t_stream, mem_stream = _measure(lambda: run_streaming(events, args.window, args.every, args.panes))
+    naive, t_naive, mem_naive = _measure(lambda: run_naive(events, args.window, args.every))
+
+    # Relative error of the dwell / flight / digraph features (first 21 dims)
+    s, n = np.array(streaming)[:, :21], np.array(naive)[:, :21]
+    rel_err = np.median(np.abs(s - n) / np.maximum(np.abs(n), 1e-9))
+
+    print(f"{args.events} events, window {args.window}, re-score every {args.every}")
+    print(f"{'mode':<10} {'us/event':>9} {'peak KiB':>9}")
+    print(f"{'streaming':<10} {t_stream / args.events * 1e6:>9.2f} {mem_stream / 1024:>9.1f}")
+    print(f"{'naive':<10} {t_naive / args.events * 1e6:>9.2f} {mem_naive / 1024:>9.1f}")
+    print(f"median relative feature difference: {rel_err:.3%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+KeyAuth - Sharded write throughput benchmark
+Login write throughput against the number of hash-sharded SQLite databases.
+
+Each shard is set up as in SQLite production mode: WAL, a query-only read
+pool and a writer thread with group commit. Several processes stand in for
+API workers, each with its own writers for every shard, so writers of
+different processes contend for a shard's write lock as they would under
+uvicorn --workers. Threads in each process simulate logins for random users:
+look the user up through the sharded session (routed to its shard), then
+insert an AuthLog through that shard's writer. With more shards each write
+lock is shared by fewer writes; scaling needs as many CPUs as processes.
+Run from the backend directory:
+
+    python -m benchmarks.bench_sharding --shards 1 2 4 8 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, configure_sqlite_engine
+from app.models import User, AuthLog
+from app.sharding import ShardSet, shard_url
+from app.sqlite_writer import SQLiteWriter
+from app.config import settings
+
+
+def _engine(url: str, pool_size: int, read_only: bool, synchronous: str):
+    engine = create_engine(url, connect_args={"check_same_thread": False}, pool_size=pool_size, max_overflow=0)
+    configure_sqlite_engine(engine, read_only=read_only)
+
+    @event.listens_for(engine, "connect")
+    def _synchronous(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"PRAGMA synchronous = {synchronous}")
+
+    return engine
+
+
+def _open_shards(url: str, n_shards: int, synchronous: str):
+    engines, read_engines = [], []
+    for shard in range(n_shards):
+        engines.append(_engine(shard_url(url, shard), 1, False, synchronous))
+        read_engines.append(_engine(shard_url(url, shard), settings.SQLITE_READ_POOL_SIZE, True, synchronous))
+    writers = [
+        SQLiteWriter(sessionmaker(autoflush=False, expire_on_commit=False, bind=e), settings.SQLITE_WRITE_BATCH_MAX)
+        for e in engines
+    ]
+    return ShardSet(engines, read_engines), writers
+
+
+def _seed(url: str, n_shards: int, usernames, synchronous: str):
+    shards, writers = _open_shards(url, n_shards, synchronous)
+    for e in shards.engines:
+        Base.metadata.create_all(bind=e)
+    for username in usernames:
+        writers[shards.shard_for(username)].execute(lambda s, u=username: s.add(User(username=u, name=u)))
+    for e in shards.engines + shards.read_engines:
+        e.dispose()
+
+
+def _server_process(
+    url: str, n_shards: int, usernames, n_threads: int, ops: int, synchronous: str, seed: int, barrier
+):
+    """One API worker process: its own engines and writer threads, ``n_threads`` concurrent logins."""
+    shards, writers = _open_shards(url, n_shards, synchronous)
+    barrier.wait()  # Start timing once every process has imported and connected
+
+    def worker(thread_seed: int):
+        rng = random.Random(thread_seed)
+        for _ in range(ops):
+            username = rng.choice(usernames)
+            session = shards.session_factory()
+            try:
+                user_id = session.query(User.id).filter(User.username == username).scalar()
+            finally:
+                session.close()
+            writers[shards.shard_for(username)].execute(
+                lambda s: s.add(AuthLog(user_id=user_id, confidence_score=0.9, result="accepted"))
+            )
+
+    threads = [threading.Thread(target=worker, args=(seed * 1000 + i,)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def bench(tmp: str, n_shards: int, n_users: int, n_processes: int, n_threads: int, ops: int, synchronous: str) -> dict:
+    url = f"sqlite:///{os.path.join(tmp, f'bench{n_shards}.db')}"
+    usernames = [f"bench{i}" for i in range(n_users)]
+    _seed(url, n_shards, usernames, synchronous)
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(n_processes + 1)
+    processes = [
+        context.Process(target=_server_process, args=(url, n_shards, usernames, n_threads, ops, synchronous, i, barrier))
+        for i in range(n_processes)
+    ]
+    for p in processes:
+        p.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - start
+    failed = sum(p.exitcode != 0 for p in processes)
+    total = (n_processes - failed) * n_threads * ops
+    return {"ops": total, "seconds": elapsed, "ops_per_sec": total / elapsed, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--processes", type=int, default=4, help="API worker processes sharing the shard files")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent logins per process")
+    parser.add_argument("--ops", type=int, default=100, help="logins per thread")
+    parser.add_argument("--users", type=int, default=256)
+    parser.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="FULL")
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes × {args.threads} threads × {args.ops} logins, {args.users} users, "
+          f"synchronous={args.synchronous}, {os.cpu_count()} CPUs")
+    print(f"{'shards':>6} {'ops':>7} {'seconds':>9} {'ops/sec':>10} {'scaling':>8} {'failed':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = None
+        for n_shards in args.shards:
+            r = bench(tmp, n_shards, args.users, args.processes, args.threads, args.ops, args.synchronous)
+            baseline = baseline or r["ops_per_sec"]
+            print(f"{n_shards:>6} {r['ops']:>7} {r['seconds']:>9.2f} {r['ops_per_sec']:>10.1f} "
+                  f"{r['ops_per_sec'] / baseline:>7.2f}× {r['failed']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+KeyAuth - SQLite write throughput benchmark
+Compares the default SQLite setup with production mode (WAL + single writer).
+
+Each worker thread simulates login traffic: read the user row, then insert an
+AuthLog. Run from the backend directory:
+
+    python -m benchmarks.bench_sqlite_writes --threads 16 --ops 200
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, configure_sqlite_engine
+from app.models import User, AuthLog
+from app.sqlite_writer import SQLiteWriter
+from app.config import settings
+
+
+def _seed(session_factory) -> str:
+    session = session_factory()
+    user = User(username="bench", name="Bench User", is_enrolled=True)
+    session.add(user)
+    session.commit()
+    user_id = user.id
+    session.close()
+    return user_id
+
+
+def _run_threads(n_threads: int, ops: int, op) -> dict:
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(ops):
+            try:
+                op()
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = n_threads * ops
+    return {"ops": total, "seconds": elapsed, "ops_per_sec": total / elapsed, "errors": errors[0]}
+
+
+def bench_default(path: str, n_threads: int, ops: int) -> dict:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autoflush=False, bind=engine)
+    user_id = _seed(Session)
+
+    def op():
+        session = Session()
+        try:
+            session.get(User, user_id)
+            session.add(AuthLog(user_id=user_id, confidence_score=0.9, result="accepted"))
+            session.commit()
+        finally:
+            session.close()
+
+    return _run_threads(n_threads, ops, op)
+
+
+def bench_production(path: str, n_threads: int, ops: int) -> dict:
+    url = f"sqlite:///{path}"
+    write_engine = create_engine(url, connect_args={"check_same_thread": False}, pool_size=1, max_overflow=0)
+    read_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=0,
+    )
+    configure_sqlite_engine(write_engine)
+    configure_sqlite_engine(read_engine, read_only=True)
+    Base.metadata.create_all(bind=write_engine)
+    WriteSession = sessionmaker(autoflush=False, expire_on_commit=False, bind=write_engine)
+    ReadSession = sessionmaker(autoflush=False, bind=read_engine)
+    user_id = _seed(WriteSession)
+    writer = SQLiteWriter(WriteSession, max_batch=settings.SQLITE_WRITE_BATCH_MAX)
+
+    def op():
+        session = ReadSession()
+        try:
+            session.get(User, user_id)
+        finally:
+            session.close()
+        writer.execute(lambda s: s.add(AuthLog(user_id=user_id, confidence_score=0.9, result="accepted")))
+
+    return _run_threads(n_threads, ops, op)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=200, help="operations per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "default": bench_default(os.path.join(tmp, "default.db"), args.threads, args.ops),
+            "production": bench_production(os.path.join(tmp, "production.db"), args.threads, args.ops),
+        }
+
+    print(f"{'mode':<12} {'ops':>7} {'seconds':>9} {'ops/sec':>10} {'errors':>7}")
+    for mode, r in results.items():
+        print(f"{mode:<12} {r['ops']:>7} {r['seconds']:>9.2f} {r['ops_per_sec']:>10.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+KeyAuth - Keystroke wire format benchmark
+Times request parsing plus feature extraction for each keystroke encoding.
+
+    python -m benchmarks.bench_wire_formats --keystrokes 2000
+"""
+import argparse
+import json
+import random
+import time
+from app.ml.feature_extractor import extract_features
+from app.ml.keystrokes import KeystrokeArrays, encode_packed
+from app.schemas import AuthRequest
+
+
+def _sample(n: int, seed: int = 0) -> KeystrokeArrays:
+    rng = random.Random(seed)
+    t, press, release = 0.0, [], []
+    for _ in range(n):
+        t += rng.gauss(120, 15)
+        press.append(t)
+        release.append(t + rng.gauss(85, 8))
+    keys = [rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(n)]
+    return KeystrokeArrays.from_columns(keys, press, release)
+
+
+def _time(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--keystrokes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    arrays = _sample(args.keystrokes)
+    records = arrays.to_records()
+    objects_json = json.dumps({"username": "bench", "keystrokes": records})
+    columns_json = json.dumps({
+        "username": "bench",
+        "columns": {
+            "keys": arrays.keys,
+            "press_times": arrays.press_times.tolist(),
+            "release_times": arrays.release_times.tolist(),
+        },
+    })
+    packed = encode_packed(arrays, {"username": "bench"})
+
+    cases = {
+        "json objects": (len(objects_json), lambda: extract_features(AuthRequest(**json.loads(objects_json)).arrays)),
+        "json columns": (len(columns_json), lambda: extract_features(AuthRequest(**json.loads(columns_json)).arrays)),
+        "packed binary": (len(packed), lambda: extract_features(AuthRequest.model_validate(packed).arrays)),
+    }
+
+    print(f"{args.keystrokes} keystrokes per request")
+    print(f"{'encoding':<14} {'bytes':>9} {'ms/request':>11}")
+    for name, (size, fn) in cases.items():
+        print(f"{name:<14} {size:>9} {_time(fn, args.repeat):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Shared fixtures: the app on a throwaway SQLite database, typing samples and
+an enrolled user. Settings are read at import, so the environment is set
+before anything from ``app`` is imported.
+"""
+import os
+import random
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="keyauth-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+import pytest
+from fastapi.testclient import TestClient
+from app.auth import create_access_token
+from app.config import settings
+from app.main import app
+
+PHRASE = "the quick brown fox jumps"
+
+
+def typing_sample(seed: int, phrase: str = PHRASE):
+    """Keystroke records of one typist: ~120 ms between presses, ~80 ms dwell."""
+    rng = random.Random(seed)
+    t, events = 0.0, []
+    for ch in phrase:
+        t += 120 + rng.gauss(0, 10)
+        events.append({"key": ch, "press_time": t, "release_time": t + 80 + rng.gauss(0, 5)})
+    return events
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def enrolled_user(client):
+    """A fully enrolled user (seeds 0..N-1 used for enrollment)."""
+    username = "enrolled"
+    response = client.post("/api/register", json={"username": username, "name": "E", "keystrokes": typing_sample(0)})
+    assert response.status_code == 201, response.text
+    for seed in range(1, settings.ENROLLMENT_SAMPLES_REQUIRED):
+        response = client.post("/api/enroll", json={"username": username, "keystrokes": typing_sample(seed)})
+        assert response.status_code == 200, response.text
+    assert response.json()["is_enrolled"]
+    return username
+
+
+@pytest.fixture
+def auth_headers(enrolled_user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': enrolled_user})}"}
@@ -0,0 +1,40 @@
+"""
+Auth-history figures cover the last 50 attempts, with compacted days making
+up for raw logs that are gone; all-time totals are reported separately.
+"""
+from datetime import date, datetime, timedelta, timezone
+from app.auth import create_access_token
+from app.database import SessionLocal
+from app.models import AuthLog, AuthLogDaily, User
+from conftest import typing_sample
+
+
+def test_auth_history_last_50(client):
+    response = client.post("/api/register", json={"username": "history", "name": "H", "keystrokes": typing_sample(40)})
+    assert response.status_code == 201, response.text
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        user_id = db.query(User.id).filter(User.username == "history").scalar()
+        # 40 raw attempts, all accepted at 0.9
+        db.add_all(
+            AuthLog(user_id=user_id, confidence_score=0.9, result="accepted", timestamp=now - timedelta(minutes=i))
+            for i in range(40)
+        )
+        # Compacted: 20 attempts yesterday (all rejected at 0.2), 100 earlier (all accepted)
+        db.add_all([
+            AuthLogDaily(user_id=user_id, day=date.today() - timedelta(days=1), device_type="web",
+                         attempts=20, accepted=0, confidence_sum=4.0),
+            AuthLogDaily(user_id=user_id, day=date.today() - timedelta(days=2), device_type="web",
+                         attempts=100, accepted=100, confidence_sum=90.0),
+        ])
+        db.commit()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'history'})}"}
+    body = client.get("/api/user/auth-history", headers=headers).json()
+    # Last 50 = 40 raw + 10 of yesterday's rejections
+    assert body["total_attempts"] == 50
+    assert body["success_rate"] == 80.0
+    assert body["avg_confidence"] == round((40 * 0.9 + 10 * 0.2) / 50 * 100, 1)
+    assert body["all_time_attempts"] == 160
+    assert body["all_time_success_rate"] == round(140 / 160 * 100, 1)
+    assert len(body["history"]) == 40
@@ -0,0 +1,37 @@
+"""
+Streamed feature accumulation must match extract_features on the same
+events, including missing (None or NaN) mobile values; the session window
+must ignore those values the same way.
+"""
+import math
+import pytest
+from app.ml.feature_extractor import extract_features
+from app.ml.keystrokes import KeystrokeArrays
+from app.ml.session import SlidingWindowFeatures
+from app.ml.streaming import KeystrokeAccumulator
+from conftest import typing_sample
+
+
+def _mobile_sample(seed):
+    records = typing_sample(seed)
+    for i, record in enumerate(records):
+        record["pressure"] = [0.4 + i / 100, None, math.nan][i % 3]
+        record["touch_size"] = [math.nan, 12.0 + i, None][i % 3]
+    return records
+
+
+@pytest.mark.parametrize("records", [typing_sample(21), _mobile_sample(22)])
+def test_accumulator_matches_extract_features(records):
+    acc = KeystrokeAccumulator(capacity=4)  # Forces buffer growth
+    for r in records:
+        acc.add(r["key"], r["press_time"], r["release_time"], r.get("pressure"), r.get("touch_size"))
+    expected = extract_features(KeystrokeArrays.from_records(records))["vector"]
+    assert acc.features()["vector"] == expected
+    assert all(math.isfinite(v) for v in acc.features()["vector"])
+
+
+def test_session_window_ignores_missing_mobile_values():
+    window = SlidingWindowFeatures(pane_size=10, panes=2)
+    for r in _mobile_sample(23):
+        window.add(r["press_time"], r["release_time"], r["pressure"], r["touch_size"])
+    assert all(math.isfinite(v) for v in window.vector())
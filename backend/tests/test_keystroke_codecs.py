@@ -0,0 +1,149 @@
+"""
+Keystroke encodings: records, parallel-array columns and packed binary all
+decode to the same KeystrokeArrays, and timings must be finite in each.
+"""
+import json
+import math
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from app.ml.keystrokes import BINARY_CONTENT_TYPE, KeystrokeArrays, decode_packed, encode_packed
+from app.schemas import AuthRequest
+from conftest import typing_sample
+
+
+def _columns(records, **overrides):
+    columns = {
+        "keys": [r["key"] for r in records],
+        "press_times": [r["press_time"] for r in records],
+        "release_times": [r["release_time"] for r in records],
+    }
+    columns.update(overrides)
+    return columns
+
+
+def _assert_same(a: KeystrokeArrays, b: KeystrokeArrays):
+    assert a.keys == b.keys
+    np.testing.assert_array_equal(a.press_times, b.press_times)
+    np.testing.assert_array_equal(a.release_times, b.release_times)
+    for name in ("pressure", "touch_size"):
+        x, y = getattr(a, name), getattr(b, name)
+        if x is None or y is None:
+            assert x is None and y is None
+        else:
+            np.testing.assert_array_equal(x, y)  # NaN == NaN here
+
+
+def test_records_round_trip():
+    records = typing_sample(1)
+    arrays = KeystrokeArrays.from_records(records)
+    _assert_same(KeystrokeArrays.from_records(arrays.to_records()), arrays)
+
+
+def test_columns_match_records():
+    records = typing_sample(2)
+    from_records = AuthRequest(username="u", keystrokes=records).arrays
+    from_columns = AuthRequest(username="u", columns=_columns(records)).arrays
+    np.testing.assert_array_equal(from_records.press_times, from_columns.press_times)
+    np.testing.assert_array_equal(from_records.release_times, from_columns.release_times)
+    assert from_records.keys == from_columns.keys
+
+
+def test_packed_round_trip():
+    records = typing_sample(3)
+    arrays = KeystrokeArrays.from_columns(
+        [r["key"] for r in records],
+        [r["press_time"] for r in records],
+        [r["release_time"] for r in records],
+        pressure=[0.5 if i % 2 else None for i in range(len(records))],  # None → NaN: no value
+    )
+    meta, decoded = decode_packed(encode_packed(arrays, {"username": "u", "device_type": "mobile"}))
+    assert meta == {"username": "u", "device_type": "mobile"}
+    _assert_same(decoded, arrays)
+
+
+def test_packed_body_validates_like_json():
+    records = typing_sample(4)
+    payload = encode_packed(KeystrokeArrays.from_records(records), {"username": "u"})
+    request = AuthRequest.model_validate(payload)
+    assert request.username == "u"
+    np.testing.assert_array_equal(request.arrays.press_times, [r["press_time"] for r in records])
+
+
+@pytest.mark.parametrize("column", ["press_times", "release_times"])
+@pytest.mark.parametrize("bad", [None, math.nan, math.inf])
+def test_columns_reject_non_finite_timings(column, bad):
+    records = typing_sample(5)
+    values = [r[column[:-1]] for r in records]
+    values[3] = bad
+    with pytest.raises(ValidationError):
+        AuthRequest(username="u", columns=_columns(records, **{column: values}))
+
+
+def test_columns_allow_missing_pressure():
+    records = typing_sample(6)
+    request = AuthRequest(username="u", columns=_columns(records, pressure=[None] * len(records)))
+    assert np.isnan(request.arrays.pressure).all()
+    with pytest.raises(ValidationError):
+        AuthRequest(username="u", columns=_columns(records, pressure=[math.inf] * len(records)))
+
+
+@pytest.mark.parametrize("field", ["pressure", "touch_size"])
+def test_records_allow_missing_pressure(field):
+    records = typing_sample(6)
+    records[0][field], records[1][field] = None, math.nan
+    AuthRequest.model_validate_json(json.dumps({"username": "u", "keystrokes": records}))
+    for bad in (math.inf, -math.inf):
+        records[2][field] = bad
+        with pytest.raises(ValidationError, match=field):
+            AuthRequest.model_validate_json(json.dumps({"username": "u", "keystrokes": records}))
+
+
+def test_records_reject_nan_literal():
+    records = typing_sample(7)
+    records[2]["press_time"] = math.nan
+    with pytest.raises(ValidationError):
+        AuthRequest.model_validate_json(json.dumps({"username": "u", "keystrokes": records}))
+
+
+@pytest.mark.parametrize("bad", [math.nan, math.inf, -math.inf])
+def test_packed_rejects_non_finite_timings(bad):
+    arrays = KeystrokeArrays.from_records(typing_sample(8))
+    arrays.release_times = arrays.release_times.copy()
+    arrays.release_times[0] = bad
+    with pytest.raises(ValueError, match="release_times"):
+        decode_packed(encode_packed(arrays, {"username": "u"}))
+
+
+def test_packed_rejects_truncated_payload():
+    payload = encode_packed(KeystrokeArrays.from_records(typing_sample(9)))
+    with pytest.raises(ValueError):
+        decode_packed(payload[:-8])
+    with pytest.raises(ValueError):
+        decode_packed(b"XXXX" + payload[4:])
+
+
+def test_non_finite_sample_does_not_block_enrollment(client):
+    """A rejected sample is never stored, so the user can still finish enrolling."""
+    username = "codec"
+    assert client.post("/api/register", json={"username": username, "name": "C", "keystrokes": typing_sample(10)}).status_code == 201
+
+    records = typing_sample(11)
+    press_times = [r["press_time"] for r in records]
+    press_times[4] = None
+    response = client.post("/api/enroll", json={"username": username, "columns": _columns(records, press_times=press_times)})
+    assert response.status_code == 422
+
+    arrays = KeystrokeArrays.from_records(typing_sample(12))
+    arrays.press_times = arrays.press_times.copy()
+    arrays.press_times[0] = math.inf
+    response = client.post(
+        "/api/enroll", content=encode_packed(arrays, {"username": username}),
+        headers={"Content-Type": BINARY_CONTENT_TYPE},
+    )
+    assert response.status_code == 422
+
+    for seed in range(13, 17):
+        response = client.post("/api/enroll", json={"username": username, "keystrokes": typing_sample(seed)})
+        assert response.status_code == 200, response.text
+    assert response.json()["is_enrolled"]
@@ -0,0 +1,52 @@
+"""
+Per-route SQL statement budgets (app.query_stats.max_queries). A failure
+lists the statements that ran, which is usually an N+1 or a lost eager load.
+"""
+from app.config import settings
+from app.query_stats import max_queries
+from conftest import typing_sample
+
+
+def test_register_and_enroll(client):
+    with max_queries(5):
+        response = client.post("/api/register", json={"username": "budget", "name": "B", "keystrokes": typing_sample(100)})
+    assert response.status_code == 201
+    for seed in range(101, 100 + settings.ENROLLMENT_SAMPLES_REQUIRED - 1):
+        with max_queries(5):
+            response = client.post("/api/enroll", json={"username": "budget", "keystrokes": typing_sample(seed)})
+        assert response.status_code == 200
+    with max_queries(6):  # The enrollment that trains the model
+        response = client.post("/api/enroll", json={"username": "budget", "keystrokes": typing_sample(199)})
+    assert response.json()["is_enrolled"]
+
+
+def test_enroll_batch(client):
+    samples = [{"keystrokes": typing_sample(200 + i)} for i in range(settings.ENROLLMENT_SAMPLES_REQUIRED)]
+    with max_queries(5):
+        response = client.post("/api/enroll/batch", json={"username": "batch", "name": "B", "samples": samples})
+    assert response.status_code == 200
+    assert response.json()["is_enrolled"]
+
+
+def test_authenticate(client, enrolled_user):
+    with max_queries(5):
+        response = client.post("/api/authenticate", json={"username": enrolled_user, "keystrokes": typing_sample(300)})
+    assert response.status_code == 200
+
+
+def test_profile(client, auth_headers):
+    with max_queries(5):
+        response = client.get("/api/user/profile", headers=auth_headers)
+    assert response.status_code == 200
+    with max_queries(2):
+        response = client.get("/api/user/profile", headers={**auth_headers, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+
+def test_auth_history(client, auth_headers):
+    with max_queries(6):
+        response = client.get("/api/user/auth-history", headers=auth_headers)
+    assert response.status_code == 200
+    with max_queries(2):
+        response = client.get("/api/user/auth-history", headers={**auth_headers, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
@@ -0,0 +1,18 @@
+"""
+WebSocket streams must not stay open on a silent client.
+"""
+from app.auth import create_access_token
+from app.config import settings
+
+
+def test_session_requires_start_in_time(client, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_IDLE_TIMEOUT_SECONDS", 0.05)
+    with client.websocket_connect("/ws/session") as ws:
+        assert ws.receive_json() == {"type": "error", "status": 408, "detail": "No message received in time"}
+
+
+def test_session_closes_when_idle(client, enrolled_user, monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_IDLE_TIMEOUT_SECONDS", 0.05)
+    with client.websocket_connect("/ws/session") as ws:
+        ws.send_json({"type": "start", "token": create_access_token({"sub": enrolled_user})})
+        assert ws.receive_json()["status"] == 408
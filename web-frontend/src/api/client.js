@@ -22,7 +22,9 @@ async function request(endpoint, options = {}) {
     const data = await response.json();
 
     if (!response.ok) {
-        throw new Error(data.detail || 'Something went wrong');
+        const error = new Error(data.detail || 'Something went wrong');
+        error.status = response.status;
+        throw error;
     }
 
     return data;
@@ -42,6 +44,18 @@ export const api = {
             body: JSON.stringify({ username, keystrokes, device_type: deviceType }),
         }),
 
+    // Several buffered samples in one call; `name` registers a new user
+    enrollBatch: (username, samples, { name, deviceType = 'web' } = {}) =>
+        request('/enroll/batch', {
+            method: 'POST',
+            body: JSON.stringify({
+                username,
+                name,
+                device_type: deviceType,
+                samples: samples.map((keystrokes) => ({ keystrokes })),
+            }),
+        }),
+
     getEnrollmentStatus: (username) =>
         request(`/enrollment-status/${username}`),
 
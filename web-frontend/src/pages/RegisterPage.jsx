@@ -13,7 +13,7 @@ export default function RegisterPage() {
     const [step, setStep] = useState(1); // 1 = profile, 2 = enrollment
     const [name, setName] = useState('');
     const [username, setUsername] = useState('');
-    const [sampleCount, setSampleCount] = useState(0);
+    const [samples, setSamples] = useState([]); // Buffered locally, sent in one batch
     const [samplesRequired] = useState(5);
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState('');
@@ -25,49 +25,80 @@ export default function RegisterPage() {
         handleKeyDown, handleKeyUp, reset, targetPhrase,
     } = useKeystrokeCapture();
 
-    const handleProfileSubmit = (e) => {
+    const handleProfileSubmit = async (e) => {
         e.preventDefault();
         if (!name.trim() || !username.trim()) {
             setError('Please fill in both fields');
             return;
         }
         setError('');
-        setStep(2);
-    };
-
-    const handleSubmitSample = async () => {
-        if (!isComplete || keystrokes.length < 5) return;
 
+        // Samples are only sent once all are typed, so check the username up front
         setLoading(true);
-        setError('');
-
         try {
-            let result;
-            if (sampleCount === 0) {
-                // First sample → register
-                result = await api.register(username.trim(), name.trim(), keystrokes);
+            await api.getEnrollmentStatus(username.trim());
+            setError(`Username '${username.trim()}' is already taken`);
+        } catch (err) {
+            if (err.status === 404) {
+                setStep(2); // Unknown username: free to register
+                if (samples.length >= samplesRequired) {
+                    await submitSamples(samples); // Back after a 409: resend the kept samples
+                }
             } else {
-                // Additional samples → enroll
-                result = await api.enroll(username.trim(), keystrokes);
+                setError(`Could not check the username (${err.message}). Please try again.`);
             }
+        } finally {
+            setLoading(false);
+        }
+    };
 
-            setSampleCount(result.samples_collected);
-            setSuccess(result.message);
+    const submitSamples = async (buffered) => {
+        setLoading(true);
+        setError('');
 
+        try {
+            // Register + all enrollment samples in one request
+            const result = await api.enrollBatch(username.trim(), buffered, { name: name.trim() });
+            setSuccess(result.message);
             if (result.is_enrolled) {
                 setEnrolled(true);
                 setTimeout(() => navigate('/login'), 3000);
-            } else {
-                reset();
-                setTimeout(() => setSuccess(''), 3000);
             }
         } catch (err) {
-            setError(err.message);
+            if (err.status === 409) {
+                // Username taken since step 1: choose another, the typed samples are kept
+                setStep(1);
+                setError(`${err.message}. Choose another username; your typed samples are kept.`);
+            } else {
+                setError(err.message);
+            }
         } finally {
             setLoading(false);
         }
     };
 
+    const handleSubmitSample = async () => {
+        if (loading) return;
+        if (samples.length >= samplesRequired) {
+            // Retry after a failed submission
+            await submitSamples(samples);
+            return;
+        }
+        if (!isComplete || keystrokes.length < 5) return;
+
+        const buffered = [...samples, keystrokes];
+        setSamples(buffered);
+        reset();
+        if (buffered.length >= samplesRequired) {
+            await submitSamples(buffered);
+        } else {
+            setSuccess(`Sample saved. ${samplesRequired - buffered.length} more sample(s) needed.`);
+            setTimeout(() => setSuccess(''), 3000);
+        }
+    };
+
+    const sampleCount = samples.length;
+    const canSubmit = isComplete || sampleCount >= samplesRequired;
     const progress = (sampleCount / samplesRequired) * 100;
 
     return (
@@ -143,8 +174,8 @@ export default function RegisterPage() {
                                 onChange={(e) => setUsername(e.target.value)}
                             />
                         </div>
-                        <button type="submit" className="btn btn-primary btn-full">
-                            Continue to Enrollment →
+                        <button type="submit" className="btn btn-primary btn-full" disabled={loading}>
+                            {loading ? '⏳ Checking...' : 'Continue to Enrollment →'}
                         </button>
                     </form>
                 )}
@@ -196,9 +227,11 @@ export default function RegisterPage() {
                         <button
                             className="btn btn-primary btn-full"
                             onClick={handleSubmitSample}
-                            disabled={!isComplete || loading}
+                            disabled={!canSubmit || loading}
                         >
-                            {loading ? '⏳ Processing...' : isComplete ? '✅ Submit Sample' : '⌨️ Keep Typing...'}
+                            {loading ? '⏳ Processing...'
+                                : sampleCount >= samplesRequired ? '🔁 Retry Submission'
+                                : isComplete ? '✅ Save Sample' : '⌨️ Keep Typing...'}
                         </button>
                     </div>
                 )}